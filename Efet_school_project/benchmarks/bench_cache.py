@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the cache backends of school_project/cache.py.
+For each backend (memory, sqlite, redis against resp_server.py), writes
+--keys entries with set_many, reads them back one by one and in batches
+of --batch with get_many, then starts --workers processes that read the
+same keys, as gunicorn workers would: a backend shared by the workers
+serves them all, the memory backend misses everything in the others.
+
+Usage: python bench_cache.py [--keys 5000] [--batch 50] [--workers 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+
+def make_cache(config):
+    from school_project.cache import Cache, make_backend
+    return Cache(make_backend(config), 'bench', default_ttl=600)
+
+def worker_hit_ratio(config, keys, queue):
+    cache = make_cache(config)
+    found = cache.get_many('bench', range(keys))
+    queue.put(len(found) / keys)
+
+def run(config, keys, batch, workers):
+    cache = make_cache(config)
+    cache.clear()
+    values = {key: {'id': key, 'name': f'user {key}', 'role': 'student'} for key in range(keys)}
+
+    start = time.perf_counter()
+    for offset in range(0, keys, batch):
+        cache.set_many('bench', {key: values[key] for key in range(offset, min(keys, offset + batch))})
+    set_rate = keys / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for key in range(keys):
+        cache.get_many('bench', [key])
+    single_rate = keys / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for offset in range(0, keys, batch):
+        cache.get_many('bench', range(offset, min(keys, offset + batch)))
+    bulk_rate = keys / (time.perf_counter() - start)
+
+    # fork: the memory backend is copied into the children, spawn starts them empty like gunicorn workers
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    pool = [context.Process(target=worker_hit_ratio, args=(config, keys, queue)) for _ in range(workers)]
+    for process in pool:
+        process.start()
+    ratios = [queue.get() for _ in pool]
+    for process in pool:
+        process.join()
+    return set_rate, single_rate, bulk_rate, cache.stats()['bench']['hit_ratio'], sum(ratios) / len(ratios)
+
+def main():
+    parser = argparse.ArgumentParser(description='Cache backend benchmark')
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    from resp_server import RESPServer
+    server = RESPServer().start()
+    workdir = tempfile.mkdtemp(prefix='bench_cache_')
+    base = {'CACHE_MAX_ENTRIES': args.keys * 2, 'CACHE_SQLITE_PATH': os.path.join(workdir, 'cache.sqlite'),
+            'CACHE_REDIS_URL': f'redis://127.0.0.1:{server.port}/0'}
+
+    print(f"{'backend':<8} {'set/s':>10} {'get/s':>10} {'bulk get/s':>11} {'hit ratio':>10} {'other workers':>14}")
+    try:
+        for backend in ('memory', 'sqlite', 'redis'):
+            set_rate, single_rate, bulk_rate, ratio, shared = run(dict(base, CACHE_BACKEND=backend),
+                                                                  args.keys, args.batch, args.workers)
+            print(f"{backend:<8} {set_rate:>10.0f} {single_rate:>10.0f} {bulk_rate:>11.0f} {ratio:>10.2f} {shared:>14.2f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
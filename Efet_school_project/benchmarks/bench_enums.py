@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Storage and query benchmark for the small-integer codes of enums.py.
+Generates a synthetic school (datagen.py) with the current schema, copies
+it into a second SQLite file where role, status, gender, payment
+status/type, justified and priority are text like before, then compares
+the size of the tables and indexes holding them and the role/status
+filters behind get_all_students, get_pending_users and the dashboards.
+
+Usage: python bench_enums.py [--scale 20] [--repeat 50]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+sys.path.insert(0, current_dir)
+
+# label, SQL, (model attribute, value) of each parameter
+QUERIES = [
+    ('students by role', 'SELECT id, name FROM "user" WHERE role = ?', [('User.role', 'student')]),
+    ('pending users', 'SELECT id, name FROM "user" WHERE status = ?', [('User.status', 'pending')]),
+    ('approved students', 'SELECT count(*) FROM "user" WHERE role = ? AND status = ?',
+     [('User.role', 'student'), ('User.status', 'approved')]),
+    ('teachers and admins', 'SELECT id FROM "user" WHERE role IN (?, ?)', [('User.role', 'teacher'), ('User.role', 'admin')]),
+    ('awaiting payments', 'SELECT count(*) FROM payment WHERE status = ?', [('Payment.status', 'awaiting')]),
+    ('unjustified absences', 'SELECT count(*) FROM absence WHERE justified = ?', [('Absence.justified', 'no')]),
+    ('urgent messages', 'SELECT count(*) FROM message WHERE priority = ?', [('Message.priority', 'urgent')]),
+]
+TABLES = ('user', 'payment', 'absence', 'message')
+
+
+def generate(path, scale):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    import datagen
+    from school_project import create_app, db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        datagen.generate(datagen.counts_for(scale))
+        db.session.remove()
+        db.engine.dispose()
+    return app
+
+def copy_as_text(app, path):
+    """Same rows and indexes, coded columns stored as text"""
+    from sqlalchemy import MetaData, String, create_engine, select
+    from school_project import db
+    from school_project.enums import Code
+
+    metadata = MetaData()
+    for table in db.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        for column in copy.columns:
+            if isinstance(column.type, Code):
+                column.type = String(1000)
+    engine = create_engine(f'sqlite:///{path}')
+    metadata.create_all(engine, checkfirst=False)
+    with app.app_context():
+        with db.engine.connect() as source, engine.begin() as target:
+            for table in db.metadata.sorted_tables:
+                rows = [dict(row._mapping) for row in source.execute(select(table))]  # decoded to words
+                if rows:
+                    target.execute(metadata.tables[table.name].insert(), rows)
+        db.engine.dispose()
+    engine.dispose()
+
+def sizes(path):
+    """{table or index: bytes} of the tables holding coded columns, None without dbstat"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = DELETE')  # datagen leaves the production profile's WAL behind
+        conn.execute('VACUUM')
+        rows = conn.execute('SELECT s.name, m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name '
+                            'GROUP BY s.name').fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return {name: size for name, table, size in rows if table in TABLES}
+
+def time_queries(paths, encoders, repeat):
+    """Median time of every query on each database, runs interleaved so that
+    both see the same machine noise"""
+    connections = [sqlite3.connect(path) for path in paths]
+    timings = [{} for _ in paths]
+    for label, sql, params in QUERIES:
+        values = [[encode(attribute, value) for attribute, value in params] for encode in encoders]
+        samples = [[] for _ in paths]
+        for _ in range(repeat):
+            for conn, value, sample in zip(connections, values, samples):
+                started = time.perf_counter()
+                conn.execute(sql, value).fetchall()
+                sample.append(time.perf_counter() - started)
+        for timing, sample in zip(timings, samples):
+            timing[label] = statistics.median(sample) * 1000
+    for conn in connections:
+        conn.close()
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Small-integer codes vs text benchmark')
+    parser.add_argument('--scale', type=float, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_enums_')
+    coded_path, text_path = os.path.join(workdir, 'coded.db'), os.path.join(workdir, 'text.db')
+    app = generate(coded_path, args.scale)
+    copy_as_text(app, text_path)
+
+    from school_project import models
+
+    def encode(attribute, value):
+        model, column = attribute.split('.')
+        return getattr(models, model).__table__.c[column].type.code(value)
+
+    coded_sizes, text_sizes = sizes(coded_path), sizes(text_path)
+    if coded_sizes is None:
+        print(f"file size: text {os.path.getsize(text_path):,} bytes, codes {os.path.getsize(coded_path):,} bytes "
+              "(SQLite built without dbstat, no per-table sizes)")
+    else:
+        print(f"{'table / index':<28} {'text':>12} {'codes':>12} {'saved':>7}")
+        for name in sorted(text_sizes):
+            before, after = text_sizes[name], coded_sizes.get(name, 0)
+            print(f"{name:<28} {before:>12,} {after:>12,} {1 - after / before:>6.0%}")
+        before, after = sum(text_sizes.values()), sum(coded_sizes.values())
+        print(f"{'total':<28} {before:>12,} {after:>12,} {1 - after / before:>6.0%}")
+    print()
+
+    text_times, coded_times = time_queries([text_path, coded_path], [lambda attribute, value: value, encode], args.repeat)
+    print(f"{'query (median)':<28} {'text':>9} {'codes':>9} {'speedup':>8}")
+    for label, _, _ in QUERIES:
+        print(f"{label:<28} {text_times[label]:>7.2f}ms {coded_times[label]:>7.2f}ms {text_times[label] / coded_times[label]:>7.2f}x")
+    print(f"\ndatabases kept in {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the email outbox.
+Enqueues emails in a scratch SQLite database and drains them through
+the dispatcher against the local SMTP sink, for several batch sizes.
+A batch size of 1 opens one SMTP connection per email, which is what
+inline delivery from the request handler would cost.
+
+Usage: python bench_outbox.py [--emails 500] [--delay 0.002]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+from smtp_sink import SMTPSink
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email outbox throughput benchmark')
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--delay', type=float, default=0.002, help='seconds the sink spends per message')
+    parser.add_argument('--batch-sizes', default='1,10,50,200')
+    args = parser.parse_args()
+
+    sink = SMTPSink(delay=args.delay).start()
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+    db_file.close()
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_file.name}'
+    os.environ['MAIL_SERVER'] = '127.0.0.1'
+    os.environ['MAIL_PORT'] = str(sink.port)
+
+    from school_project import create_app, db
+    from school_project.models import User, EmailLog
+    from school_project.outbox import OutboxDispatcher, enqueue_email
+
+    app = create_app()
+    print(f"{'batch size':>10} {'emails':>8} {'seconds':>9} {'emails/s':>10} {'connections':>12}")
+    with app.app_context():
+        db.create_all()
+        sender = User(email='bench-admin@efet.ma', name='Bench Admin', role='admin', status='approved')
+        db.session.add(sender)
+        db.session.flush()
+        recipients = [User(email=f'bench{i}@efet.ma', name=f'Bench {i}', role='student', status='approved') for i in range(50)]
+        db.session.add_all(recipients)
+        db.session.commit()
+
+        for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+            EmailLog.query.delete()
+            for i in range(args.emails):
+                enqueue_email(recipients[i % len(recipients)].id, sender.id, f'Bench {i}', 'Corps du message')
+            db.session.commit()
+
+            app.config['OUTBOX_BATCH_SIZE'] = batch_size
+            dispatcher = OutboxDispatcher(app)
+            connections_before = sink.connections
+            start = time.perf_counter()
+            while dispatcher.dispatch_batch():
+                pass
+            elapsed = time.perf_counter() - start
+
+            sent = EmailLog.query.filter_by(status='sent').count()
+            print(f"{batch_size:>10} {sent:>8} {elapsed:>9.2f} {sent / elapsed:>10.1f} {sink.connections - connections_before:>12}")
+
+    sink.shutdown()
+    os.unlink(db_file.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Burst benchmark for the signup pipeline.
+Starts --threads threads at once against a scratch SQLite database, each
+signing up --signups users, and every email is submitted twice by two
+different threads (double submissions at the start of term). Compares
+the former route body (SELECT on the email, then the user and its
+notification in two commits, USER_<timestamp> registration numbers) with
+registrations.register (INSERT ... ON CONFLICT, block-allocated
+numbers, one transaction).
+
+The password is hashed once beforehand: pbkdf2 costs the same in both
+pipelines and would otherwise hide the database work.
+
+Usage: python bench_signup.py [--threads 8] [--signups 100]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+
+def legacy_signup(email, name, password_hash):
+    """The signup route before registrations.register"""
+    from school_project import db
+    from school_project.models import AdminNotification, User
+    if User.query.filter_by(email=email).first():
+        return None
+    user = User(email=email, name=name, password=password_hash, role='visiteur', status='pending',
+                registration=f'USER_{datetime.now().strftime("%Y%m%d%H%M%S")}', major='Info',
+                register_date=datetime.now().date())
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(AdminNotification(user_id=user.id, notification_type='new_registration',
+                                     message=f"Nouvel utilisateur {name} ({email}) s'est inscrit et attend l'approbation."))
+    db.session.commit()
+    return user.id
+
+def pipeline_signup(email, name, password_hash):
+    from school_project import registrations
+    created = registrations.register(email, name, password_hash, major='Info')
+    return created[0] if created else None
+
+def run(app, signup, threads, signups, password_hash):
+    from school_project import db
+    outcomes = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        # thread i signs up emails i*n .. i*n+n-1, then the next thread's ones again
+        emails = [f'user{(index * signups + i)}@bench.local' for i in range(signups)]
+        emails += [f'user{((index + 1) % threads) * signups + i}@bench.local' for i in range(signups)]
+        with app.app_context():
+            barrier.wait()
+            for email in emails:
+                try:
+                    outcome = 'created' if signup(email, email.split('@')[0], password_hash) else 'refused'
+                except Exception:
+                    db.session.rollback()
+                    outcome = 'error'
+                with lock:
+                    outcomes[outcome] += 1
+            db.session.remove()
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start, outcomes
+
+def check(app):
+    """(reused registration numbers, users without notification)"""
+    from school_project import db
+    with app.app_context():
+        reused = db.session.execute(db.text(
+            'SELECT COALESCE(SUM(n - 1), 0) FROM (SELECT COUNT(*) AS n FROM "user" GROUP BY registration) r')).scalar()
+        lonely = db.session.execute(db.text(
+            'SELECT COUNT(*) FROM "user" u WHERE NOT EXISTS (SELECT 1 FROM admin_notification n WHERE n.user_id = u.id)')).scalar()
+    return reused, lonely
+
+def main():
+    parser = argparse.ArgumentParser(description='Signup burst benchmark')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--signups', type=int, default=100, help='new emails per thread, each sent twice')
+    args = parser.parse_args()
+
+    from werkzeug.security import generate_password_hash
+    password_hash = generate_password_hash('bench', method='pbkdf2:sha256')
+
+    print(f"{'pipeline':<10} {'attempts':>9} {'seconds':>8} {'signups/s':>10} {'created':>8} {'refused':>8} "
+          f"{'errors':>7} {'reused nb':>10} {'no notif':>9}")
+    for label, signup in (('legacy', legacy_signup), ('pipeline', pipeline_signup)):
+        workdir = tempfile.mkdtemp(prefix='bench_signup_')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'signup.db')}"
+        from school_project import create_app, db
+        from school_project.models import Major
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Major(major_name='Info', duration=2))
+            db.session.commit()
+            db.session.remove()
+
+        elapsed, outcomes = run(app, signup, args.threads, args.signups, password_hash)
+        reused, lonely = check(app)
+        attempts = sum(outcomes.values())
+        print(f"{label:<10} {attempts:>9} {elapsed:>8.2f} {outcomes['created'] / elapsed:>10.1f} {outcomes['created']:>8} "
+              f"{outcomes['refused']:>8} {outcomes['error']:>7} {reused:>10} {lonely:>9}")
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
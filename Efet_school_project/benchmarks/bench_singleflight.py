@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Stampede benchmark for singleflight.py.
+Builds a scratch SQLite database with datagen.py, then for each cache
+backend bumps the 'grades' stamp of refcache.py and releases --workers
+processes of --threads threads at once on a grade aggregate cached with
+@refcache.cached('grades'), as every dashboard does after a deploy or
+a grade change. Compares the loading of 048 (each caller missing the
+cache computes the aggregate) with singleflight.load (one computation
+for all of them, the others wait for it).
+
+Usage: python bench_singleflight.py [--scale 20] [--workers 4] [--threads 8] [--rounds 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+_computed = [0]
+_computed_lock = threading.Lock()
+
+
+def subject_report():
+    """Mean, best and worst grade of every subject: a whole-table aggregate"""
+    from school_project import db
+    with _computed_lock:
+        _computed[0] += 1
+    return db.session.execute(db.text(
+        'SELECT subject, AVG(grade), MAX(grade), MIN(grade), COUNT(*) FROM grade GROUP BY subject ORDER BY subject')).all()
+
+def uncoalesced_load(namespace_name, key, compute, ttl=None):
+    """The loading of 048: whoever misses the cache computes and stores"""
+    from school_project import cache
+    entries = cache.namespace(namespace_name)
+    value = entries.get(key)
+    if value is None:
+        value = compute()
+        entries.set(key, value, ttl)
+    return value
+
+def worker(mode, threads, barrier, queue):
+    from school_project import create_app, refcache, singleflight
+    from school_project.routing import read_only
+    if mode == 'uncoalesced':
+        singleflight.load = uncoalesced_load
+    report = read_only(refcache.cached('grades')(subject_report))
+    app = create_app()
+    latencies = []
+
+    def run():
+        from school_project import db
+        with app.app_context():
+            barrier.wait()
+            start = time.perf_counter()
+            report()
+            latencies.append(time.perf_counter() - start)
+            db.session.remove()
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put((_computed[0], latencies, singleflight.stats().get('refdata', {})))
+
+def run_round(mode, workers, threads):
+    from school_project import create_app, db, refcache
+    app = create_app()
+    with app.app_context():
+        refcache.invalidate('grades')  # every cached grade aggregate is cold
+        db.session.commit()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers * threads)
+    queue = context.Queue()
+    pool = [context.Process(target=worker, args=(mode, threads, barrier, queue)) for _ in range(workers)]
+    for process in pool:
+        process.start()
+    results = [queue.get() for _ in pool]
+    for process in pool:
+        process.join()
+    computed = sum(result[0] for result in results)
+    latencies = sorted(latency for result in results for latency in result[1])
+    flights = {}
+    for result in results:
+        for name, value in result[2].items():
+            flights[name] = flights.get(name, 0) + value
+    return computed, latencies, flights
+
+def main():
+    parser = argparse.ArgumentParser(description='Single-flight stampede benchmark')
+    parser.add_argument('--scale', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    from datagen import counts_for, generate
+    from resp_server import RESPServer
+
+    workdir = tempfile.mkdtemp(prefix='bench_singleflight_')
+    server = RESPServer().start()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['CACHE_SQLITE_PATH'] = os.path.join(workdir, 'cache.sqlite')
+    os.environ['CACHE_REDIS_URL'] = f'redis://127.0.0.1:{server.port}/0'
+    os.environ['JOBS_INPROCESS_THREADS'] = '0'
+    from school_project import create_app, db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        rows = generate(counts_for(args.scale))
+        db.engine.dispose()
+    print(f"{rows['grade']} grades, {args.workers} workers x {args.threads} threads, {args.rounds} rounds")
+
+    print(f"{'backend':<8} {'mode':<12} {'computed':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  flights")
+    try:
+        for backend in ('memory', 'sqlite', 'redis'):
+            os.environ['CACHE_BACKEND'] = backend
+            for mode in ('uncoalesced', 'singleflight'):
+                computed, latencies, flights = 0, [], {}
+                for _ in range(args.rounds):
+                    round_computed, round_latencies, round_flights = run_round(mode, args.workers, args.threads)
+                    computed += round_computed
+                    latencies += round_latencies
+                    for name, value in round_flights.items():
+                        flights[name] = flights.get(name, 0) + value
+                latencies.sort()
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                summary = ' '.join(f'{name}={value}' for name, value in flights.items() if value) or '-'
+                print(f"{backend:<8} {mode:<12} {computed / args.rounds:>9.1f} {statistics.median(latencies) * 1000:>8.1f} "
+                      f"{p95 * 1000:>8.1f} {latencies[-1] * 1000:>8.1f}  {summary}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
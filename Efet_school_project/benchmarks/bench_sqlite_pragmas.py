@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Concurrent-writer benchmark for the SQLite pragma profiles.
+Several processes (like gunicorn workers) insert grades and commit one
+row at a time while reader processes run the dashboard majors query,
+on a scratch database. For every profile it reports the committed
+writes per second and the number of "database is locked" errors.
+
+Usage: python bench_sqlite_pragmas.py [--writers 4] [--readers 2] [--seconds 5]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+# name -> (SQLITE_PRAGMA_PROFILE, SQLITE_PRAGMAS)
+PROFILES = {
+    'bare (no busy wait)': ('default', 'busy_timeout=0'),
+    'default': ('default', ''),
+    'production': ('production', ''),
+}
+
+
+def make_app(db_path, profile, overrides):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQLITE_PRAGMA_PROFILE'] = profile
+    os.environ['SQLITE_PRAGMAS'] = overrides
+    from school_project import create_app
+    return create_app()
+
+def worker(role, db_path, profile, overrides, seconds, results):
+    from sqlalchemy.exc import OperationalError
+    app = make_app(db_path, profile, overrides)
+    from school_project import db
+    from school_project.models import Grade
+    from school_project.tools import get_all_majors
+
+    done = locked = 0
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            try:
+                if role == 'writer':
+                    db.session.add(Grade(student_id=os.getpid() % 1000, grade=12.5, subject='Bench'))
+                    db.session.commit()
+                else:
+                    get_all_majors()
+                    db.session.rollback()
+                done += 1
+            except OperationalError as e:
+                db.session.rollback()
+                if 'locked' in str(e) or 'busy' in str(e):
+                    locked += 1
+                else:
+                    raise
+    results.put((role, done, locked))
+
+def run_profile(name, profile, overrides, args):
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+    db_file.close()
+    app = make_app(db_file.name, profile, overrides)
+    from school_project import db
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=('writer', db_file.name, profile, overrides, args.seconds, results))
+                 for _ in range(args.writers)]
+    processes += [context.Process(target=worker, args=('reader', db_file.name, profile, overrides, args.seconds, results))
+                  for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    totals = {'writer': [0, 0], 'reader': [0, 0]}
+    for _ in processes:
+        role, done, locked = results.get()
+        totals[role][0] += done
+        totals[role][1] += locked
+    for process in processes:
+        process.join()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file.name + suffix):
+            os.unlink(db_file.name + suffix)
+
+    writes, write_errors = totals['writer']
+    reads, read_errors = totals['reader']
+    print(f"{name:<22} {writes / args.seconds:>10.1f} {write_errors:>12} {reads / args.seconds:>10.1f} {read_errors:>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite pragma profile benchmark')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer and {args.readers} reader processes, {args.seconds:g}s per profile")
+    print(f"{'profile':<22} {'writes/s':>10} {'write locks':>12} {'reads/s':>10} {'read locks':>11}")
+    for name, (profile, overrides) in PROFILES.items():
+        run_profile(name, profile, overrides, args)
+
+
+if __name__ == '__main__':
+    main()
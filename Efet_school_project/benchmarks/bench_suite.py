@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark suite for the tools.py helpers and the main routes.
+For every scale it builds a scratch SQLite database with datagen.py,
+then times each helper directly and each route through the Flask test
+client (logged in as the admin, a teacher or a student). The listing
+helpers are also compared with the whole-User ORM queries they replaced
+(time and memory per 10k users; --scales 50 generates 10k students).
+Results are written as JSON so that two runs can be compared:
+
+    python bench_suite.py --output before.json
+    ... change something ...
+    python bench_suite.py --output after.json --compare before.json
+
+--compare prints the median ratio of every case and exits with status 1
+when one is slower than --tolerance times the baseline.
+
+Usage: python bench_suite.py [--scales 1,10,100] [--repeat 5] [--seed 42]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from inspect import unwrap
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+from datagen import BENCH_PASSWORD, counts_for, generate
+
+RESULTS_DIR = os.path.join(current_dir, 'results')
+
+
+def tool_cases(sample):
+    from school_project import tools
+    student_id = sample['student_id']
+    return {
+        'get_all_payments': lambda: tools.get_all_payments(student_id),
+        'get_student_infos': lambda: tools.get_student_infos(student_id),
+        'get_all_users': tools.get_all_users,
+        'get_all_students': tools.get_all_students,
+        'get_all_grades': lambda: tools.get_all_grades(student_id),
+        'get_all_majors': tools.get_all_majors,
+        'get_user_messages': lambda: tools.get_user_messages(student_id),
+        'get_student_absence': lambda: tools.get_student_absence(student_id),
+        'get_grades_mean': lambda: tools.get_grades_mean(student_id),
+        'get_all_subjects': tools.get_all_subjects,
+        'get_all_teachers': tools.get_all_teachers,
+        'get_all_absence': tools.get_all_absence,
+        'get_one_payment': lambda: tools.get_one_payment(sample['payment_id']),
+        'get_pending_users': tools.get_pending_users,
+        'get_admin_notifications': tools.get_admin_notifications,
+        'get_unread_notifications': tools.get_unread_notifications,
+        'get_unread_notifications_count': tools.get_unread_notifications_count,
+        'get_user_emails': lambda: tools.get_user_emails(student_id),
+        'get_users_data': lambda: tools.get_users_data(sample['student_ids'], ('id', 'name', 'major')),
+    }
+
+def projection_cases():
+    """name -> (whole User objects as before, column projection of tools.py)"""
+    from school_project import tools
+    from school_project.models import User
+    return {
+        'get_all_users': (lambda: User.query.all(), unwrap(tools.get_all_users)),
+        'get_all_students': (lambda: User.query.filter_by(role='student').all(), unwrap(tools.get_all_students)),
+        'get_all_teachers': (lambda: User.query.filter_by(role='teacher').all(), unwrap(tools.get_all_teachers)),
+        'get_pending_users': (lambda: User.query.filter_by(status='pending').all(), unwrap(tools.get_pending_users)),
+    }
+
+def measure_memory(function, cleanup):
+    """(rows, KiB allocated at the peak of the call, KiB still held by the result)"""
+    cleanup()
+    tracemalloc.start()
+    try:
+        result = function()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rows = len(result)
+    del result
+    cleanup()
+    return rows, peak / 1024, held / 1024
+
+def route_cases(sample):
+    student_id = sample['student_id']
+    ids = ','.join(str(user_id) for user_id in sample['student_ids'])
+    return {
+        'admin GET /dashboard': ('admin', '/dashboard'),
+        'admin GET /consultGrades': ('admin', f'/consultGrades/{student_id}'),
+        'admin GET /consultPayments': ('admin', f'/consultPayments/{student_id}'),
+        'admin GET /consultAbsence': ('admin', f'/consultAbsence/{student_id}'),
+        'admin GET /attendanceReport': ('admin', f"/attendanceReport/{sample['major_name']}?term=2024-S1"),
+        'admin GET /admin/notifications': ('admin', '/admin/notifications'),
+        'admin GET /search/users': ('admin', '/search/users?q=ami'),
+        'admin GET /get_students_data': ('admin', f'/get_students_data?ids={ids}&fields=id,name,major'),
+        'teacher GET /dashboard': ('teacher', '/dashboard'),
+        'student GET /dashboard': ('student', '/dashboard'),
+        'student GET /search/messages': ('student', '/search/messages?q=examen'),
+    }
+
+def measure(function, repeat, cleanup):
+    function()  # warm up (statement caches, search index creation)
+    cleanup()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+        cleanup()
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+def run_scale(scale, args):
+    db_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+    db_file.close()
+    os.unlink(db_file.name)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_file.name}'
+    from school_project import create_app, db
+    from school_project.models import User, Payment
+
+    counts = counts_for(scale)
+    app = create_app()
+    app.config['TESTING'] = True
+    result = {'counts': counts, 'tools': {}, 'routes': {}, 'projections': {}}
+    try:
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            result['rows'] = generate(counts, seed=args.seed)
+            result['generate_seconds'] = round(time.perf_counter() - started, 2)
+
+            student = User.query.filter_by(email='student0@bench.local').first()
+            sample = {
+                'student_id': student.id,
+                'payment_id': Payment.query.filter_by(student_id=student.id).first().id,
+                'major_name': student.major,
+                'student_ids': [user_id for (user_id,) in db.session.query(User.id).filter_by(role='student').order_by(User.id).limit(200)],
+            }
+            db.session.remove()
+            for name, function in tool_cases(sample).items():
+                result['tools'][name] = measure(function, args.repeat, db.session.remove)
+                print(f"  {scale:>5g}x  tools.{name:<38} {result['tools'][name]['median_ms']:>10.2f} ms")
+            for name, (full, projected) in projection_cases().items():
+                # the helpers are unwrapped: neither the cache nor the replica routing in the way
+                cases = {}
+                for label, function in (('orm', full), ('projection', projected)):
+                    rows, peak, held = measure_memory(function, db.session.remove)
+                    per_10k = 10000 / rows if rows else 0
+                    timing = measure(function, args.repeat, db.session.remove)
+                    cases[label] = {'rows': rows, 'median_ms_per_10k': round(timing['median_ms'] * per_10k, 2),
+                                    'peak_kib_per_10k': round(peak * per_10k), 'held_kib_per_10k': round(held * per_10k)}
+                result['projections'][name] = cases
+                orm, projection = cases['orm'], cases['projection']
+                print(f"  {scale:>5g}x  {name + ' per 10k rows':<44} {orm['median_ms_per_10k']:>8.1f} -> {projection['median_ms_per_10k']:>7.1f} ms"
+                      f"  peak {orm['peak_kib_per_10k']:>6} -> {projection['peak_kib_per_10k']:>6} KiB"
+                      f"  held {orm['held_kib_per_10k']:>6} -> {projection['held_kib_per_10k']:>6} KiB  ({orm['rows']} rows)")
+
+        clients = {}
+        for role, email in (('admin', 'admin@bench.local'), ('teacher', 'teacher0@bench.local'), ('student', 'student0@bench.local')):
+            clients[role] = app.test_client()
+            clients[role].post('/login', data={'email': email, 'password': BENCH_PASSWORD})
+        for name, (role, path) in route_cases(sample).items():
+            statuses = set()
+
+            def request():
+                response = clients[role].get(path)
+                statuses.add(response.status_code)
+
+            result['routes'][name] = measure(request, args.repeat, lambda: None)
+            result['routes'][name]['status'] = sorted(statuses)
+            print(f"  {scale:>5g}x  {name:<44} {result['routes'][name]['median_ms']:>10.2f} ms  {sorted(statuses)}")
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file.name + suffix):
+                os.unlink(db_file.name + suffix)
+    return result
+
+def environment():
+    import sqlalchemy
+    import sqlite3
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=current_dir,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
+
+def compare(results, baseline, tolerance):
+    """Print the median ratio of every case present in both runs, return the regressions"""
+    regressions = []
+    print(f"\n{'case':<60} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for scale, current in results['scales'].items():
+        previous = baseline.get('scales', {}).get(scale)
+        if not previous:
+            continue
+        for group in ('tools', 'routes'):
+            for name, timing in current[group].items():
+                before = previous.get(group, {}).get(name)
+                if not before:
+                    continue
+                ratio = timing['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+                # ignore sub-millisecond noise
+                slower = ratio > tolerance and timing['median_ms'] - before['median_ms'] > 1
+                if slower:
+                    regressions.append((scale, name, ratio))
+                print(f"{scale + 'x ' + name:<60} {before['median_ms']:>10.2f} {timing['median_ms']:>10.2f} {ratio:>6.2f}x{' !' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tools.py and routes benchmark suite')
+    parser.add_argument('--scales', default='1,10,100')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help=f'JSON results file (default: a timestamped file in {RESULTS_DIR})')
+    parser.add_argument('--compare', help='baseline JSON results file')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='median ratio above which a case is a regression')
+    args = parser.parse_args()
+
+    results = {'environment': environment(), 'seed': args.seed, 'repeat': args.repeat, 'scales': {}}
+    for scale in [float(value) for value in args.scales.split(',')]:
+        print(f"scale {scale:g}x: {counts_for(scale)}")
+        results['scales'][f'{scale:g}'] = run_scale(scale, args)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} cases slower than {args.tolerance}x the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data for the benchmarks.
+Fills the database of the current app with majors, subjects, teachers,
+students, grades, absences, payments and messages using bulk inserts.
+The same seed and counts always produce the same rows, so timings taken
+on different commits compare like with like.
+
+Every generated user has the password BENCH_PASSWORD; the accounts
+admin@bench.local, teacher0@bench.local and student0@bench.local are
+always present.
+
+Usage: python datagen.py --database /tmp/bench.sqlite [--scale 10] [--seed 42]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))  # Efet_school_project
+
+BENCH_PASSWORD = 'bench'
+START_DATE = date(2024, 9, 2)  # fixed so that the data does not depend on today
+
+# Counts at scale 1. Students, teachers and messages grow linearly with
+# the scale, majors and subjects (reference data) with its square root;
+# the rows per student stay the same.
+BASE_COUNTS = {
+    'majors': 6,
+    'subjects': 15,
+    'teachers': 10,
+    'students': 200,
+    'grades_per_student': 10,
+    'absences_per_student': 4,
+    'payments_per_student': 6,
+    'messages': 1000,
+}
+SQRT_SCALED = ('majors', 'subjects')
+
+FIRST_NAMES = ['Amine', 'Sara', 'Youssef', 'Salma', 'Omar', 'Imane', 'Mehdi', 'Nour', 'Hamza', 'Yasmine',
+               'Karim', 'Lina', 'Anas', 'Rania', 'Ilyas', 'Hiba', 'Ayoub', 'Kenza', 'Zakaria', 'Meryem']
+LAST_NAMES = ['Alaoui', 'Bennani', 'Chraibi', 'Idrissi', 'El Amrani', 'Tazi', 'Berrada', 'Fassi',
+              'Haddadi', 'Lahlou', 'Sqalli', 'Ouazzani', 'Kettani', 'Benjelloun', 'Naciri']
+MAJOR_NAMES = ['Informatique', 'Commerce', 'Finance', 'Logistique', 'Management', 'Santé']
+WORDS = ['cours', 'examen', 'absence', 'note', 'paiement', 'réunion', 'projet', 'devoir', 'stage',
+         'planning', 'salle', 'rattrapage', 'inscription', 'document', 'bulletin']
+BATCH = 5000
+
+
+def counts_for(scale, overrides=None):
+    counts = {}
+    for name, base in BASE_COUNTS.items():
+        if name.endswith('_per_student'):
+            factor = 1
+        else:
+            factor = math.sqrt(scale) if name in SQRT_SCALED else scale
+        counts[name] = max(1, int(round(base * factor)))
+    counts.update(overrides or {})
+    return counts
+
+def _insert(conn, table, rows):
+    # executemany takes its columns from the first row: every row gets every key,
+    # otherwise the keys missing from the first one would be dropped from all of them
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    rows = [{key: row.get(key) for key in keys} for row in rows]
+    for start in range(0, len(rows), BATCH):
+        conn.execute(table.insert(), rows[start:start + BATCH])
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def _school_day(rng, days=270):
+    day = START_DATE + timedelta(days=rng.randrange(days))
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+def generate(counts, seed=42):
+    """Insert the synthetic rows in the (empty) database of the current app
+    context, return the number of rows per table"""
+    from werkzeug.security import generate_password_hash
+    from school_project import db, majors, attendance
+    from school_project.models import User, Major, Subject, Grade, Absence, Payment, Message
+
+    rng = random.Random(seed)
+    # hashing once: pbkdf2 per user would dominate the generation time
+    password = generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256')
+    rows = {}
+
+    with db.engine.begin() as conn:
+        major_rows = []
+        for i in range(counts['majors']):
+            name = MAJOR_NAMES[i % len(MAJOR_NAMES)] + ('' if i < len(MAJOR_NAMES) else f' {i // len(MAJOR_NAMES) + 1}')
+            major_rows.append({'id': i + 1, 'major_name': name, 'duration': rng.choice([2, 3, 5]), 'student_count': 0})
+        _insert(conn, Major.__table__, major_rows)
+        rows['major'] = len(major_rows)
+
+        user_rows = [{'id': 1, 'email': 'admin@bench.local', 'password': password, 'name': 'Bench Admin',
+                      'role': 'admin', 'status': 'approved', 'register_date': START_DATE}]
+        teacher_ids = []
+        for i in range(counts['teachers']):
+            user_id = len(user_rows) + 1
+            teacher_ids.append(user_id)
+            user_rows.append({'id': user_id, 'email': f'teacher{i}@bench.local', 'password': password,
+                              'name': _name(rng), 'role': 'teacher', 'status': 'approved',
+                              'phone': f'06{rng.randrange(10**8):08d}', 'register_date': START_DATE})
+        student_ids = []
+        for i in range(counts['students']):
+            user_id = len(user_rows) + 1
+            student_ids.append(user_id)
+            major = rng.choice(major_rows)
+            user_rows.append({'id': user_id, 'email': f'student{i}@bench.local', 'password': password,
+                              'name': _name(rng), 'role': 'student',
+                              'status': 'approved' if rng.random() > 0.02 else 'pending',
+                              'age': rng.randint(18, 30), 'address': f'{rng.randint(1, 200)} rue {rng.choice(LAST_NAMES)}',
+                              'registration': f'EFET{i:06d}', 'gender': rng.choice(['male', 'female']),
+                              'phone': f'06{rng.randrange(10**8):08d}', 'major': major['major_name'],
+                              'major_id': major['id'], 'year': rng.randint(1, int(major['duration'])),
+                              'register_date': START_DATE - timedelta(days=rng.randrange(365 * 3))})
+        _insert(conn, User.__table__, user_rows)
+        rows['user'] = len(user_rows)
+        unlinked = conn.execute(db.select(db.func.count()).select_from(User.__table__).where(
+            User.__table__.c.role == 'student', User.__table__.c.major_id.is_(None))).scalar()
+        assert unlinked == 0, f'{unlinked} generated students have no major_id'
+
+        subject_rows = [{'id': i + 1, 'name': f"{rng.choice(WORDS).capitalize()} {i + 1}", 'id_prof': rng.choice(teacher_ids)}
+                        for i in range(counts['subjects'])]
+        _insert(conn, Subject.__table__, subject_rows)
+        rows['subject'] = len(subject_rows)
+
+        grade_rows, absence_rows, payment_rows = [], [], []
+        for student_id in student_ids:
+            for _ in range(counts['grades_per_student']):
+                grade_rows.append({'student_id': student_id, 'grade': round(rng.uniform(4, 20), 2),
+                                   'subject': rng.choice(subject_rows)['name'], 'grade_date': _school_day(rng)})
+            days = set()
+            for _ in range(counts['absences_per_student']):
+                days.add(_school_day(rng))
+            for day in sorted(days):
+                absence_rows.append({'student_id': student_id, 'date_absence': datetime.combine(day, datetime.min.time()),
+                                     'justified': 'yes' if rng.random() < 0.4 else 'no', 'details': rng.choice(WORDS)})
+            for month in range(counts['payments_per_student']):
+                month_paid = date(START_DATE.year + (START_DATE.month + month - 1) // 12, (START_DATE.month + month - 1) % 12 + 1, 1)
+                payment_rows.append({'student_id': student_id, 'month_paid': month_paid,
+                                     'payment_date': month_paid + timedelta(days=rng.randrange(10)),
+                                     'amount': 1500.0, 'status': 'paid' if rng.random() < 0.85 else 'awaiting',
+                                     'type': 'fees'})
+        _insert(conn, Grade.__table__, grade_rows)
+        _insert(conn, Absence.__table__, absence_rows)
+        _insert(conn, Payment.__table__, payment_rows)
+        rows['grade'], rows['absence'], rows['payment'] = len(grade_rows), len(absence_rows), len(payment_rows)
+
+        everyone = [1] + teacher_ids + student_ids
+        message_rows = []
+        for _ in range(counts['messages']):
+            sender, recipient = rng.sample(everyone, 2)
+            message_rows.append({'msg_from': sender, 'msg_to': recipient,
+                                 'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))),
+                                 'date_sent': datetime.combine(_school_day(rng), datetime.min.time()) + timedelta(minutes=rng.randrange(600)),
+                                 'priority': rng.choices(['normal', 'important', 'urgent'], [8, 1.5, 0.5])[0],
+                                 'is_read': rng.random() < 0.7})
+        _insert(conn, Message.__table__, message_rows)
+        rows['message'] = len(message_rows)
+
+        majors.refresh_student_counts(conn)
+
+    # PostgreSQL sequences do not move with explicit ids
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            for table in ('user', 'major', 'subject'):
+                conn.execute(db.text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT MAX(id) FROM \"{table}\"))"))
+
+    rows['attendance_bitmap'] = attendance.rebuild_all()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic data generator')
+    parser.add_argument('--database', required=True, help='SQLite file to create (must not exist)')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    for name in BASE_COUNTS:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name, help=f'override the {name} count')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    from school_project import create_app, db
+
+    counts = counts_for(args.scale, {name: getattr(args, name) for name in BASE_COUNTS if getattr(args, name) is not None})
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        rows = generate(counts, seed=args.seed)
+        elapsed = time.perf_counter() - started
+    for table, number in rows.items():
+        print(f"{table:<18} {number:>9}")
+    print(f"generated in {elapsed:.1f}s, password for every account: {BENCH_PASSWORD}")
+
+
+if __name__ == '__main__':
+    main()
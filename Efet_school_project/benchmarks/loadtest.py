@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Load test of the application served by gunicorn.
+Concurrent virtual users replay realistic sessions against a local
+server for a fixed time:
+
+  student  login, dashboard, grades, message search
+  teacher  login, dashboard, grade entry (POST /addGrade), grades
+  admin    login, dashboard (student listing), batch student data,
+           registrations waiting for approval
+  signup   a burst of new registrations (POST /signup)
+
+and the harness reports, per route, the p50/p95/p99 latency, the
+throughput and the error rate (connection errors, 5xx, or a response
+that is not the expected one, e.g. a login redirected back to /login).
+
+By default it generates a dataset with datagen.py and starts gunicorn
+once per --configs entry (workers x threads) so that the configurations
+can be compared on the same data; --url targets a server that is
+already running instead (it must have been seeded by datagen.py).
+
+Usage: python loadtest.py [--configs 1x8,2x4,4x2] [--users 20] [--duration 30] [--scale 1]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(current_dir)  # Efet_school_project
+sys.path.insert(0, project_dir)
+
+from datagen import BENCH_PASSWORD, counts_for, generate
+
+# share of the virtual users running each scenario
+MIX = {'student': 0.6, 'teacher': 0.2, 'admin': 0.1, 'signup': 0.1}
+THINK_TIME = (0.05, 0.3)  # seconds between two requests of a user
+_signup_ids = itertools.count()
+
+
+class Client:
+    """Keep-alive HTTP client with its own cookies (one per virtual user)"""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        body = urlencode(form) if form is not None else None
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # the server closed the keep-alive connection, retry once on a new one
+                self.close()
+                if attempt:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def redirects_to(fragment):
+    return lambda response: response.status in (301, 302, 303) and fragment in (response.getheader('Location') or '')
+
+def is_ok(response):
+    return response.status == 200
+
+def login_steps(email):
+    return [('POST /login', 'POST', '/login', {'email': email, 'password': BENCH_PASSWORD}, redirects_to('/profile'))]
+
+def scenario(kind, rng, sample):
+    """Requests of one session: (route label, method, path, form, check)"""
+    if kind == 'student':
+        student_id, email = rng.choice(sample['students'])
+        return login_steps(email) + [
+            ('GET /dashboard (student)', 'GET', '/dashboard', None, is_ok),
+            ('GET /consultGradesStudent', 'GET', f'/consultGradesStudent/{student_id}', None, is_ok),
+            ('GET /search/messages', 'GET', '/search/messages?q=' + rng.choice(['examen', 'cours', 'stage']), None, is_ok),
+            ('GET /dashboard (student)', 'GET', '/dashboard', None, is_ok),
+        ]
+    if kind == 'teacher':
+        student_id, _ = rng.choice(sample['students'])
+        steps = login_steps(rng.choice(sample['teachers'])) + [('GET /dashboard (teacher)', 'GET', '/dashboard', None, is_ok)]
+        for _ in range(3):
+            steps.append(('POST /addGrade', 'POST', '/addGrade', {
+                'user_id': student_id, 'grade': round(rng.uniform(4, 20), 2),
+                'subject': rng.choice(sample['subjects']), 'grade_date': '2025-01-15'}, redirects_to('consultGrades')))
+        steps.append(('GET /consultGrades', 'GET', f'/consultGrades/{student_id}', None, is_ok))
+        return steps
+    if kind == 'admin':
+        ids = ','.join(str(student_id) for student_id, _ in rng.sample(sample['students'], min(50, len(sample['students']))))
+        return login_steps(sample['admin']) + [
+            ('GET /dashboard (admin)', 'GET', '/dashboard', None, is_ok),
+            ('GET /get_students_data', 'GET', f'/get_students_data?ids={ids}&fields=id,name,major,year', None, is_ok),
+            ('GET /admin/notifications', 'GET', '/admin/notifications', None, is_ok),
+        ]
+    # signup burst: several registrations back to back, no think time
+    steps = []
+    for _ in range(5):
+        number = next(_signup_ids)
+        steps.append(('POST /signup', 'POST', '/signup', {
+            'email': f'load{os.getpid()}_{number}_{rng.randrange(10**9)}@bench.local',
+            'name': f'Load {number}', 'password': 'load-password', 'major': rng.choice(sample['majors'])},
+            redirects_to('/login')))
+    return steps
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds * 1000)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, duration):
+        rows = {}
+        every = []
+        for route, latencies in sorted(self.latencies.items()):
+            every.extend(latencies)
+            rows[route] = summarize(latencies, self.errors[route], duration)
+        rows['ALL'] = summarize(every, sum(self.errors.values()), duration)
+        return rows
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(latencies, errors, duration):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'error_rate': round(errors / len(ordered), 4) if ordered else 0.0,
+        'throughput_rps': round(len(ordered) / duration, 2),
+        'p50_ms': round(percentile(ordered, 0.50), 2),
+        'p95_ms': round(percentile(ordered, 0.95), 2),
+        'p99_ms': round(percentile(ordered, 0.99), 2),
+    }
+
+def virtual_user(number, base_url, sample, deadline, stats, seed):
+    rng = random.Random(seed * 100003 + number)
+    kinds, weights = zip(*MIX.items())
+    while time.monotonic() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        client = Client(base_url)
+        try:
+            for route, method, path, form, check in scenario(kind, rng, sample):
+                if time.monotonic() >= deadline:
+                    break
+                started = time.perf_counter()
+                try:
+                    ok = check(client.request(method, path, form))
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                    client.close()
+                stats.record(route, time.perf_counter() - started, ok)
+                if kind != 'signup':
+                    time.sleep(rng.uniform(*THINK_TIME))
+        finally:
+            client.close()
+
+def run_load(base_url, sample, args):
+    stats = Stats()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=virtual_user, args=(number, base_url, sample, deadline, stats, args.seed), daemon=True)
+               for number in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.report(time.monotonic() - started)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'the server exited with status {process.returncode}')
+        try:
+            if Client(base_url, timeout=2).request('GET', '/health').status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError('the server did not answer /health in time')
+
+def start_gunicorn(config, database_url, port, args):
+    workers, threads = config.split('x')
+    environment = dict(os.environ, DATABASE_URL=database_url, PYTHONUNBUFFERED='1')
+    command = [args.gunicorn, '--bind', f'127.0.0.1:{port}', '--timeout', '120',
+               '--workers', workers, '--threads', threads, '--preload', 'wsgi:app']
+    log = open(os.path.join(tempfile.gettempdir(), f'loadtest-gunicorn-{config}.log'), 'w')
+    return subprocess.Popen(command, cwd=project_dir, env=environment, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+def stop(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+def load_sample(database_url):
+    """Accounts and reference data of the generated dataset used by the scenarios"""
+    os.environ['DATABASE_URL'] = database_url
+    from school_project import create_app, db
+    from school_project.models import User, Major, Subject
+    app = create_app()
+    with app.app_context():
+        sample = {
+            'admin': 'admin@bench.local',
+            'students': [(user.id, user.email) for user in User.query.filter(User.role == 'student', User.status == 'approved',
+                                                                            User.email.like('student%@bench.local'))],
+            'teachers': [user.email for user in User.query.filter(User.role == 'teacher', User.email.like('teacher%@bench.local'))],
+            'majors': [major.major_name for major in Major.query.all()],
+            'subjects': [subject.name for subject in Subject.query.all()],
+        }
+        db.engine.dispose()
+    return sample
+
+def seed_database(path, args):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from school_project import create_app, db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        generate(counts_for(args.scale), seed=args.seed)
+        db.engine.dispose()
+
+def print_report(title, report):
+    print(f"\n{title}")
+    print(f"{'route':<30} {'requests':>9} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, row in report.items():
+        print(f"{route:<30} {row['requests']:>9} {row['throughput_rps']:>8.1f} {row['error_rate']:>6.1%} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Route-level load test')
+    parser.add_argument('--url', help='test a running server instead of starting gunicorn')
+    parser.add_argument('--database-url', help='database of the --url server, used to pick the test accounts')
+    parser.add_argument('--configs', default='1x8,2x4,4x2', help='gunicorn workers x threads to compare')
+    parser.add_argument('--gunicorn', default=shutil.which('gunicorn') or 'gunicorn')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per run')
+    parser.add_argument('--scale', type=float, default=1, help='dataset scale, see datagen.py')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the reports as JSON')
+    args = parser.parse_args()
+
+    results = {'users': args.users, 'duration': args.duration, 'scale': args.scale, 'runs': {}}
+    if args.url:
+        if not args.database_url:
+            parser.error('--url needs --database-url')
+        report = run_load(args.url.rstrip('/'), load_sample(args.database_url), args)
+        print_report(f"{args.url}, {args.users} users, {args.duration:g}s", report)
+        results['runs'][args.url] = report
+    else:
+        directory = tempfile.mkdtemp(prefix='loadtest-')
+        try:
+            template = os.path.join(directory, 'template.sqlite')
+            print(f"generating the {args.scale:g}x dataset...")
+            seed_database(template, args)
+            for config in args.configs.split(','):
+                # every configuration starts from the same data
+                path = os.path.join(directory, f'{config}.sqlite')
+                shutil.copyfile(template, path)
+                database_url = f'sqlite:///{path}'
+                sample = load_sample(database_url)
+                port = free_port()
+                process = start_gunicorn(config, database_url, port, args)
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    wait_until_up(base_url, process)
+                    report = run_load(base_url, sample, args)
+                finally:
+                    stop(process)
+                print_report(f"gunicorn {config} (workers x threads), {args.users} users, {args.duration:g}s", report)
+                results['runs'][config] = report
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        print(f"\n{'config':<10} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for config, report in results['runs'].items():
+            row = report['ALL']
+            print(f"{config:<10} {row['throughput_rps']:>8.1f} {row['error_rate']:>6.1%} "
+                  f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Local Redis-protocol server used as a stand-in for Redis.
+It speaks enough RESP2 for the redis backend of school_project/cache.py
+(PING, GET, MGET, SET with EX/PX/NX, DEL, EXISTS, SCAN MATCH/COUNT, DBSIZE,
+FLUSHDB, SELECT, AUTH), keeps the keys in memory with their expiry and
+can simulate network latency.
+
+Run standalone:  python resp_server.py --port 6380
+then start the app with CACHE_BACKEND=redis CACHE_REDIS_URL=redis://localhost:6380/0
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, value):
+        if value is None:
+            self.wfile.write(b'$-1\r\n')
+        elif isinstance(value, int):
+            self.wfile.write(b':%d\r\n' % value)
+        elif isinstance(value, bytes):
+            self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+        elif isinstance(value, list):
+            self.wfile.write(b'*%d\r\n' % len(value))
+            for item in value:
+                self.send(item)
+        elif isinstance(value, Exception):
+            self.wfile.write(f'-ERR {value}\r\n'.encode())
+        else:
+            self.wfile.write(f'+{value}\r\n'.encode())
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # inline command (redis-cli, telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        database = 0
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            if not command:
+                continue
+            if server.delay:
+                time.sleep(server.delay)
+            verb, args = command[0].upper().decode(), command[1:]
+            with server.lock:
+                server.commands += 1
+                if verb == 'SELECT':
+                    database = int(args[0])
+                    reply = 'OK'
+                else:
+                    reply = server.execute(database, verb, args)
+            self.send(reply)
+            if verb == 'QUIT':
+                return
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        super().__init__((host, port), RESPHandler)
+        self.delay = delay  # seconds spent per command, to mimic a remote server
+        self.databases = {}  # database -> {key: (value, expires at or None)}
+        self.connections = 0
+        self.commands = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def _get(self, keys, key):
+        entry = keys.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del keys[key]
+            return None
+        return entry[0] if entry else None
+
+    def execute(self, database, verb, args):
+        """Run one command, the caller holds the lock"""
+        keys = self.databases.setdefault(database, {})
+        if verb in ('PING', 'AUTH', 'QUIT'):
+            return 'PONG' if verb == 'PING' else 'OK'
+        if verb == 'GET':
+            return self._get(keys, args[0])
+        if verb == 'MGET':
+            return [self._get(keys, key) for key in args]
+        if verb == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            expires = None
+            if b'EX' in options:
+                expires = time.monotonic() + int(args[2 + options.index(b'EX') + 1])
+            if b'PX' in options:
+                expires = time.monotonic() + int(args[2 + options.index(b'PX') + 1]) / 1000
+            if b'NX' in options and self._get(keys, key) is not None:
+                return None
+            keys[key] = (value, expires)
+            return 'OK'
+        if verb == 'DEL':
+            return sum(keys.pop(key, None) is not None for key in args)
+        if verb == 'EXISTS':
+            return sum(self._get(keys, key) is not None for key in args)
+        if verb == 'SCAN':
+            # one pass returns everything, cursor 0 ends the iteration
+            options = [arg.upper() for arg in args[1:]]
+            pattern = args[1 + options.index(b'MATCH') + 1].decode() if b'MATCH' in options else '*'
+            names = [key for key in list(keys) if self._get(keys, key) is not None
+                     and fnmatch.fnmatchcase(key.decode(errors='replace'), pattern)]
+            return [b'0', names]
+        if verb == 'DBSIZE':
+            return sum(self._get(keys, key) is not None for key in list(keys))
+        if verb == 'FLUSHDB':
+            keys.clear()
+            return 'OK'
+        return ValueError(f"unknown command '{verb}'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Redis-protocol server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = RESPServer(args.host, args.port, delay=args.delay)
+    print(f"RESP server listening on {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nServed {server.commands} commands over {server.connections} connections")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Local SMTP sink used as a stand-in for a real mail server.
+It speaks enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT), keeps the received messages in memory and can simulate a
+slow server or refused recipients.
+
+Run standalone:  python smtp_sink.py --port 2525
+then start the app with MAIL_SERVER=localhost MAIL_PORT=2525
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        sink = self.server
+        sink.connections += 1
+        self.reply('220 efet-smtp-sink ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 efet-smtp-sink')
+            elif verb == 'MAIL':
+                sender, recipients = command, []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                if any(refused in command for refused in sink.refused):
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(command)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(line)
+                if sink.delay:
+                    time.sleep(sink.delay)
+                with sink.lock:
+                    sink.messages.append((sender, recipients, b''.join(data)))
+                self.reply('250 OK queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, refused=()):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.delay = delay  # seconds spent per message, to mimic a remote server
+        self.refused = tuple(refused)  # recipient substrings answered with 550
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SMTP sink')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, delay=args.delay)
+    print(f"SMTP sink listening on {args.host}:{sink.port}")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nReceived {len(sink.messages)} messages over {sink.connections} connections")
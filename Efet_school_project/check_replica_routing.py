@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Check the read-replica routing with two local SQLite files.
+The replica is a copy of the primary taken once, so rows written
+afterwards only exist on the primary: a helper that still sees them
+read from the primary, one that does not read from the replica.
+
+Usage: python check_replica_routing.py
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+work_dir = tempfile.mkdtemp()
+primary_path = os.path.join(work_dir, 'primary.sqlite')
+replica_path = os.path.join(work_dir, 'replica.sqlite')
+os.environ['DATABASE_URL'] = f'sqlite:///{primary_path}'
+os.environ['REPLICA_DATABASE_URL'] = f'sqlite:///{replica_path}'
+
+from werkzeug.security import generate_password_hash
+from school_project import create_app, db
+from school_project.models import User, Major
+from school_project.tools import get_all_majors
+
+app = create_app()
+failures = 0
+
+def check(label, condition):
+    global failures
+    print(f"{'OK  ' if condition else 'FAIL'} {label}")
+    failures += not condition
+
+with app.app_context():
+    db.create_all()
+    db.session.add(User(email='admin@replica.test', name='Admin', role='admin', status='approved',
+                        password=generate_password_hash('admin123', method='pbkdf2:sha256')))
+    db.session.add(Major(major_name='Informatique', duration=3))
+    db.session.commit()
+    db.session.remove()
+
+# "replicate" the primary, then write a row that never reaches the replica
+# (the backup API also copies what is still in the WAL file)
+with sqlite3.connect(primary_path) as source, sqlite3.connect(replica_path) as target:
+    source.backup(target)
+
+with app.app_context():
+    db.session.add(Major(major_name='Primary only', duration=2))
+    db.session.commit()
+    db.session.remove()
+
+    names = [major.major_name for major in get_all_majors()]
+    check('helper reads from the replica', names == ['Informatique'])
+    check('ORM queries outside helpers read from the primary', Major.query.count() == 2)
+    db.session.remove()
+
+    db.session.add(Major(major_name='Written in this session', duration=1))
+    db.session.commit()
+    names = [major.major_name for major in get_all_majors()]
+    check('reads stick to the primary after a commit in the same session', 'Written in this session' in names)
+    db.session.remove()
+
+    names = [major.major_name for major in get_all_majors()]
+    check('a new session goes back to the replica', 'Written in this session' not in names)
+    db.session.remove()
+
+# the user's Flask session stays on the primary right after a write
+with app.test_client() as client:
+    client.post('/login', data={'email': 'admin@replica.test', 'password': 'admin123'})
+    client.post('/addMajor', data={'major_name': 'Added by a POST', 'duration': 2})
+    page = client.get('/dashboard').get_data(as_text=True)
+    check('the page after a POST/redirect shows the new row', 'Added by a POST' in page)
+
+shutil.rmtree(work_dir)
+print("All checks passed" if not failures else f"{failures} check(s) failed")
+sys.exit(1 if failures else 0)
@@ -9,14 +9,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from school_project.routing import RoutingSession
+from school_project import majors # keeps user.major_id and major.student_count in sync
+from school_project import refcache # bumps the reference-data versions on writes
+
 ##################################################################### init SQLAlchemy so we can use it later in our models
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # the routing
+                  # session sends read-only helpers to the replica if any
 ####################################################################
 
 def create_app():
     app = Flask(__name__) # creates the Flask instance, __name__ is
                           # the name of the current Python module
     
+    # JSON logs written by a background thread, see logs.py
+    from school_project import logs
+    logs.init_app(app)
+    
     # Configuration for both development and production
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'secret-key-goes-here')
     
@@ -34,9 +43,62 @@ def create_app():
         db_path = os.path.join(instance_path, 'db.sqlite')
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     
+    # Server-Sent Events hold a connection per client: unset, they are only
+    # on under an async worker class (see events.py), otherwise clients poll
+    # /events/poll. EVENTS_MAX_STREAMS caps the open streams per process
+    sse_enabled = os.environ.get('EVENTS_SSE_ENABLED')
+    app.config['EVENTS_SSE_ENABLED'] = None if sse_enabled is None else sse_enabled.lower() in ('1', 'true', 'yes')
+    app.config['EVENTS_MAX_STREAMS'] = int(os.environ['EVENTS_MAX_STREAMS']) if os.environ.get('EVENTS_MAX_STREAMS') else None
+    
+    # Optional read replica (REPLICA_DATABASE_URL) for the helpers of tools.py
+    from school_project import routing
+    routing.configure(app)
+    
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
                    # deactivate Flask-SQLAlchemy track modifications
+    
+    # SQLite connection pragmas (WAL, busy timeout, ...), see sqlite_tuning.py
+    from school_project import sqlite_tuning
+    sqlite_tuning.configure(app)
+    
     db.init_app(app) # Initialiaze sqlite database
+    sqlite_tuning.init_app(app, db)
+    
+    # Email outbox: SMTP settings and the background dispatcher
+    from school_project import outbox
+    outbox.init_app(app)
+    
+    # Background jobs: in-process workers, scheduler and `flask jobs` CLI
+    from school_project import jobs
+    jobs.init_app(app)
+    
+    # Monthly dues generation (`flask dues generate`, scheduled in jobs.py)
+    from school_project import dues
+    dues.init_app(app)
+    
+    # Academic-year archival and TTL purge (`flask archive`, scheduled in jobs.py)
+    from school_project import archive
+    archive.init_app(app)
+    
+    # Orphan rows of databases created before the foreign keys (`flask integrity`)
+    from school_project import integrity
+    integrity.init_app(app)
+    
+    # Block-allocated sequences (registration numbers)
+    from school_project import sequences
+    sequences.init_app(app)
+    
+    # Application cache: memory, shared SQLite file or Redis (`flask cache`)
+    from school_project import cache
+    cache.init_app(app)
+    
+    # One computation per key across threads and workers for the cached aggregates
+    from school_project import singleflight
+    singleflight.init_app(app)
+    
+    # Ordered migrate_*.py scripts for existing databases (`flask migrate`)
+    from school_project import migrations
+    migrations.init_app(app)
     
     # The login manager contains the code that lets your application
     # and Flask-Login work together
@@ -54,8 +116,8 @@ def create_app():
         def load_user(user_id): #reload user object from the user ID
                                 #stored in the session
             # since the user_id is just the primary key of our user
-            # table, use it in the query for the user
-            return User.query.get(int(user_id))
+            # table, the user's columns are cached under it (see cache.py)
+            return cache.load_user(int(user_id))
     
     # blueprint for auth routes in our app
     # blueprint allow you to orgnize your flask app
@@ -0,0 +1,199 @@
+####################################################################
+###############      Academic-year archival       ##################
+####################################################################
+# grade, absence and message only ever grow. Rows of academic years
+# older than the last ARCHIVE_KEEP_YEARS ones are moved to grade_archive,
+# absence_archive and message_archive (see models.py) in chunks of
+# ARCHIVE_CHUNK_SIZE rows: each chunk is copied and deleted in its own
+# transaction, so a run can be interrupted at any point and resumed.
+# On PostgreSQL the archive tables are partitioned by academic year and
+# the partition of a year is created before its first row is moved.
+#
+# Admin notifications and email logs are not archived but purged once
+# older than NOTIFICATION_TTL_DAYS / EMAIL_LOG_TTL_DAYS (unread
+# notifications and emails still waiting in the outbox are kept).
+#
+# The consult routes read the archive too with ?archived=1.
+# Runs from the scheduler (see jobs.SCHEDULE) or with
+# `flask --app wsgi archive run|purge|stats`.
+import logging
+import os
+import re
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from sqlalchemy import func, literal
+
+from school_project import db, refcache
+from school_project.models import (Absence, AbsenceArchive, AdminNotification, EmailLog, Grade,
+                                   GradeArchive, Message, MessageArchive)
+
+logger = logging.getLogger(__name__)
+
+# source model, archive model, date column
+ARCHIVED = (
+    (Grade, GradeArchive, 'grade_date'),
+    (Absence, AbsenceArchive, 'date_absence'),
+    (Message, MessageArchive, 'date_sent'),
+)
+
+
+def configure(app):
+    app.config.setdefault('ARCHIVE_YEAR_START_MONTH', int(os.environ.get('ARCHIVE_YEAR_START_MONTH', 9)))
+    app.config.setdefault('ARCHIVE_KEEP_YEARS', int(os.environ.get('ARCHIVE_KEEP_YEARS', 2)))
+    app.config.setdefault('ARCHIVE_CHUNK_SIZE', int(os.environ.get('ARCHIVE_CHUNK_SIZE', 1000)))
+    app.config.setdefault('NOTIFICATION_TTL_DAYS', int(os.environ.get('NOTIFICATION_TTL_DAYS', 180)))
+    app.config.setdefault('EMAIL_LOG_TTL_DAYS', int(os.environ.get('EMAIL_LOG_TTL_DAYS', 365)))
+
+def requested():
+    """True when the current request asks for archived rows (?archived=1)"""
+    return request.args.get('archived', '').lower() in ('1', 'true', 'yes')
+
+####################################################################
+# Academic years are named after their two calendar years: '2024-2025'
+
+def academic_year_of(day):
+    first = day.year if day.month >= current_app.config['ARCHIVE_YEAR_START_MONTH'] else day.year - 1
+    return f'{first}-{first + 1}'
+
+def year_start(year):
+    return date(int(year[:4]), current_app.config['ARCHIVE_YEAR_START_MONTH'], 1)
+
+def shift_year(year, years):
+    first = int(year[:4]) + years
+    return f'{first}-{first + 1}'
+
+def cutoff_year(today=None):
+    """First academic year kept in the hot tables"""
+    return shift_year(academic_year_of(today or date.today()), 1 - current_app.config['ARCHIVE_KEEP_YEARS'])
+
+####################################################################
+
+def ensure_partition(archive, year):
+    """Create the partition of `year` of an archive table (PostgreSQL only)"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    table = archive.__tablename__
+    db.session.execute(db.text(
+        f"CREATE TABLE IF NOT EXISTS {table}_{year.replace('-', '_')} PARTITION OF {table} FOR VALUES IN ('{year}')"))
+
+def _bounds(column, year):
+    start, end = year_start(year), year_start(shift_year(year, 1))
+    if isinstance(column.type, db.DateTime):
+        return datetime.combine(start, time()), datetime.combine(end, time())
+    return start, end
+
+def move_rows(source, archive, date_field, before, chunk_size):
+    """Move the rows of `source` dated before the academic year `before` to
+    `archive`, one committed chunk at a time. Returns the number of rows moved."""
+    column = getattr(source, date_field)
+    oldest = db.session.query(func.min(column)).filter(column < _bounds(column, before)[0]).scalar()
+    if oldest is None:
+        return 0
+
+    # columns missing from an old database are left to their defaults
+    existing = {c['name'] for c in db.inspect(db.engine).get_columns(source.__tablename__)}
+    fields = [c.name for c in source.__table__.columns if c.name in existing and c.name in archive.__table__.c]
+    source_table, archive_table = source.__table__, archive.__table__
+
+    moved = 0
+    year = academic_year_of(oldest)
+    while year < before:
+        ensure_partition(archive, year)
+        start, end = _bounds(column, year)
+        while True:
+            ids = [row.id for row in db.session.query(source.id)
+                   .filter(column >= start, column < end).order_by(source.id).limit(chunk_size)]
+            if not ids:
+                break
+            rows = db.select(*[source_table.c[f] for f in fields], literal(year), literal(datetime.now(), db.DateTime)) \
+                .where(source_table.c.id.in_(ids))
+            db.session.execute(archive_table.insert().from_select(fields + ['academic_year', 'archived_at'], rows))
+            db.session.execute(source_table.delete().where(source_table.c.id.in_(ids)))
+            refcache.invalidate_table(source_table.name)
+            db.session.commit()
+            moved += len(ids)
+        db.session.commit()
+        year = shift_year(year, 1)
+    return moved
+
+def archive_before(before=None, chunk_size=None):
+    """Archive grades, absences and messages of the academic years before `before`
+    (default: cutoff_year()), return {table: rows moved}"""
+    before = before or cutoff_year()
+    chunk_size = chunk_size or current_app.config['ARCHIVE_CHUNK_SIZE']
+    moved = {}
+    for source, archive, date_field in ARCHIVED:
+        moved[source.__tablename__] = move_rows(source, archive, date_field, before, chunk_size)
+    logger.info("Archived rows before %s", before, extra={'moved': moved})
+    return moved
+
+def _purge(model, condition, chunk_size):
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(model.id).filter(condition).order_by(model.id).limit(chunk_size)]
+        if not ids:
+            return deleted
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        refcache.invalidate_table(model.__tablename__)
+        db.session.commit()
+        deleted += len(ids)
+
+def purge_expired(chunk_size=None):
+    """Delete read notifications and delivered/failed email logs past their TTL"""
+    config = current_app.config
+    chunk_size = chunk_size or config['ARCHIVE_CHUNK_SIZE']
+    now = datetime.now()
+    purged = {
+        'admin_notification': _purge(AdminNotification, db.and_(
+            AdminNotification.is_read.is_(True),
+            AdminNotification.created_at < now - timedelta(days=config['NOTIFICATION_TTL_DAYS'])), chunk_size),
+        'email_log': _purge(EmailLog, db.and_(
+            EmailLog.status.in_(('sent', 'failed')),
+            EmailLog.sent_at < now - timedelta(days=config['EMAIL_LOG_TTL_DAYS'])), chunk_size),
+    }
+    logger.info("Purged expired rows", extra={'purged': purged})
+    return purged
+
+def table_sizes():
+    """Row counts of the hot and archive tables"""
+    sizes = {}
+    for source, archive, _ in ARCHIVED:
+        sizes[source.__tablename__] = db.session.query(func.count(source.id)).scalar()
+        sizes[archive.__tablename__] = db.session.query(func.count(archive.id)).scalar()
+    for model in (AdminNotification, EmailLog):
+        sizes[model.__tablename__] = db.session.query(func.count(model.id)).scalar()
+    return sizes
+
+####################################################################
+
+archive_cli = AppGroup('archive', help='Academic-year archival')
+
+@archive_cli.command('run')
+@click.option('--before', help='First academic year to keep, e.g. 2024-2025 (default from ARCHIVE_KEEP_YEARS)')
+@click.option('--chunk-size', type=int)
+def run_command(before, chunk_size):
+    """Move grades, absences and messages of past academic years to the archive tables"""
+    if before and not (re.fullmatch(r'\d{4}-\d{4}', before) and shift_year(before, 0) == before):
+        raise click.BadParameter('expected an academic year like 2024-2025', param_hint='--before')
+    for table, moved in archive_before(before, chunk_size).items():
+        click.echo(f'{table:<20} {moved} rows archived')
+
+@archive_cli.command('purge')
+def purge_command():
+    """Delete notifications and email logs past their TTL"""
+    for table, deleted in purge_expired().items():
+        click.echo(f'{table:<20} {deleted} rows purged')
+
+@archive_cli.command('stats')
+def stats_command():
+    """Print the size of the hot and archive tables"""
+    click.echo(f'first academic year kept: {cutoff_year()}')
+    for table, count in table_sizes().items():
+        click.echo(f'{table:<20} {count}')
+
+def init_app(app):
+    configure(app)
+    app.cli.add_command(archive_cli)
@@ -0,0 +1,286 @@
+####################################################################
+#############     Compact attendance (bitmaps)     #################
+####################################################################
+# Every student has one AttendanceBitmap row per term. Bit n of a
+# bitmap is set when the student was absent on day n of the term, so
+# rates, streaks and alerts for a whole major come from popcounts and
+# shifts on a handful of integers instead of scanning the absence table.
+# The absence table stays the source of truth: the bitmaps are rebuilt
+# for the touched day every time addAbsence/editAbsence/deleteAbsence run.
+#
+# roll_call() records the attendance of a whole major for one session
+# (a date and start time): the batch is validated first, then the
+# absences of the session are replaced with one bulk INSERT and the
+# bitmaps of the day refreshed, all in one transaction. Sending the
+# same roll call twice leaves the same rows behind.
+from datetime import date, datetime, timedelta
+from school_project import db
+from school_project.models import Absence, AbsenceArchive, AttendanceBitmap, Major, User
+from school_project.enums import Justified
+
+
+def term_of(day):
+    """Return (term key, first day, last day) of the term containing day"""
+    if isinstance(day, datetime):
+        day = day.date()
+    year = day.year if day.month >= 9 else day.year - 1  # academic year starts in September
+    if day.month >= 9 or day.month == 1:
+        return f'{year}-S1', date(year, 9, 1), date(year + 1, 1, 31)
+    return f'{year}-S2', date(year + 1, 2, 1), date(year + 1, 8, 31)
+
+def term_bounds(term):
+    """Return (first day, last day) of a term key such as 2024-S1"""
+    year, _, half = term.partition('-')
+    if not year.isdigit() or half not in ('S1', 'S2'):
+        raise ValueError(f'Invalid term: {term}')
+    year = int(year)
+    if half == 'S1':
+        return date(year, 9, 1), date(year + 1, 1, 31)
+    return date(year + 1, 2, 1), date(year + 1, 8, 31)
+
+def to_int(bitmap):
+    return int.from_bytes(bitmap or b'', 'little')
+
+def to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+def school_days_mask(term, until=None):
+    """Bitmap of the Monday-Friday days of the term, up to `until` included"""
+    start, end = term_bounds(term)
+    if until is not None:
+        end = min(end, until)
+    mask = 0
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            mask |= 1 << (day - start).days
+        day += timedelta(days=1)
+    return mask
+
+def compress(bits, mask):
+    """Keep the bits of `bits` at the positions set in `mask`, packed together:
+    with a school_days_mask, Friday and the next Monday become neighbours"""
+    packed = position = 0
+    while mask:
+        shift = (mask & -mask).bit_length() - 1
+        shifted = mask >> shift
+        run = (~shifted & (shifted + 1)).bit_length() - 1  # consecutive days of the mask from shift on
+        packed |= ((bits >> shift) & ((1 << run) - 1)) << position
+        position += run
+        mask &= ~(((1 << run) - 1) << shift)
+    return packed
+
+def longest_streak(bits):
+    """Length of the longest run of consecutive set bits"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+def current_streak(bits, day_index):
+    """Number of consecutive set bits ending at day_index"""
+    if day_index < 0:
+        return 0
+    inverted = (~bits) & ((1 << (day_index + 1)) - 1)
+    if inverted == 0:
+        return day_index + 1
+    # the highest clear bit at or below day_index ends the streak
+    return day_index - inverted.bit_length() + 1
+
+####################################################################
+
+def refresh_day(student_id, day):
+    """Recompute the bits of one student for one day from the absence rows.
+    Must be called inside the caller's transaction, the caller commits."""
+    refresh_days([student_id], day)
+
+def refresh_days(student_ids, day):
+    """refresh_day for several students at once: one query for their
+    absences of the day, one for their bitmaps of the term"""
+    if isinstance(day, datetime):
+        day = day.date()
+    student_ids = {int(student_id) for student_id in student_ids if student_id not in (None, '')}
+    if not student_ids:
+        return
+    term, start, _ = term_of(day)
+    bit = 1 << (day - start).days
+
+    day_start = datetime.combine(day, datetime.min.time())
+    flags = {}  # student id -> [justified, unjustified]
+    for student_id, justified in db.session.query(Absence.student_id, Absence.justified).filter(
+        Absence.student_id.in_(student_ids),
+        Absence.date_absence >= day_start,
+        Absence.date_absence < day_start + timedelta(days=1),
+    ):
+        entry = flags.setdefault(student_id, [False, False])
+        entry[0 if justified == 'yes' else 1] = True
+
+    bitmaps = {bitmap.student_id: bitmap for bitmap in AttendanceBitmap.query.filter(
+        AttendanceBitmap.student_id.in_(student_ids), AttendanceBitmap.term == term)}
+    for student_id in student_ids:
+        is_justified, is_unjustified = flags.get(student_id, (False, False))
+        bitmap = bitmaps.get(student_id)
+        if bitmap is None:
+            if student_id not in flags:
+                continue
+            bitmap = AttendanceBitmap(student_id=student_id, term=term, justified=b'', unjustified=b'')
+            db.session.add(bitmap)
+
+        justified = to_int(bitmap.justified)
+        unjustified = to_int(bitmap.unjustified)
+        justified = justified | bit if is_justified else justified & ~bit
+        unjustified = unjustified | bit if is_unjustified else unjustified & ~bit
+        bitmap.justified = to_bytes(justified)
+        bitmap.unjustified = to_bytes(unjustified)
+
+def rebuild_all():
+    """Rebuild every bitmap from the absence table and its archive (initial backfill)"""
+    bitmaps = {}
+    rows = db.session.query(Absence.student_id, Absence.date_absence, Absence.justified).union_all(
+        db.session.query(AbsenceArchive.student_id, AbsenceArchive.date_absence, AbsenceArchive.justified))
+    for student_id, date_absence, justified in rows:
+        if student_id is None or date_absence is None:
+            continue
+        term, start, _ = term_of(date_absence)
+        bits = bitmaps.setdefault((int(student_id), term), [0, 0])
+        bit = 1 << (date_absence.date() - start).days
+        if justified == 'yes':
+            bits[0] |= bit
+        else:
+            bits[1] |= bit
+
+    AttendanceBitmap.query.delete()
+    db.session.bulk_insert_mappings(AttendanceBitmap, [
+        {'student_id': student_id, 'term': term, 'justified': to_bytes(j), 'unjustified': to_bytes(u)}
+        for (student_id, term), (j, u) in bitmaps.items()
+    ])
+    db.session.commit()
+    return len(bitmaps)
+
+####################################################################
+
+SESSION_FORMAT = '%Y-%m-%dT%H:%M'  # same as the datetime-local inputs of addAbsence
+
+class RollCallError(ValueError):
+    """The batch was refused as a whole, `errors` lists every problem"""
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def roster(major_name):
+    """[(id, name)] of the students of a major, by name"""
+    return db.session.query(User.id, User.name) \
+        .filter(User.role == 'student', User.major == major_name) \
+        .order_by(User.name, User.id).all()
+
+def session_absences(major_name, session):
+    """{student id: Absence} recorded for a major at one session"""
+    students = db.session.query(User.id).filter(User.role == 'student', User.major == major_name)
+    return {absence.student_id: absence for absence in Absence.query.filter(
+        Absence.student_id.in_(students.scalar_subquery()), Absence.date_absence == session)}
+
+def parse_roll_call(major_name, session, entries):
+    """Check a whole roll call before anything is written. `entries` is a
+    list of {'student_id', 'justified', 'details'} for the absent students.
+    Returns (session datetime, absence rows, roster ids)."""
+    errors = []
+    if not major_name or Major.query.filter_by(major_name=major_name).first() is None:
+        errors.append(f'Unknown major: {major_name}')
+    if isinstance(session, str):
+        try:
+            session = datetime.strptime(session, SESSION_FORMAT)
+        except ValueError:
+            errors.append(f'Invalid session: {session}')
+    elif not isinstance(session, datetime):
+        errors.append('Missing session')
+    if errors:
+        raise RollCallError(errors)
+
+    students = {student_id for student_id, _ in roster(major_name)}
+    rows, seen = [], set()
+    for entry in entries:
+        try:
+            student_id = int(entry.get('student_id'))
+        except (AttributeError, TypeError, ValueError):
+            errors.append(f'Invalid student id: {entry!r}')
+            continue
+        justified = (entry.get('justified') or 'no').strip().lower()
+        if student_id not in students:
+            errors.append(f'Student {student_id} is not in {major_name}')
+        elif student_id in seen:
+            errors.append(f'Student {student_id} is listed twice')
+        elif justified not in Justified.__members__:
+            errors.append(f'Invalid justified value for student {student_id}: {justified}')
+        else:
+            seen.add(student_id)
+            rows.append({'student_id': student_id, 'date_absence': session, 'justified': justified,
+                         'details': (entry.get('details') or '').strip() or None})
+    if errors:
+        raise RollCallError(errors)
+    return session, rows, students
+
+def roll_call(major_name, session, entries):
+    """Replace the absences of a major for one session with `entries`, in
+    one transaction. Returns {'session', 'students', 'absent', 'removed'}."""
+    session, rows, students = parse_roll_call(major_name, session, entries)
+    try:
+        # two teachers sending the same roll call at once queue on the major row (no-op on SQLite, writes are serialized)
+        db.session.query(Major.id).filter_by(major_name=major_name).with_for_update().first()
+        removed = db.session.execute(db.delete(Absence).where(
+            Absence.student_id.in_(students), Absence.date_absence == session)).rowcount if students else 0
+        if rows:
+            db.session.execute(db.insert(Absence), rows)  # a single multi-row INSERT
+        refresh_days(students, session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'session': session.strftime(SESSION_FORMAT), 'students': len(students),
+            'absent': len(rows), 'removed': removed}
+
+####################################################################
+
+def major_report(major_name, term=None, threshold=0.2, as_of=None):
+    """Absence rate, streaks and alerts of every student of a major for a term"""
+    as_of = as_of or date.today()
+    if term is None:
+        term = term_of(as_of)[0]
+    school_days = school_days_mask(term, until=as_of)
+    nb_school_days = school_days.bit_count() or 1
+    # streaks count school days: weekends and days after as_of are dropped first
+    today_index = school_days.bit_count() - 1
+
+    rows = db.session.query(User.id, User.name, AttendanceBitmap.justified, AttendanceBitmap.unjustified) \
+        .outerjoin(AttendanceBitmap, db.and_(AttendanceBitmap.student_id == User.id, AttendanceBitmap.term == term)) \
+        .filter(User.role == 'student', User.major == major_name) \
+        .all()
+
+    students = []
+    for student_id, name, justified, unjustified in rows:
+        justified = to_int(justified)
+        unjustified = to_int(unjustified)
+        absent = justified | unjustified
+        rate = (absent & school_days).bit_count() / nb_school_days
+        school_absent = compress(absent, school_days)
+        students.append({
+            'student_id': student_id,
+            'name': name,
+            'days_absent': absent.bit_count(),
+            'days_justified': justified.bit_count(),
+            'days_unjustified': (unjustified & ~justified).bit_count(),
+            'rate': round(rate, 4),
+            'longest_streak': longest_streak(school_absent),
+            'current_streak': current_streak(school_absent, today_index),
+            'alert': rate >= threshold,
+        })
+    students.sort(key=lambda s: s['rate'], reverse=True)
+
+    return {
+        'major': major_name,
+        'term': term,
+        'school_days': nb_school_days,
+        'threshold': threshold,
+        'students': students,
+        'alerts': [s['student_id'] for s in students if s['alert']],
+    }
@@ -5,6 +5,9 @@ from flask import Blueprint, render_template, redirect, url_for, request, flash,
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 ####################################################################
@@ -25,9 +28,9 @@ def signup(): # define the sign up function
         return render_template('signup.html')
     else: # if the request is POST, then we check if the email
           # doesn't already exist and then we save data
-        from flask import current_app
-        from school_project.models import User, AdminNotification
-        from school_project import db
+        from school_project import db, events, registrations
+        from school_project.enums import invalid_codes
+        from school_project.models import User
         
         try:
             email = request.form.get('email')
@@ -38,54 +41,36 @@ def signup(): # define the sign up function
             if not email or not name or not password:
                 flash('Tous les champs sont requis')
                 return redirect(url_for('auth.signup'))
-            
-            user = User.query.filter_by(email=email).first() # if this
-                                  # returns a user, then the email
-                                  # already exists in database
-            if user: # if a user is found, we want to redirect back to
-                     # signup page so user can try again
-                flash('Email address already exists')
+            if invalid_codes(User, gender=request.form.get('gender', 'male')):
+                flash('Genre invalide')
                 return redirect(url_for('auth.signup'))
             
-            # Get additional fields with defaults
-            from datetime import datetime
-            
-            # create a new user with the form data. Hash the password so
-            # the plaintext version isn't saved.
-            new_user = User(
-                email=email, 
-                name=name,
-                password=generate_password_hash(password, method='pbkdf2:sha256'), 
-                role='visiteur', 
-                status='pending',
-                age=request.form.get('age'),
+            # the user and its admin notification are written in one
+            # transaction; the unique constraint on the email, not a prior
+            # SELECT, rejects an address that already exists
+            created = registrations.register(
+                email,
+                name,
+                generate_password_hash(password, method='pbkdf2:sha256'),
+                age=request.form.get('age') or None,
                 phone=request.form.get('phone', ''),
                 address=request.form.get('address', ''),
-                registration=f'USER_{datetime.now().strftime("%Y%m%d%H%M%S")}',
                 gender=request.form.get('gender', 'male'),
                 major=request.form.get('major', ''),
                 about_me=request.form.get('aboutMe', ''),
-                register_date=datetime.now().date()
             )
+            if created is None: # the email is taken, we redirect back to
+                                # the signup page so the user can try again
+                flash('Email address already exists')
+                return redirect(url_for('auth.signup'))
             
-            #add the new user to the db
-            db.session.add(new_user)
-            db.session.commit()
-            
-            # Create an admin notification for new registration
-            try:
-                notification = AdminNotification(
-                    user_id=new_user.id,
-                    notification_type='new_registration',
-                    message=f"Nouvel utilisateur {new_user.name} ({new_user.email}) s'est inscrit et attend l'approbation."
-                )
-                db.session.add(notification)
-                db.session.commit()
-            except Exception as notif_error:
-                # Don't fail signup if notification creation fails
-                print(f"Notification creation failed: {notif_error}")
-                db.session.rollback()
-                db.session.commit()  # Commit the user anyway
+            user_id, notification_id = created
+            events.publish('new_registration', {
+                'user_id': user_id,
+                'name': name,
+                'email': email,
+                'notification_id': notification_id,
+            }, roles=events.ADMIN_ROLES)
             
             flash('Inscription réussie! Votre compte est en attente d\'approbation.')
             return redirect(url_for('auth.login'))
@@ -93,7 +78,7 @@ def signup(): # define the sign up function
         except Exception as e:
             db.session.rollback()
             flash('Une erreur est survenue lors de l\'inscription. Veuillez réessayer.')
-            print(f"Signup error: {e}")  # For debugging
+            logger.exception("Signup error: %s", e)
             return redirect(url_for('auth.signup'))
 
 @auth.route('/login', methods=['GET', 'POST']) # define login page path
@@ -133,5 +118,5 @@ def login(): # define login page function
             
         except Exception as e:
             flash('Une erreur est survenue lors de la connexion. Veuillez réessayer.')
-            print(f"Login error: {e}")  # For debugging
+            logger.exception("Login error: %s", e)
             return redirect(url_for('auth.login'))
@@ -0,0 +1,577 @@
+####################################################################
+###############          Application cache          ################
+####################################################################
+# One cache API in front of interchangeable backends, chosen with
+# CACHE_BACKEND:
+#   memory  LRU with TTL inside each worker process (the default; lost on
+#           restart and duplicated per gunicorn worker)
+#   sqlite  a WAL SQLite file (CACHE_SQLITE_PATH) shared by every worker
+#           of the host and kept across restarts
+#   redis   any server speaking the Redis protocol (CACHE_REDIS_URL),
+#           shared by every host; spoken over a plain socket, no client
+#           package needed. benchmarks/resp_server.py is a local stand-in.
+#   null    caches nothing
+#
+# Keys are namespaced ('<CACHE_KEY_PREFIX>:<namespace>:<key>') and values
+# pickled: the backends are private to the application, never point
+# CACHE_REDIS_URL at a server untrusted clients can write to. Reads and
+# writes go through get_many/set_many so a page needing fifty entries
+# makes one round trip. A failing backend is logged and behaves as a
+# miss: the cache can slow the app down, never break it.
+#
+# Hits, misses and errors are counted per namespace and per process:
+# /admin/cache and `flask --app wsgi cache stats` show the hit ratios.
+#
+# What is cached (the last section of this file): the user loaded by
+# Flask-Login on every request, the reference-data snapshots and grade
+# and notification aggregates of refcache.py (built once for all the
+# workers through singleflight.py, which also relies on add() of the
+# backends as a lock) and the public pages rendered for anonymous
+# visitors.
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import unquote, urlparse
+
+import click
+from flask import current_app, has_app_context, request, session as flask_session
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from school_project.routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_KEY = 'cache_invalidate'
+
+
+def configure(app):
+    app.config.setdefault('CACHE_BACKEND', os.environ.get('CACHE_BACKEND', 'memory'))
+    app.config.setdefault('CACHE_KEY_PREFIX', os.environ.get('CACHE_KEY_PREFIX', 'efet'))
+    app.config.setdefault('CACHE_DEFAULT_TTL', float(os.environ.get('CACHE_DEFAULT_TTL', 300)))
+    app.config.setdefault('CACHE_MAX_ENTRIES', int(os.environ.get('CACHE_MAX_ENTRIES', 10000)))
+    app.config.setdefault('CACHE_SQLITE_PATH', os.environ.get('CACHE_SQLITE_PATH', os.path.join(app.instance_path, 'cache.sqlite')))
+    app.config.setdefault('CACHE_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    app.config.setdefault('CACHE_USER_TTL', float(os.environ.get('CACHE_USER_TTL', 60)))
+    app.config.setdefault('CACHE_PAGE_TTL', float(os.environ.get('CACHE_PAGE_TTL', 600)))
+
+####################################################################
+# Backends: bytes in, bytes out, keys already namespaced
+
+class NullBackend:
+    name = 'null'
+
+    def get_many(self, keys):
+        return {}
+
+    def set_many(self, items, ttl):
+        pass
+
+    def add(self, key, value, ttl):
+        return True
+
+    def delete_many(self, keys):
+        pass
+
+    def clear(self, prefix):
+        pass
+
+    def size(self):
+        return 0
+
+class MemoryBackend:
+    """LRU with TTL, private to the process"""
+    name = 'memory'
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires at, value), least recently used first
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, items, ttl):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._entries[key] = (now + ttl, value)
+            self._entries.move_to_end(key)
+        return True
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def size(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    """WAL SQLite file shared by the processes of one host, one connection per thread"""
+    name = 'sqlite'
+    CHUNK = 500  # keys per IN (...) list
+    PURGE_EVERY = 1000  # writes between two sweeps of the expired entries
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                         '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID')
+
+    def _connection(self):
+        # a connection must not cross a fork (gunicorn --preload) nor a thread
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return self._local.conn
+
+    def get_many(self, keys):
+        conn = self._connection()
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), self.CHUNK):
+            chunk = keys[start:start + self.CHUNK]
+            found.update(conn.execute(
+                f"SELECT key, value FROM cache_entry WHERE key IN ({', '.join('?' * len(chunk))}) AND expires_at > ?",
+                (*chunk, now)).fetchall())
+        return found
+
+    def set_many(self, items, ttl):
+        conn = self._connection()
+        expires_at = time.time() + ttl
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?) '
+                             'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+                             [(key, value, expires_at) for key, value in items.items()])
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (time.time(),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def add(self, key, value, ttl):
+        # a single statement: an expired entry is replaced, a live one left alone
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at '
+            'WHERE cache_entry.expires_at <= ?', (key, value, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys):
+        conn = self._connection()
+        for start in range(0, len(keys), self.CHUNK):
+            chunk = keys[start:start + self.CHUNK]
+            conn.execute(f"DELETE FROM cache_entry WHERE key IN ({', '.join('?' * len(chunk))})", chunk)
+
+    def clear(self, prefix):
+        # keys are ASCII-prefixed, a range scan on the primary key instead of LIKE
+        self._connection().execute('DELETE FROM cache_entry WHERE key >= ? AND key < ?', (prefix, prefix + '\uffff'))
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache_entry WHERE expires_at > ?', (time.time(),)).fetchone()[0]
+
+class RedisError(Exception):
+    pass
+
+class RedisBackend:
+    """Redis protocol (RESP2) over a socket per thread: MGET, pipelined SET ... PX, SET NX, DEL, SCAN"""
+    name = 'redis'
+
+    def __init__(self, url, timeout=2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.file, self._local.pid = sock, sock.makefile('rb'), os.getpid()
+        if self.password:
+            self._call([('AUTH', self.password)])
+        if self.database:
+            self._call([('SELECT', self.database)])
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = self._local.pid = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(command):
+        parts = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in command]
+        return b''.join([b'*%d\r\n' % len(parts)] + [b'$%d\r\n%s\r\n' % (len(part), part) for part in parts])
+
+    def _read(self):
+        line = self._local.file.readline()
+        if not line:
+            raise ConnectionError('connection closed by the server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.file.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RedisError(f'unexpected reply {line!r}')
+
+    def _call(self, commands):
+        """Send the commands in one write (a pipeline) and return their replies"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._connect()
+        try:
+            self._local.sock.sendall(b''.join(self._encode(command) for command in commands))
+            replies = [self._read() for _ in commands]
+        except (OSError, ConnectionError):
+            self._drop()
+            raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self._call([('MGET', *keys)])[0]
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items, ttl):
+        milliseconds = max(1, int(ttl * 1000))
+        self._call([('SET', key, value, 'PX', milliseconds) for key, value in items.items()])
+
+    def add(self, key, value, ttl):
+        return self._call([('SET', key, value, 'NX', 'PX', max(1, int(ttl * 1000)))])[0] is not None
+
+    def delete_many(self, keys):
+        if keys:
+            self._call([('DEL', *keys)])
+
+    def clear(self, prefix):
+        cursor = '0'
+        while True:
+            cursor, keys = self._call([('SCAN', cursor, 'MATCH', prefix + '*', 'COUNT', 500)])[0]
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            self.delete_many([key.decode() for key in keys])
+            if cursor == '0':
+                return
+
+    def size(self):
+        return self._call([('DBSIZE',)])[0]
+
+def make_backend(config):
+    name = config['CACHE_BACKEND']
+    if name == 'memory':
+        return MemoryBackend(config['CACHE_MAX_ENTRIES'])
+    if name == 'sqlite':
+        return SQLiteBackend(config['CACHE_SQLITE_PATH'])
+    if name == 'redis':
+        return RedisBackend(config['CACHE_REDIS_URL'])
+    if name == 'null':
+        return NullBackend()
+    raise ValueError(f'Unknown CACHE_BACKEND: {name}')
+
+####################################################################
+
+class Cache:
+    def __init__(self, backend, prefix='efet', default_ttl=300):
+        self.backend = backend
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self._stats = {}  # namespace -> {'hits', 'misses', 'sets', 'errors'}
+        self._lock = threading.Lock()
+
+    def _key(self, namespace, key):
+        return f'{self.prefix}:{namespace}:{key}'
+
+    def _count(self, namespace, **counts):
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0})
+            for name, value in counts.items():
+                stats[name] += value
+
+    def get_many(self, namespace, keys):
+        """{key: value} of the keys found, missing ones are left out"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        full_keys = [self._key(namespace, key) for key in keys]
+        try:
+            raw = self.backend.get_many(full_keys)
+            found = {key: pickle.loads(raw[full_key]) for key, full_key in zip(keys, full_keys) if full_key in raw}
+        except Exception:
+            logger.warning("Cache read failed", extra={'namespace': namespace, 'backend': self.backend.name}, exc_info=True)
+            self._count(namespace, misses=len(keys), errors=1)
+            return {}
+        self._count(namespace, hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, namespace, mapping, ttl=None):
+        if not mapping:
+            return
+        try:
+            self.backend.set_many({self._key(namespace, key): pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                                   for key, value in mapping.items()}, ttl or self.default_ttl)
+        except Exception:
+            logger.warning("Cache write failed", extra={'namespace': namespace, 'backend': self.backend.name}, exc_info=True)
+            self._count(namespace, errors=1)
+            return
+        self._count(namespace, sets=len(mapping))
+
+    def add(self, namespace, key, value, ttl=None):
+        """Store `value` only if `key` is absent and return True, False if it is
+        present. A failing backend answers True: callers using add() as a lock go on."""
+        try:
+            added = self.backend.add(self._key(namespace, key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                                     ttl or self.default_ttl)
+        except Exception:
+            logger.warning("Cache add failed", extra={'namespace': namespace, 'backend': self.backend.name}, exc_info=True)
+            self._count(namespace, errors=1)
+            return True
+        if added:
+            self._count(namespace, sets=1)
+        return added
+
+    def delete_many(self, namespace, keys):
+        keys = [self._key(namespace, key) for key in keys]
+        try:
+            self.backend.delete_many(keys)
+        except Exception:
+            logger.warning("Cache delete failed", extra={'namespace': namespace, 'backend': self.backend.name}, exc_info=True)
+            self._count(namespace, errors=1)
+
+    def clear(self, namespace=None):
+        prefix = f'{self.prefix}:{namespace}:' if namespace else f'{self.prefix}:'
+        try:
+            self.backend.clear(prefix)
+        except Exception:
+            logger.warning("Cache clear failed", extra={'namespace': namespace, 'backend': self.backend.name}, exc_info=True)
+
+    def namespace(self, name):
+        return Namespace(self, name)
+
+    def stats(self):
+        """{namespace: {'hits', 'misses', 'sets', 'errors', 'hit_ratio'}} of this process"""
+        with self._lock:
+            stats = {namespace: dict(counts) for namespace, counts in self._stats.items()}
+        for counts in stats.values():
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = round(counts['hits'] / lookups, 4) if lookups else None
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+class Namespace:
+    """The keys of one namespace: get/set/delete one key or many at once"""
+    _missing = object()
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+
+    def get(self, key, default=None):
+        return self.cache.get_many(self.name, [key]).get(key, default)
+
+    def get_many(self, keys):
+        return self.cache.get_many(self.name, keys)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set_many(self.name, {key: value}, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        self.cache.set_many(self.name, mapping, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self.cache.add(self.name, key, value, ttl)
+
+    def delete(self, *keys):
+        self.cache.delete_many(self.name, keys)
+
+    def clear(self):
+        self.cache.clear(self.name)
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key, self._missing)
+        if value is self._missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+def get_cache(app=None):
+    return (app or current_app).extensions['cache']
+
+def namespace(name):
+    return get_cache().namespace(name)
+
+####################################################################
+# Invalidation after commit: entries are dropped once the new rows are
+# visible, never before (a reader could cache the old rows again)
+
+def invalidate_after_commit(session, namespace_name, keys=None):
+    """Drop `keys` of a namespace (all of it if None) when `session` commits"""
+    pending = session.info.setdefault(INVALIDATE_KEY, {})
+    if keys is None:
+        pending[namespace_name] = None
+    elif pending.get(namespace_name, set()) is not None:
+        pending.setdefault(namespace_name, set()).update(keys)
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _track_users(session, flush_context, instances):
+    from school_project.models import User
+    ids = [obj.id for obj in list(session.dirty) + list(session.deleted)
+           if isinstance(obj, User) and obj.id is not None and (obj in session.deleted or session.is_modified(obj))]
+    if ids:
+        invalidate_after_commit(session, 'users', ids)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate(session):
+    pending = session.info.pop(INVALIDATE_KEY, None)
+    if not pending or not has_app_context() or 'cache' not in current_app.extensions:
+        return
+    cache = get_cache()
+    for namespace_name, keys in pending.items():
+        if keys is None:
+            cache.clear(namespace_name)
+        else:
+            cache.delete_many(namespace_name, keys)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_invalidations(session):
+    session.info.pop(INVALIDATE_KEY, None)
+
+####################################################################
+# Hot reads
+
+USER_UNCACHED = ('password',)  # never copied into a shared backend, lazy-loaded when needed
+
+def load_user(user_id):
+    """Flask-Login's user loader: the user's columns come from the cache and
+    the object is attached to the session without a SELECT, so routes can
+    still modify and commit it. The USER_UNCACHED columns are left expired
+    and loaded from the database on first access."""
+    from school_project import db
+    from school_project.models import User
+    users = namespace('users')
+    columns = users.get(user_id)
+    if columns is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        users.set(user_id, {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs
+                            if attr.key not in USER_UNCACHED},
+                  current_app.config['CACHE_USER_TTL'])
+        return user
+    user = db.session.identity_map.get(db.session.identity_key(User, user_id))
+    if user is not None:
+        return user
+    user = User(**columns)
+    make_transient_to_detached(user)
+    db.session.add(user)  # persistent and clean, as if just loaded
+    return user
+
+def cached_page(f):
+    """Serve a GET page rendered for anonymous visitors from the cache"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from flask import Response
+        from flask_login import current_user
+        if request.method != 'GET' or current_user.is_authenticated or '_flashes' in flask_session:
+            return f(*args, **kwargs)
+        pages = namespace('pages')
+        key = request.full_path
+        cached = pages.get(key)
+        if cached is not None:
+            body, status, mimetype = cached
+            return Response(body, status=status, mimetype=mimetype)
+        response = current_app.make_response(f(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+            pages.set(key, (response.get_data(), response.status_code, response.mimetype), current_app.config['CACHE_PAGE_TTL'])
+        return response
+    return decorated_function
+
+####################################################################
+
+cache_cli = AppGroup('cache', help='Application cache')
+
+@cache_cli.command('stats')
+def stats_command():
+    """Backend, entry count and hit ratios of this process"""
+    cache = get_cache()
+    click.echo(f'backend: {cache.backend.name}, entries: {cache.backend.size()}')
+    for name, counts in sorted(cache.stats().items()):
+        click.echo(f"{name:<12} hits {counts['hits']:>8}  misses {counts['misses']:>8}  ratio {counts['hit_ratio']}")
+
+@cache_cli.command('clear')
+@click.option('--namespace', 'namespace_name', help='Only this namespace (users, refdata, pages)')
+def clear_command(namespace_name):
+    """Drop the cached entries"""
+    get_cache().clear(namespace_name)
+    click.echo('Cache cleared')
+
+def init_app(app):
+    configure(app)
+    app.extensions['cache'] = Cache(make_backend(app.config), app.config['CACHE_KEY_PREFIX'], app.config['CACHE_DEFAULT_TTL'])
+    app.cli.add_command(cache_cli)
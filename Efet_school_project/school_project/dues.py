@@ -0,0 +1,100 @@
+####################################################################
+###############        Monthly dues generation      ################
+####################################################################
+# Creates the 'pending' fees payment of a month for every approved
+# student with one INSERT ... SELECT, so billing the whole school is a
+# single statement whatever its size. Students who already have a fees
+# payment for that month are skipped: running it twice for the same
+# month adds nothing. The unique index ux_payment_dues (one fees payment
+# per student and month) settles two runs racing each other: the INSERT
+# is ON CONFLICT DO NOTHING. migrate_dues.py adds it to an existing
+# database.
+#
+# The amount is the student's latest fees payment, DUES_AMOUNT for
+# students who never paid fees, unless an amount is given explicitly.
+# Runs from the scheduler (see jobs.SCHEDULE) or with
+# `flask --app wsgi dues generate [--month 2025-10] [--amount 1500]`.
+import os
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import exists, func, literal, select
+
+from school_project import db
+from school_project.models import Payment, User
+
+DUES_STATUS = 'pending'
+DUES_TYPE = 'fees'
+
+
+def configure(app):
+    app.config.setdefault('DUES_AMOUNT', float(os.environ.get('DUES_AMOUNT', 1500)))
+
+def parse_month(value):
+    """'2025-10' -> date(2025, 10, 1)"""
+    return datetime.strptime(value, '%Y-%m').date()
+
+def next_month(today=None):
+    today = today or date.today()
+    return date(today.year + today.month // 12, today.month % 12 + 1, 1)
+
+def ensure_index():
+    # create_all() does not add indexes to existing tables
+    db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_payment_student_month ON payment (student_id, month_paid)'))
+    dues_index = next(index for index in Payment.__table__.indexes if index.name == 'ux_payment_dues')
+    dues_index.create(db.session.connection(), checkfirst=True)
+
+def _insert_dues(table):
+    """INSERT skipping the (student, month) pairs already billed, see ux_payment_dues"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(table).on_conflict_do_nothing(
+        index_elements=[table.c.student_id, table.c.month_paid], index_where=table.c.type == DUES_TYPE)
+
+def generate_dues(month=None, amount=None):
+    """Insert the pending fees of `month` (first day, default: next month), return
+    the number of payments created. The caller commits."""
+    month = (month or next_month()).replace(day=1)
+    ensure_index()
+    user, payment = User.__table__, Payment.__table__
+    if amount is None:
+        previous = payment.alias('previous')
+        latest_fee = select(previous.c.amount) \
+            .where(previous.c.student_id == user.c.id, previous.c.type == DUES_TYPE, previous.c.amount.is_not(None)) \
+            .order_by(previous.c.month_paid.desc(), previous.c.id.desc()) \
+            .limit(1).scalar_subquery()
+        amount_column = func.coalesce(latest_fee, current_app.config['DUES_AMOUNT'])
+    else:
+        amount_column = literal(float(amount), db.Float)
+
+    already_billed = exists().where(payment.c.student_id == user.c.id,
+                                    payment.c.month_paid == month,
+                                    payment.c.type == DUES_TYPE)
+    students = select(user.c.id, literal(month, db.Date), amount_column,
+                      literal(DUES_STATUS, payment.c.status.type), literal(DUES_TYPE, payment.c.type.type)) \
+        .where(user.c.role == 'student', user.c.status == 'approved', ~already_billed)
+    result = db.session.execute(_insert_dues(payment).from_select(
+        ['student_id', 'month_paid', 'amount', 'status', 'type'], students))
+    return result.rowcount
+
+####################################################################
+
+dues_cli = AppGroup('dues', help='Monthly dues')
+
+@dues_cli.command('generate')
+@click.option('--month', help='YYYY-MM, next month by default')
+@click.option('--amount', type=float, help="Same amount for everyone instead of each student's last fees")
+def generate_command(month, amount):
+    """Create the pending fees of a month for every approved student"""
+    month = parse_month(month) if month else next_month()
+    created = generate_dues(month, amount)
+    db.session.commit()
+    click.echo(f"{created} payments created for {month.strftime('%Y-%m')}")
+
+def init_app(app):
+    configure(app)
+    app.cli.add_command(dues_cli)
@@ -0,0 +1,110 @@
+####################################################################
+###############        Small-integer codes         #################
+####################################################################
+# role, status, gender, payment status/type, justified and priority only
+# ever hold one of a handful of words. They are stored as SMALLINT codes
+# (2 bytes instead of the word, and as many in the indexes) through the
+# Code column type below, but the application keeps seeing the words:
+# current_user.role == 'student', filter_by(status='pending') and the
+# templates work unchanged, the translation happens when SQLAlchemy
+# binds a parameter or reads a typed column.
+#
+# Raw SQL (db.text) is not typed: declare the coded columns it returns
+# with .columns(role=User.role.type) and bind codes, e.g. Role.student.
+# Codes are stored, never renumber an existing member: add new ones at
+# the end. migrate_enums.py converts an existing database.
+import enum
+
+from school_project import db
+
+
+class Role(enum.IntEnum):
+    student = 1
+    teacher = 2
+    admin = 3
+    owner = 4
+    visiteur = 5
+
+class UserStatus(enum.IntEnum):
+    pending = 1
+    approved = 2
+    rejected = 3
+
+class Gender(enum.IntEnum):
+    male = 1
+    female = 2
+    other = 3
+
+class PaymentStatus(enum.IntEnum):
+    paid = 1
+    awaiting = 2
+    pending = 3
+
+class PaymentType(enum.IntEnum):
+    fees = 1
+    registration = 2
+
+class Justified(enum.IntEnum):
+    yes = 1
+    no = 2
+    waiting = 3
+
+class Priority(enum.IntEnum):
+    normal = 1
+    important = 2
+    urgent = 3
+
+
+class Code(db.TypeDecorator):
+    """SMALLINT column holding the code of an IntEnum member, read and
+    written as the member name ('student'). Empty values are stored as NULL."""
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+
+    def code(self, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, int):
+            return int(self.enum_class(value))
+        try:
+            return int(self.enum_class[value.strip().lower()])
+        except KeyError:
+            raise ValueError(f'{value!r} is not a valid {self.enum_class.__name__}') from None
+
+    def accepts(self, value):
+        """Whether value can be stored, e.g. a form field before it reaches the flush"""
+        try:
+            self.code(value)
+        except (ValueError, AttributeError):
+            return False
+        return True
+
+    def process_bind_param(self, value, dialect):
+        return self.code(value)
+
+    def process_literal_param(self, value, dialect):
+        code = self.code(value)
+        return 'NULL' if code is None else str(code)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self.enum_class(int(value)).name
+        except ValueError:
+            raise ValueError(f'{value!r} is not a {self.enum_class.__name__} code, '
+                             'has school_project/migrate_enums.py been run?') from None
+
+    @property
+    def python_type(self):
+        return str
+
+
+def invalid_codes(model, **values):
+    """Names of the `values`, given by column name, that the Code columns of
+    `model` would refuse: invalid_codes(User, role='teacherr') == ['role']"""
+    return [name for name, value in values.items() if not getattr(model, name).type.accepts(value)]
@@ -0,0 +1,124 @@
+####################################################################
+###############        In-process event bus        #################
+####################################################################
+# Routes publish small events after their commit (new message, message
+# read, new registration, registration approved/rejected) and the
+# /events/stream (Server-Sent Events) and /events/poll endpoints hand
+# them to the connected users they are addressed to.
+#
+# The bus lives in the worker process: events are numbered per process
+# and the last EVENTS_HISTORY of them are kept so that a client
+# reconnecting with Last-Event-ID, or polling with ?since=, does not
+# miss anything. With several gunicorn workers a client only sees the
+# events published by the worker it is connected to.
+#
+# A stream holds its connection for minutes: on the threaded workers of
+# the Procfile each one takes a thread away from every other request.
+# Streams are therefore only on by default under an async worker class
+# (gevent, eventlet), and the number of open ones is capped with
+# open_stream()/close_stream().
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+EVENTS_HISTORY = 500
+
+_streams = 0  # open /events/stream responses in this process
+_streams_lock = threading.Lock()
+
+
+class Event:
+    __slots__ = ('id', 'type', 'data', 'user_ids', 'roles', 'created_at')
+
+    def __init__(self, event_id, event_type, data, user_ids, roles):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.user_ids = user_ids
+        self.roles = roles
+        self.created_at = time.time()
+
+    def visible_to(self, user_id, role):
+        return user_id in self.user_ids or role in self.roles
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'data': self.data, 'created_at': self.created_at}
+
+    def to_sse(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class EventBus:
+    def __init__(self, history=EVENTS_HISTORY):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data, user_ids=(), roles=()):
+        """Record an event for the given users and/or roles and wake up the waiting clients"""
+        with self._condition:
+            self._last_id += 1
+            event = Event(self._last_id, event_type, data,
+                          frozenset(int(user_id) for user_id in user_ids if user_id is not None),
+                          frozenset(roles))
+            self._events.append(event)
+            self._condition.notify_all()
+        return event
+
+    def events_since(self, last_id, user_id, role):
+        with self._condition:
+            return self._events_since(last_id, user_id, role)
+
+    def _events_since(self, last_id, user_id, role):
+        if last_id > self._last_id:
+            # the client saw a previous process, ids restarted
+            last_id = 0
+        return [event for event in self._events if event.id > last_id and event.visible_to(user_id, role)]
+
+    def wait(self, last_id, user_id, role, timeout):
+        """Block until there are events for this user after last_id, or timeout"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self._events_since(last_id, user_id, role)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+
+
+bus = EventBus()
+
+ADMIN_ROLES = ('admin', 'owner')
+
+
+def publish(event_type, data, user_ids=(), roles=()):
+    return bus.publish(event_type, data, user_ids=user_ids, roles=roles)
+
+def async_worker():
+    """True under a gevent or eventlet worker, where a held connection costs a greenlet, not a thread"""
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('socket'):
+        return True
+    eventlet_patcher = sys.modules.get('eventlet.patcher')
+    return eventlet_patcher is not None and eventlet_patcher.is_monkey_patched('socket')
+
+def open_stream(limit):
+    """Count one more open stream, False when `limit` are already open"""
+    global _streams
+    with _streams_lock:
+        if _streams >= limit:
+            return False
+        _streams += 1
+        return True
+
+def close_stream():
+    global _streams
+    with _streams_lock:
+        _streams = max(0, _streams - 1)
@@ -0,0 +1,165 @@
+####################################################################
+###############       Gradebook (bulk entry)        ################
+####################################################################
+# Grid of the grades of one subject for the students of one major: a row
+# per student, a column per grade date. The /gradebook page sends the
+# edited cells as one JSON batch and apply_changes() writes it in a single
+# transaction: the batch is validated first, then existing cells are
+# updated with one executemany UPDATE, new ones added with one multi-row
+# INSERT and emptied ones deleted with one DELETE. The subject means of
+# the touched students and of the major are computed once afterwards,
+# instead of once per grade like addGrade/editGrade.
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+
+from school_project import db, refcache
+from school_project.attendance import roster
+from school_project.models import Grade, Major, Subject
+
+DATE_FORMAT = '%Y-%m-%d'
+MAX_CHANGES = 2000
+MIN_GRADE, MAX_GRADE = 0, 20
+
+
+class GradebookError(ValueError):
+    """The batch was refused as a whole, `errors` lists every problem"""
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def sheet(subject, major_name):
+    """(students [(id, name)], grade dates, {(student id, date): (grade id, grade)})"""
+    students = roster(major_name)
+    ids = [student_id for student_id, _ in students]
+    cells = {}
+    if ids:
+        for grade_id, student_id, grade, grade_date in db.session.execute(
+                select(Grade.id, Grade.student_id, Grade.grade, Grade.grade_date)
+                .where(Grade.subject == subject, Grade.student_id.in_(ids))
+                .order_by(Grade.id)):
+            cells.setdefault((student_id, grade_date), (grade_id, grade))  # oldest row of a duplicated cell
+    dates = sorted({grade_date for _, grade_date in cells if grade_date is not None})
+    return students, dates, cells
+
+def _parse_grade(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None  # emptied cell
+    grade = float(value)
+    if not MIN_GRADE <= grade <= MAX_GRADE:
+        raise ValueError
+    return grade
+
+def parse_changes(subject, major_name, changes):
+    """Check a whole batch before anything is written. `changes` is a list of
+    {'student_id', 'grade_date', 'grade', optional 'id'}, an empty grade
+    deletes the cell. Returns (inserts, updates, deleted ids, student ids)."""
+    errors = []
+    if not subject or Subject.query.filter_by(name=subject).first() is None:
+        errors.append(f'Unknown subject: {subject}')
+    if not major_name or Major.query.filter_by(major_name=major_name).first() is None:
+        errors.append(f'Unknown major: {major_name}')
+    if not isinstance(changes, list):
+        errors.append('changes must be a list')
+    elif len(changes) > MAX_CHANGES:
+        errors.append(f'At most {MAX_CHANGES} changes per batch')
+    if errors:
+        raise GradebookError(errors)
+
+    students = {student_id for student_id, _ in roster(major_name)}
+    parsed, seen = [], set()
+    for change in changes:
+        try:
+            student_id = int(change.get('student_id'))
+            grade_date = datetime.strptime(change.get('grade_date') or '', DATE_FORMAT).date()
+        except (AttributeError, TypeError, ValueError):
+            errors.append(f'Invalid cell: {change!r}')
+            continue
+        try:
+            grade = _parse_grade(change.get('grade'))
+        except (TypeError, ValueError):
+            errors.append(f'Invalid grade for student {student_id} on {grade_date}: {change.get("grade")!r}')
+            continue
+        grade_id = change.get('id')
+        if student_id not in students:
+            errors.append(f'Student {student_id} is not in {major_name}')
+        elif (student_id, grade_date) in seen:
+            errors.append(f'Cell of student {student_id} on {grade_date} is listed twice')
+        else:
+            seen.add((student_id, grade_date))
+            parsed.append((student_id, grade_date, grade, grade_id))
+    if errors:
+        raise GradebookError(errors)
+
+    # one query for every existing row of the touched cells
+    existing = {}
+    if parsed:
+        for grade_id, student_id, grade_date in db.session.execute(
+                select(Grade.id, Grade.student_id, Grade.grade_date).where(
+                    Grade.subject == subject,
+                    Grade.student_id.in_({student_id for student_id, _, _, _ in parsed}),
+                    Grade.grade_date.in_({grade_date for _, grade_date, _, _ in parsed}))):
+            existing.setdefault((student_id, grade_date), []).append(grade_id)
+
+    inserts, updates, deleted = [], [], []
+    for student_id, grade_date, grade, grade_id in parsed:
+        rows = existing.get((student_id, grade_date), [])
+        if grade_id is not None:
+            if str(grade_id) not in map(str, rows):
+                errors.append(f'Grade {grade_id} is not the cell of student {student_id} on {grade_date}')
+                continue
+            rows = [int(grade_id)]
+        elif len(rows) > 1:
+            errors.append(f'Student {student_id} has {len(rows)} grades on {grade_date}, send the id to edit')
+            continue
+        if grade is None:
+            deleted.extend(rows)
+        elif rows:
+            updates.append({'id': rows[0], 'grade': grade})
+        else:
+            inserts.append({'student_id': student_id, 'subject': subject, 'grade_date': grade_date, 'grade': grade})
+    if errors:
+        raise GradebookError(errors)
+    return inserts, updates, deleted, students
+
+def subject_means(subject, student_ids):
+    """{student id: mean} of one subject, one grouped query"""
+    if not student_ids:
+        return {}
+    return dict(db.session.execute(
+        select(Grade.student_id, func.avg(Grade.grade))
+        .where(Grade.subject == subject, Grade.student_id.in_(student_ids))
+        .group_by(Grade.student_id)).all())
+
+def apply_changes(subject, major_name, changes):
+    """Write a validated batch in one transaction and recompute the means once.
+    Returns {'inserted', 'updated', 'deleted', 'means', 'major_mean'}."""
+    try:
+        # two batches for the same major queue on the major row before reading the
+        # existing cells (no-op on SQLite, writes are serialized)
+        db.session.query(Major.id).filter_by(major_name=major_name).with_for_update().first()
+        inserts, updates, deleted, students = parse_changes(subject, major_name, changes)
+        if updates:
+            db.session.execute(update(Grade), updates)  # executemany UPDATE ... WHERE id = ?
+        if inserts:
+            db.session.execute(insert(Grade), inserts)  # a single multi-row INSERT
+        if deleted:
+            db.session.execute(delete(Grade).where(Grade.id.in_(deleted)))
+        if updates or inserts or deleted:
+            refcache.invalidate('grades')  # Core statements, not seen by the flush hooks
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    touched = {int(change['student_id']) for change in changes}
+    means = subject_means(subject, students)
+    values = list(means.values())
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(deleted),
+        'means': {student_id: round(means[student_id], 2) if student_id in means else None for student_id in sorted(touched)},
+        'major_mean': round(sum(values) / len(values), 2) if values else None,
+    }
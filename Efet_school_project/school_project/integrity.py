@@ -0,0 +1,99 @@
+####################################################################
+###############      Referential integrity        ##################
+####################################################################
+# Grades, payments, absences, messages, notifications, emails (their
+# recipient) and attendance bitmaps reference their user with ON DELETE
+# CASCADE, subjects their teacher, emails their sender and users their
+# major with ON DELETE SET NULL
+# (see the ForeignKey declarations in models.py), so deleting a user or a
+# major no longer leaves rows behind. SQLite only enforces them with
+# PRAGMA foreign_keys=ON, part of the 'production' profile of
+# sqlite_tuning.py.
+#
+# Databases created before the constraints existed keep their orphans
+# until swept: `flask --app wsgi integrity sweep` deletes (CASCADE) or
+# unlinks (SET NULL) them in chunks of ORPHAN_SWEEP_CHUNK_SIZE rows, one
+# short transaction per chunk. migrate_foreign_keys.py runs the sweep
+# and then adds the constraints to the existing tables.
+import logging
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import exists, func, select
+
+from school_project import cache, db, refcache
+
+logger = logging.getLogger(__name__)
+
+
+def configure(app):
+    app.config.setdefault('ORPHAN_SWEEP_CHUNK_SIZE', int(os.environ.get('ORPHAN_SWEEP_CHUNK_SIZE', 1000)))
+
+def foreign_keys():
+    """(foreign key, ON DELETE action) of every model column with an ON DELETE rule"""
+    return [(fk, fk.ondelete.upper())
+            for table in db.metadata.sorted_tables
+            for fk in sorted(table.foreign_keys, key=lambda fk: fk.parent.name)
+            if fk.ondelete]
+
+def _orphaned(fk):
+    column = fk.parent
+    target = fk.column
+    return db.and_(column.is_not(None), ~exists().where(target == column))
+
+def count_orphans():
+    """{'table.column': orphan rows}"""
+    counts = {}
+    for fk, _ in foreign_keys():
+        table = fk.parent.table
+        counts[f'{table.name}.{fk.parent.name}'] = db.session.execute(
+            select(func.count()).select_from(table).where(_orphaned(fk))).scalar()
+    return counts
+
+def sweep_orphans(chunk_size=None):
+    """Delete or unlink the rows referencing a missing parent, one committed
+    chunk at a time. Returns {'table.column': rows fixed}."""
+    chunk_size = chunk_size or current_app.config['ORPHAN_SWEEP_CHUNK_SIZE']
+    swept = {}
+    for fk, action in foreign_keys():
+        table, column = fk.parent.table, fk.parent
+        fixed = 0
+        while True:
+            ids = db.session.execute(select(table.c.id).where(_orphaned(fk)).order_by(table.c.id).limit(chunk_size)).scalars().all()
+            if not ids:
+                break
+            if action == 'CASCADE':
+                db.session.execute(table.delete().where(table.c.id.in_(ids)))
+            else:
+                db.session.execute(table.update().where(table.c.id.in_(ids)).values({column.name: None}))
+            refcache.invalidate_table(table.name)
+            if table.name == 'user':
+                cache.invalidate_after_commit(db.session(), 'users', ids)  # unlinked from a missing major
+            db.session.commit()
+            fixed += len(ids)
+        swept[f'{table.name}.{column.name}'] = fixed
+    logger.info("Swept orphan rows", extra={'swept': swept})
+    return swept
+
+####################################################################
+
+integrity_cli = AppGroup('integrity', help='Foreign keys and orphan rows')
+
+@integrity_cli.command('check')
+def check_command():
+    """Count the rows referencing a missing user, major or teacher"""
+    for name, count in count_orphans().items():
+        click.echo(f'{name:<36} {count}')
+
+@integrity_cli.command('sweep')
+@click.option('--chunk-size', type=int)
+def sweep_command(chunk_size):
+    """Delete (or unlink) the orphan rows in small transactions"""
+    for name, fixed in sweep_orphans(chunk_size).items():
+        click.echo(f'{name:<36} {fixed} rows fixed')
+
+def init_app(app):
+    configure(app)
+    app.cli.add_command(integrity_cli)
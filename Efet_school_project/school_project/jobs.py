@@ -0,0 +1,397 @@
+####################################################################
+###############      Durable background jobs        ################
+####################################################################
+# Work that does not have to happen inside a request is stored as a row
+# of the job table and run by worker threads, either inside the web
+# processes (JOBS_INPROCESS_THREADS, 1 by default, started on the first
+# request like the email outbox) or in a separate process started with
+# `flask --app wsgi jobs worker`.
+#
+# Claiming works like the outbox: a conditional UPDATE moves one due job
+# to 'running' and uses run_at as a lease, so two workers never run the
+# same job and the jobs of a crashed worker are picked up again once the
+# lease expires. Higher priorities run first. A job that raises is
+# retried with exponential backoff until its max_attempts, then marked
+# 'failed'.
+#
+# The scheduler enqueues the SCHEDULE entries (cron expressions, server
+# local time). Every worker runs it; the next run time of each entry is
+# advanced with a conditional UPDATE so an entry is enqueued only once.
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from school_project import db
+from school_project.models import Job, JobSchedule
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}  # name -> Task
+# name -> (cron expression, task name, payload)
+SCHEDULE = {
+    'nightly_attendance_rebuild': ('0 2 * * *', 'rebuild_attendance', {}),
+    'nightly_student_counts': ('15 2 * * *', 'refresh_student_counts', {}),
+    'purge_finished_jobs': ('30 3 * * *', 'purge_jobs', {}),
+    'monthly_dues': ('0 6 25 * *', 'generate_dues', {}),  # bills next month
+    'monthly_archival': ('0 4 1 * *', 'archive_academic_years', {}),
+    'nightly_ttl_purge': ('45 3 * * *', 'purge_expired', {}),
+}
+
+
+class Task:
+    def __init__(self, function, max_attempts, priority):
+        self.function = function
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+def task(name, max_attempts=3, priority=0):
+    """Register a function as the task `name`; it receives the payload as keyword arguments"""
+    def decorator(function):
+        TASKS[name] = Task(function, max_attempts, priority)
+        return function
+    return decorator
+
+def enqueue(name, payload=None, priority=None, run_at=None):
+    """Add a job to the queue, the caller commits"""
+    if name not in TASKS:
+        raise ValueError(f'Unknown task: {name}')
+    definition = TASKS[name]
+    job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        priority=definition.priority if priority is None else priority,
+        status='pending',
+        attempts=0,
+        max_attempts=definition.max_attempts,
+        run_at=run_at,
+    )
+    db.session.add(job)
+    return job
+
+def configure(app):
+    app.config.setdefault('JOBS_INPROCESS_THREADS', int(os.environ.get('JOBS_INPROCESS_THREADS', 1)))
+    app.config.setdefault('JOBS_INTERVAL', float(os.environ.get('JOBS_INTERVAL', 2)))
+    app.config.setdefault('JOBS_LEASE_SECONDS', int(os.environ.get('JOBS_LEASE_SECONDS', 600)))
+    app.config.setdefault('JOBS_BACKOFF', float(os.environ.get('JOBS_BACKOFF', 30)))
+    app.config.setdefault('JOBS_KEEP_DAYS', int(os.environ.get('JOBS_KEEP_DAYS', 14)))
+
+####################################################################
+# Cron expressions: minute hour day-of-month month day-of-week, with
+# *, lists (1,15), ranges (1-5) and steps (*/10, 8-18/2); Sunday is 0.
+
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+def parse_cron(expression):
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f'Invalid cron expression: {expression}')
+    parsed = []
+    for field, (low, high) in zip(fields, CRON_RANGES):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end:
+                raise ValueError(f'Invalid cron field: {field}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        parsed.append((values, field == '*'))
+    return parsed
+
+def next_run(expression, after):
+    """First time strictly after `after` matching the cron expression"""
+    (minutes, _), (hours, _), (days, any_day), (months, _), (weekdays, any_weekday) = parse_cron(expression)
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = moment + timedelta(days=366 * 5)
+    while moment < limit:
+        if moment.month not in months:
+            moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        day_match = moment.day in days
+        weekday_match = moment.isoweekday() % 7 in weekdays
+        # as in cron, a restricted day of month OR day of week is enough
+        if any_day or any_weekday:
+            day_ok = day_match and weekday_match
+        else:
+            day_ok = day_match or weekday_match
+        if not day_ok:
+            moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+        elif moment.hour not in hours:
+            moment = moment.replace(minute=0) + timedelta(hours=1)
+        elif moment.minute not in minutes:
+            moment += timedelta(minutes=1)
+        else:
+            return moment
+    raise ValueError(f'Cron expression never matches: {expression}')
+
+def run_scheduler(now=None):
+    """Enqueue the due SCHEDULE entries, return their names"""
+    now = now or datetime.now()
+    enqueued = []
+    for entry, (expression, name, payload) in SCHEDULE.items():
+        schedule = db.session.get(JobSchedule, entry)
+        if schedule is None:
+            db.session.add(JobSchedule(name=entry, next_run_at=next_run(expression, now)))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()  # another worker created it
+            continue
+        if schedule.next_run_at is None or schedule.next_run_at > now:
+            continue
+        claimed = JobSchedule.query.filter(JobSchedule.name == entry, JobSchedule.next_run_at == schedule.next_run_at) \
+            .update({'next_run_at': next_run(expression, now), 'last_run_at': now}, synchronize_session=False)
+        if claimed:
+            enqueue(name, payload)
+            enqueued.append(entry)
+        db.session.commit()
+    db.session.expire_all()
+    return enqueued
+
+####################################################################
+
+class JobWorker:
+    def __init__(self, app, threads=1, scheduler=True):
+        self.app = app
+        self.threads_count = threads
+        self.scheduler = scheduler
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for number in range(self.threads_count):
+            thread = threading.Thread(target=self.run, args=(number,), name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join()
+
+    def notify(self):
+        self.wakeup.set()
+
+    def run(self, number=0):
+        while not self.stopped.is_set():
+            try:
+                with self.app.app_context():
+                    if self.scheduler and number == 0:
+                        run_scheduler()
+                    # keep going while there is work
+                    while not self.stopped.is_set() and self.run_one():
+                        pass
+            except Exception as e:
+                logger.exception("Job worker error: %s", e)
+            self.wakeup.wait(self.app.config['JOBS_INTERVAL'])
+            self.wakeup.clear()
+
+    def claim(self):
+        """Lease the most urgent due job for this worker, return it or None"""
+        while True:
+            now = datetime.now()
+            due = db.or_(
+                db.and_(Job.status == 'pending', db.or_(Job.run_at.is_(None), Job.run_at <= now)),
+                db.and_(Job.status == 'running', Job.run_at <= now),
+            )
+            job_id = db.session.query(Job.id).filter(due).order_by(Job.priority.desc(), Job.id).limit(1).scalar()
+            if job_id is None:
+                db.session.rollback()
+                return None
+            claimed = Job.query.filter(Job.id == job_id, due).update({
+                'status': 'running',
+                'claimed_by': self.worker_id,
+                'run_at': now + timedelta(seconds=self.app.config['JOBS_LEASE_SECONDS']),
+                'started_at': now,
+                'attempts': Job.attempts + 1,
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+            # another worker was faster, try the next one
+
+    def run_one(self):
+        """Run one job, return False when there was nothing to do"""
+        job = self.claim()
+        if job is None:
+            return False
+        job_id, name = job.id, job.name
+        try:
+            definition = TASKS.get(name)
+            if definition is None:
+                raise LookupError(f'Unknown task: {name}')
+            definition.function(**json.loads(job.payload or '{}'))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Job %s (%s) failed: %s", job_id, name, e)
+            self.record_failure(db.session.get(Job, job_id), f'{type(e).__name__}: {e}')
+        else:
+            job = db.session.get(Job, job_id)
+            job.status = 'done'
+            job.finished_at = datetime.now()
+            job.run_at = None
+            job.last_error = None
+        db.session.commit()
+        return True
+
+    def record_failure(self, job, error):
+        job.last_error = error[:1000]
+        job.finished_at = datetime.now()
+        if (job.attempts or 0) < (job.max_attempts or 1):
+            job.status = 'pending'
+            job.run_at = datetime.now() + timedelta(seconds=self.app.config['JOBS_BACKOFF'] * 2 ** ((job.attempts or 1) - 1))
+        else:
+            job.status = 'failed'
+            job.run_at = None
+
+
+def init_app(app):
+    """Register the CLI and start the in-process workers on the first request"""
+    configure(app)
+    app.cli.add_command(jobs_cli)
+    state = {'pid': None, 'worker': None}
+    app.extensions['jobs'] = state
+    if app.config['JOBS_INPROCESS_THREADS'] <= 0:
+        return
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_job_worker():
+        if state['pid'] == os.getpid():
+            return
+        with lock:
+            if state['pid'] != os.getpid():
+                state['worker'] = JobWorker(app, threads=app.config['JOBS_INPROCESS_THREADS'])
+                state['worker'].start()
+                state['pid'] = os.getpid()
+
+def notify(app):
+    """Ask the in-process worker to look at the queue now (after the caller's commit)"""
+    state = app.extensions.get('jobs')
+    if state and state['worker']:
+        state['worker'].notify()
+
+def queue_stats(now=None):
+    """Queue depth, latency and recent failures for the admin view"""
+    now = now or datetime.now()
+    counts = {}
+    for name, status, count in db.session.query(Job.name, Job.status, db.func.count(Job.id)).group_by(Job.name, Job.status):
+        counts.setdefault(name, {})[status] = count
+
+    due = db.and_(Job.status == 'pending', db.or_(Job.run_at.is_(None), Job.run_at <= now))
+    oldest = db.session.query(db.func.min(db.func.coalesce(Job.run_at, Job.created_at))).filter(due).scalar()
+
+    recent = db.session.query(Job.created_at, Job.started_at, Job.finished_at) \
+        .filter(Job.status == 'done', Job.finished_at >= now - timedelta(hours=1)) \
+        .order_by(Job.finished_at.desc()).limit(1000).all()
+    waits = [(started - created).total_seconds() for created, started, _ in recent if created and started]
+    runs = [(finished - started).total_seconds() for _, started, finished in recent if started and finished]
+
+    return {
+        'counts': counts,
+        'due': db.session.query(db.func.count(Job.id)).filter(due).scalar(),
+        'oldest_due_seconds': (now - oldest).total_seconds() if oldest else 0,
+        'done_last_hour': len(recent),
+        'avg_wait_seconds': sum(waits) / len(waits) if waits else 0,
+        'avg_run_seconds': sum(runs) / len(runs) if runs else 0,
+        'failed': Job.query.filter(Job.status == 'failed').order_by(Job.finished_at.desc()).limit(20).all(),
+        'schedules': JobSchedule.query.order_by(JobSchedule.name).all(),
+    }
+
+####################################################################
+# Command line: flask --app wsgi jobs worker | enqueue | stats
+
+jobs_cli = AppGroup('jobs', help='Background jobs')
+
+@jobs_cli.command('worker')
+@click.option('--threads', default=2, show_default=True, help='Jobs run in parallel')
+@click.option('--no-scheduler', is_flag=True, help='Do not enqueue the scheduled jobs')
+def worker_command(threads, no_scheduler):
+    """Run jobs until interrupted"""
+    from flask import current_app
+    worker = JobWorker(current_app._get_current_object(), threads=threads, scheduler=not no_scheduler)
+    worker.start()
+    click.echo(f'Job worker {worker.worker_id} running {threads} thread(s), Ctrl+C to stop')
+    try:
+        while not worker.stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        worker.stop()
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', help='JSON keyword arguments')
+@click.option('--priority', type=int)
+def enqueue_command(name, payload, priority):
+    """Add a job to the queue"""
+    if name not in TASKS:
+        raise click.BadParameter(f"unknown task, expected one of: {', '.join(sorted(TASKS))}", param_hint='NAME')
+    job = enqueue(name, json.loads(payload), priority=priority)
+    db.session.commit()
+    click.echo(f'Job {job.id} ({name}) enqueued')
+
+@jobs_cli.command('stats')
+def stats_command():
+    """Print the queue depth and latency"""
+    stats = queue_stats()
+    for name, counts in sorted(stats['counts'].items()):
+        click.echo(f"{name:<30} " + ' '.join(f'{status}={count}' for status, count in sorted(counts.items())))
+    click.echo(f"due: {stats['due']}, oldest due: {stats['oldest_due_seconds']:.0f}s, "
+               f"done last hour: {stats['done_last_hour']}, avg wait: {stats['avg_wait_seconds']:.1f}s, "
+               f"avg run: {stats['avg_run_seconds']:.1f}s")
+
+####################################################################
+# Built-in tasks
+
+@task('rebuild_attendance', priority=-10)
+def rebuild_attendance():
+    from school_project import attendance
+    attendance.rebuild_all()
+
+@task('refresh_student_counts', priority=-10)
+def refresh_student_counts():
+    from school_project import majors, refcache
+    majors.refresh_student_counts(db.session.connection())
+    refcache.invalidate('majors')
+
+@task('purge_jobs', priority=-20)
+def purge_jobs(days=None):
+    from flask import current_app
+    days = current_app.config['JOBS_KEEP_DAYS'] if days is None else days
+    Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < datetime.now() - timedelta(days=days)) \
+        .delete(synchronize_session=False)
+
+@task('generate_dues')
+def generate_dues(month=None, amount=None):
+    from school_project import dues
+    dues.generate_dues(dues.parse_month(month) if month else None, amount)
+
+@task('archive_academic_years', priority=-20)
+def archive_academic_years(before=None):
+    from school_project import archive
+    archive.archive_before(before)
+
+@task('purge_expired', priority=-20)
+def purge_expired():
+    from school_project import archive
+    archive.purge_expired()
+
+@task('sweep_orphans', priority=-20)
+def sweep_orphans():
+    from school_project import integrity
+    integrity.sweep_orphans()
@@ -0,0 +1,171 @@
+####################################################################
+###############        Structured logging           ################
+####################################################################
+# Request threads never write to stdout themselves: records go to a
+# bounded in-memory queue (dropped, and counted, if it is ever full)
+# and a listener thread formats them as one JSON object per line.
+# Every record carries the request id (X-Request-ID, or a generated
+# one sent back in the response) and the id of the logged-in user; each
+# request also ends with an access record holding its duration.
+#
+# LOG_LEVEL sets the level (INFO by default). DEBUG and INFO records
+# can be sampled with LOG_SAMPLE_DEBUG / LOG_SAMPLE_INFO (a fraction
+# between 0 and 1, 0.01 and 1 by default); warnings and errors are
+# always kept. LOG_ACCESS=false turns the access records off.
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+
+from school_project.serialization import dumps
+
+QUEUE_SIZE = 10000
+REQUEST_ID_HEADER = 'X-Request-ID'
+# attributes of every LogRecord, the others come from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+logger = logging.getLogger(__name__)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        payload = dumps(entry)
+        return payload.decode() if isinstance(payload, bytes) else payload
+
+
+class ContextFilter(logging.Filter):
+    """Add the request and user ids, runs in the thread that logs"""
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            user = g.get('_login_user')  # set by Flask-Login once current_user was used
+            if user is not None and getattr(user, 'is_authenticated', False):
+                record.user_id = user.id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates  # levelno -> fraction of the records kept
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def prepare(self, record):
+        # only cheap work here: render the message and the traceback,
+        # the listener thread does the JSON formatting and the writing
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+class _State:
+    handler = None
+    listener = None
+    output = None
+    pid = None
+
+_state = _State()
+_lock = threading.Lock()
+
+
+def _start_listener():
+    """(Re)start the listener of this process with a fresh queue"""
+    with _lock:
+        if _state.pid == os.getpid():
+            return
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _state.handler.queue = log_queue
+        _state.listener = logging.handlers.QueueListener(log_queue, _state.output, respect_handler_level=False)
+        _state.listener.start()
+        _state.pid = os.getpid()
+
+def _after_fork():
+    # the listener thread does not survive gunicorn's --preload fork
+    global _lock
+    _state.pid = None
+    _lock = threading.Lock()
+    _start_listener()
+
+def _stop_listener():
+    if _state.listener is not None and _state.pid == os.getpid():
+        _state.listener.stop()
+        _state.pid = None
+
+def setup():
+    """Send every log record of the process through the queue, once"""
+    if _state.handler is not None:
+        return
+    _state.output = logging.StreamHandler()
+    _state.output.setFormatter(JsonFormatter())
+    _state.handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _state.handler.addFilter(SamplingFilter({
+        logging.DEBUG: float(os.environ.get('LOG_SAMPLE_DEBUG', 0.01)),
+        logging.INFO: float(os.environ.get('LOG_SAMPLE_INFO', 1)),
+    }))
+    _state.handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_state.handler)
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    _start_listener()
+    os.register_at_fork(after_in_child=_after_fork)
+    atexit.register(_stop_listener)
+
+def init_app(app):
+    setup()
+    app.config.setdefault('LOG_ACCESS', os.environ.get('LOG_ACCESS', 'true').lower() in ('1', 'true', 'yes'))
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def end_request_log(response):
+        response.headers.setdefault(REQUEST_ID_HEADER, g.get('request_id', ''))
+        if app.config['LOG_ACCESS'] and 'request_started' in g:
+            logger.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+            })
+        return response
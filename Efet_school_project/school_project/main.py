@@ -1,19 +1,25 @@
 ####################################################################
 ###############          Import packages         ###################
 ####################################################################
-from flask import Blueprint, render_template, flash, g, request, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, flash, g, request, redirect, url_for, jsonify, current_app, Response
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from school_project import create_app
 from school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog
-from school_project.tools import get_all_payments, get_student_infos, get_all_grades, get_all_majors, get_all_students, get_user_messages, get_all_users, get_student_absence, get_grades_mean, get_all_subjects, get_all_teachers, get_all_absence, get_one_payment
+from school_project.tools import get_all_payments, get_student_infos, get_all_grades, get_all_majors, get_all_students, get_user_messages, get_all_users, get_student_absence, get_grades_mean, get_all_subjects, get_all_teachers, get_all_absence, get_one_payment, get_users_data, USER_DATA_FIELDS, get_admin_notifications, get_unread_notifications, get_pending_users
+from school_project import attendance, search, outbox, events, refcache, jobs, archive, gradebook, registrations, cache, singleflight
+from school_project.serialization import json_response
+from school_project.enums import invalid_codes
+from sqlalchemy.exc import IntegrityError
 import sqlite3
 from school_project import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from fpdf import FPDF
 from pathlib import Path
 from functools import wraps
 import os
+import time
+import logging
 
 def require_approved_user(f):
     """Decorator to require that user has been approved by admin"""
@@ -29,6 +35,7 @@ def require_approved_user(f):
 ####################################################################
 # our main blueprint
 main = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 ####################################################################
 @login_required
@@ -36,7 +43,7 @@ def pending_users():
     if current_user.role not in ['admin', 'owner']:
         return redirect('/forbidden')
     
-    pending_users = User.query.filter_by(status='pending').all()
+    pending_users = get_pending_users()
     return render_template('pending_users.html', users=pending_users)
 
 ####################################################################
@@ -50,7 +57,7 @@ def all_users():
     if current_user.role != 'owner':
         return redirect('/forbidden')
     
-    all_users = User.query.all()
+    all_users = get_all_users()
     majors = Major.query.all()
     current_date = datetime.now().strftime('%Y-%m-%d')
     
@@ -63,7 +70,7 @@ def admin_all_users():
     if current_user.role != 'owner':
         return redirect('/forbidden')
     
-    all_users = User.query.all()
+    all_users = get_all_users()
     majors = Major.query.all()
     current_date = datetime.now().strftime('%Y-%m-%d')
     
@@ -117,6 +124,11 @@ def add_user():
     major = request.form.get('major')
     register_date = request.form.get('register_date')
     
+    invalid = invalid_codes(User, role=role, status=status, gender=gender)
+    if invalid:
+        flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+        return redirect(url_for('main.all_users'))
+    
     # Check if email already exists
     if User.query.filter_by(email=email).first():
         flash('Email déjà utilisé', 'error')
@@ -172,6 +184,11 @@ def edit_user():
     year = request.form.get('year')
     register_date = request.form.get('register_date')
     
+    invalid = invalid_codes(User, role=role, status=status, gender=gender)
+    if invalid:
+        flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+        return redirect(url_for('main.all_users'))
+    
     user = User.query.get(user_id)
     if not user:
         flash('Utilisateur non trouvé', 'error')
@@ -273,8 +290,7 @@ def change_user_role():
     new_role = request.form.get('role')
     
     # Validate role
-    valid_roles = ['owner', 'admin', 'teacher', 'student', 'visiteur']
-    if new_role not in valid_roles:
+    if not new_role or invalid_codes(User, role=new_role):
         flash('Rôle invalide', 'error')
         return redirect(url_for('main.all_users'))
     
@@ -295,6 +311,41 @@ def change_user_role():
     flash(f'Rôle de {user.name} changé à {new_role} avec succès', 'success')
     return redirect(url_for('main.all_users'))
 
+# Who each role may look up through /search/users: approved users of these
+# roles, like the recipient pickers. The administration searches everyone.
+SEARCH_SCOPES = {
+    'student': ('student', 'teacher', 'admin'),
+    'teacher': ('student', 'teacher', 'admin'),
+}
+
+@main.route('/search/users', methods=['GET'])
+@login_required
+@require_approved_user
+def search_users():
+    """Typeahead endpoint used by the recipient pickers and admin screens"""
+    query = request.args.get('q', '').strip()
+    role = request.args.get('role') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    
+    if current_user.role in ['admin', 'owner']:
+        results = search.search_users(query, role=role, limit=limit)
+    else:
+        results = search.search_users(query, role=role, limit=limit, roles=SEARCH_SCOPES.get(current_user.role, ()))
+    
+    # Contact details are only exposed to the administration
+    is_admin = current_user.role in ['admin', 'owner']
+    users = []
+    for row in results:
+        user_data = {"id": row.id, "name": row.name, "role": row.role, "major": row.major}
+        if is_admin:
+            user_data.update({"email": row.email, "registration": row.registration, "phone": row.phone})
+        users.append(user_data)
+    
+    return jsonify({"success": True, "users": users})
+
 ####################################################################
 # Continue with the rest of the routes
 ####################################################################
@@ -304,6 +355,7 @@ def forbidden():
 
 ####################################################################
 @main.route('/') # home page
+@cache.cached_page
 def index():
     return render_template('index.html')
 
@@ -313,30 +365,37 @@ def health():
     return {'status': 'healthy', 'service': 'EFET School Management System'}, 200
 
 @main.route('/about_us') # about us page
+@cache.cached_page
 def about_us():
     return render_template('about_us.html')
 
 @main.route('/poles/commerce') # Pôle Commerce page
+@cache.cached_page
 def pole_commerce():
     return render_template('pole_commerce.html')
 
 @main.route('/poles/sante') # Pôle Santé page
+@cache.cached_page
 def pole_sante():
     return render_template('pole_sante.html')
 
 @main.route('/poles/finance') # Pôle Finance page
+@cache.cached_page
 def pole_finance():
     return render_template('pole_finance.html')
 
 @main.route('/poles/informatique') # Pôle Informatique page
+@cache.cached_page
 def pole_informatique():
     return render_template('pole_informatique.html')
 
 @main.route('/poles/logistique') # Pôle Logistique page
+@cache.cached_page
 def pole_logistique():
     return render_template('pole_logistique.html')
 
 @main.route('/poles/management') # Pôle Management page
+@cache.cached_page
 def pole_management():
     return render_template('pole_management.html')
 
@@ -382,14 +441,68 @@ def sendMessage():
         
         db.session.add(message)
         db.session.commit()
+        events.publish('new_message', {
+            'id': message.id,
+            'from_id': sender_id,
+            'from': current_user.name,
+            'priority': priority,
+            'preview': message_content[:100],
+        }, user_ids=[message.msg_to, sender_id])
         flash('Message envoyé avec succès!', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Erreur lors de l\'envoi du message.', 'error')
-        print(f"Error sending message: {e}")
+        logger.exception("Error sending message: %s", e)
     
     return redirect(url_for('main.dashboard'))
 
+@main.route('/search/messages', methods=['GET'])
+@login_required
+@require_approved_user
+def search_messages():
+    """Full-text search restricted to the conversations of the current user"""
+    query = request.args.get('q', '').strip()
+    priority = request.args.get('priority') or None
+    is_read = request.args.get('is_read')
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = max(1, min(int(request.args.get('per_page', 20)), 100))
+        date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid parameters'}), 400
+    
+    if priority and priority not in ['normal', 'important', 'urgent']:
+        return jsonify({'success': False, 'message': 'Invalid priority'}), 400
+    if is_read in ['true', '1']:
+        is_read = True
+    elif is_read in ['false', '0']:
+        is_read = False
+    else:
+        is_read = None
+    
+    # date_to is inclusive for the caller
+    if date_to:
+        date_to = date_to + timedelta(days=1)
+    
+    rows, has_more = search.search_messages(current_user.id, query, priority=priority, is_read=is_read,
+                                            date_from=date_from, date_to=date_to, page=page, per_page=per_page)
+    messages = [{
+        'id': row.mid,
+        'content': row.content,
+        'date_sent': str(row.date_sent) if row.date_sent else None,
+        'priority': row.priority,
+        'is_read': bool(row.is_read),
+        'msg_from': row.msg_from,
+        'msg_to': row.msg_to,
+        'sent': row.msg_from_id == current_user.id,
+    } for row in rows]
+    
+    return jsonify({'success': True, 'messages': messages, 'page': page, 'has_more': has_more})
+
 @main.route('/markMessageRead', methods=['POST'])
 @login_required
 @require_approved_user
@@ -410,12 +523,91 @@ def markMessageRead():
         
         message.is_read = True
         db.session.commit()
+        events.publish('message_read', {'id': message.id}, user_ids=[message.msg_from, message.msg_to])
         
         return jsonify({'success': True, 'message': 'Message marked as read'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Error updating message'}), 500
 
+####################################################################
+# Live updates: Server-Sent Events with a long-poll fallback
+####################################################################
+SSE_MAX_DURATION = 300  # seconds, EventSource reconnects on its own afterwards
+SSE_HEARTBEAT = 15
+SSE_MAX_STREAMS_ASYNC = 200  # default caps per process, see EVENTS_MAX_STREAMS
+SSE_MAX_STREAMS_THREADED = 2
+POLL_MAX_WAIT = 25  # only held under an async worker, threaded workers answer at once
+
+def _sse_enabled():
+    enabled = current_app.config.get('EVENTS_SSE_ENABLED')
+    return events.async_worker() if enabled is None else enabled
+
+def _max_streams():
+    limit = current_app.config.get('EVENTS_MAX_STREAMS')
+    if limit is not None:
+        return limit
+    return SSE_MAX_STREAMS_ASYNC if events.async_worker() else SSE_MAX_STREAMS_THREADED
+
+def _last_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return events.bus.last_id
+
+@main.route('/events/stream')
+@login_required
+@require_approved_user
+def events_stream():
+    if not _sse_enabled():
+        # 204 tells EventSource to stop reconnecting, the client falls back to /events/poll
+        return '', 204
+    if not events.open_stream(_max_streams()):
+        # the stream fails and closes, the client falls back to /events/poll as well
+        return 'Too many open streams', 503
+    
+    # the generator outlives the request context, capture what it needs
+    user_id, role = current_user.id, current_user.role
+    last_id = _last_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    
+    def stream(last_id):
+        yield 'retry: 5000\n\n'
+        deadline = time.monotonic() + SSE_MAX_DURATION
+        while time.monotonic() < deadline:
+            batch = events.bus.wait(last_id, user_id, role, timeout=SSE_HEARTBEAT)
+            if not batch:
+                yield ': keep-alive\n\n'
+                continue
+            for event in batch:
+                last_id = event.id
+                yield event.to_sse()
+    
+    response = Response(stream(last_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # called by the WSGI server when the client leaves or the stream ends
+    response.call_on_close(events.close_stream)
+    return response
+
+@main.route('/events/poll')
+@login_required
+@require_approved_user
+def events_poll():
+    """Fallback for clients or workers that cannot keep a stream open.
+    Answers immediately; under an async worker ?wait= may hold it up to POLL_MAX_WAIT seconds."""
+    last_id = _last_event_id(request.args.get('since'))
+    max_wait = POLL_MAX_WAIT if events.async_worker() else 0
+    try:
+        wait = max(0.0, min(float(request.args.get('wait', 0)), max_wait))
+    except ValueError:
+        wait = 0.0
+    
+    batch = events.bus.wait(last_id, current_user.id, current_user.role, timeout=wait)
+    if batch:
+        last_id = batch[-1].id
+    elif last_id > events.bus.last_id:
+        last_id = 0  # ids restarted with the process
+    return jsonify({'success': True, 'events': [event.to_dict() for event in batch], 'last_id': last_id})
+
 ####################################################################
 @main.route('/profile') # profile page that return 'profile'
 @login_required
@@ -438,6 +630,11 @@ def updateProfile():
     register_date = request.form.get('register_date')
     year = request.form.get('year')
 
+    invalid = invalid_codes(User, gender=gender)
+    if invalid:
+        flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+        return redirect(url_for('main.profile'))
+
     register_date_obj = datetime.strptime(register_date, '%Y-%m-%d')
 
     user = User.query.filter_by(id=user_id).first()
@@ -483,15 +680,14 @@ def upload_file():
 @main.route('/dashboard')
 @login_required
 def dashboard():
-    # Print user information for debugging
-    print(f"User: {current_user.name}, Role: {current_user.role}, Status: {current_user.status}")
+    logger.debug("dashboard", extra={'role': current_user.role, 'status': current_user.status})
     
     # Check if user has pending status or visitor role
     if current_user.role == 'visiteur' or current_user.status == 'pending':
         flash('Votre compte est en attente d\'approbation. L\'administration vous contactera dans les 72 heures pour confirmer votre situation.', 'warning')
         return render_template('pending_approval.html')
     
-    messages = get_user_messages(current_user.id)
+    messages = get_user_messages(current_user.id, include_archived=archive.requested())
     
     # Owner role should have the same access as admin (highest level access)
     if current_user.role == 'admin' or current_user.role == 'owner':
@@ -500,8 +696,9 @@ def dashboard():
         all_subject = get_all_subjects()
         all_teacher = get_all_teachers()
         # Get pending notifications for admin
-        pending_notifications = AdminNotification.query.filter_by(is_read=False).order_by(AdminNotification.created_at.desc()).all()
-        return render_template('dashboard.html', users=students, majors=majors, messages=messages, all_subject=all_subject, all_teacher=all_teacher, notifications=pending_notifications)
+        pending_notifications = get_unread_notifications()
+        return render_template('dashboard.html', users=students, majors=majors, messages=messages, all_subject=all_subject, all_teacher=all_teacher, notifications=pending_notifications,
+                               max_batch_ids=MAX_BATCH_IDS)
     elif current_user.role == 'teacher':
         all_users = get_all_users()
         students = get_all_students()
@@ -511,10 +708,10 @@ def dashboard():
         return render_template('dashboard_teacher.html', student_infos=student_infos, messages=messages, students=students, absences=all_absence, users=all_users, majors=majors)
     # if you are a student: go to student dashboard (see grades, messages, ..)
     elif current_user.role == 'student':
-        all_users = get_all_students()
+        # recipients are looked up through /search/users, no need to embed every student
         student_absence = get_student_absence(current_user.id)
         student_infos = get_student_infos(current_user.id)
-        return render_template('dashboard_student.html', student_infos=student_infos, messages=messages, users=all_users, absences=student_absence)
+        return render_template('dashboard_student.html', student_infos=student_infos, messages=messages, absences=student_absence)
     else:
         # Fallback for users with undefined roles
         flash('Role utilisateur non reconnu. Veuillez contacter l\'administrateur.', 'error')
@@ -525,9 +722,10 @@ def dashboard():
 @main.route('/consultAbsence/<user_id>')
 @login_required
 def consultAbsence(user_id):
-    absence = get_student_absence(user_id)
+    include_archived = archive.requested()
+    absence = get_student_absence(user_id, include_archived)
     student_infos = get_student_infos(user_id)
-    return render_template('absence.html', absences=absence, student_infos=student_infos)
+    return render_template('absence.html', absences=absence, student_infos=student_infos, include_archived=include_archived)
 
 @main.route('/addAbsence', methods=['GET', 'POST'])
 @login_required
@@ -540,9 +738,16 @@ def addAbsence():
         justified = request.form.get('justified')
         details = request.form.get('details')
 
+        invalid = invalid_codes(Absence, justified=justified)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(url_for('main.dashboard'))
+
         date_absence_obj = datetime.strptime(date_absence, '%Y-%m-%dT%H:%M')
         new_absence = Absence(student_id=student_id, date_absence=date_absence_obj, justified=justified, details=details)
         db.session.add(new_absence)
+        db.session.flush()
+        attendance.refresh_day(student_id, date_absence_obj)
         db.session.commit()
         return redirect(url_for('main.dashboard'))
     else:
@@ -551,9 +756,16 @@ def addAbsence():
         justified = request.form.get('justified')
         details = request.form.get('details')
 
+        invalid = invalid_codes(Absence, justified=justified)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(f'consultAbsence/{user_id}')
+
         date_absence_obj = datetime.strptime(date_absence, '%Y-%m-%dT%H:%M')
         new_absence = Absence(student_id=user_id, date_absence=date_absence_obj, justified=justified, details=details)
         db.session.add(new_absence)
+        db.session.flush()
+        attendance.refresh_day(user_id, date_absence_obj)
         db.session.commit()
         return redirect(f'consultAbsence/{user_id}')
 
@@ -566,7 +778,12 @@ def deleteAbsence():
         user_id = current_user.id
         absence_id = request.form.get('absence_id')
 
-        grade = Absence.query.filter(Absence.id == absence_id).delete()
+        absence_row = Absence.query.filter(Absence.id == absence_id).first()
+        if absence_row:
+            student_id, date_absence = absence_row.student_id, absence_row.date_absence
+            db.session.delete(absence_row)
+            db.session.flush()
+            attendance.refresh_day(student_id, date_absence)
         db.session.commit()
         return redirect(f'consultAbsence/{user_id}')
 
@@ -582,34 +799,110 @@ def editAbsence():
         justified = request.form.get('justified')
         details = request.form.get('details')
 
+        invalid = invalid_codes(Absence, justified=justified)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(f'consultAbsence/{user_id}')
+
         date_absence_obj = datetime.strptime(date_absence, '%Y-%m-%dT%H:%M')
 
         absence_row = Absence.query.filter(Absence.id == absence_id).first()
+        old_date = absence_row.date_absence
         absence_row.justified = justified
         absence_row.date_absence = date_absence_obj
         absence_row.details = details
 
+        db.session.flush()
+        attendance.refresh_day(absence_row.student_id, date_absence_obj)
+        if old_date and old_date.date() != date_absence_obj.date():
+            attendance.refresh_day(absence_row.student_id, old_date)
         db.session.commit()
         return redirect(f'consultAbsence/{user_id}')
 
+@main.route('/attendanceReport/<major_name>', methods=['GET'])
+@login_required
+def attendance_report(major_name):
+    if current_user.role not in ['admin', 'owner', 'teacher']:
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+    
+    term = request.args.get('term')
+    try:
+        threshold = float(request.args.get('threshold', 0.2))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid threshold"}), 400
+    
+    try:
+        report = attendance.major_report(major_name, term=term, threshold=threshold)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid term"}), 400
+    return jsonify({"success": True, "report": report})
+
+@main.route('/rollCall', methods=['GET', 'POST'])
+@login_required
+def roll_call():
+    """Attendance of a whole major for one session: the form (or a JSON body
+    {"major", "session", "absences": [{"student_id", "justified", "details"}]})
+    lists the absent students, sending it again replaces the previous roll call"""
+    if current_user.role not in ['admin', 'owner', 'teacher']:
+        return redirect('/forbidden')
+    
+    if request.method == 'GET':
+        major_name = request.args.get('major')
+        session = request.args.get('session') or datetime.now().strftime('%Y-%m-%dT%H:00')
+        students, recorded = [], {}
+        if major_name:
+            students = attendance.roster(major_name)
+            try:
+                recorded = attendance.session_absences(major_name, datetime.strptime(session, attendance.SESSION_FORMAT))
+            except ValueError:
+                flash('Séance invalide', 'error')
+        return render_template('roll_call.html', majors=get_all_majors(), major_name=major_name, session=session,
+                               students=students, recorded=recorded)
+    
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        major_name, session, entries = body.get('major'), body.get('session'), body.get('absences') or []
+    else:
+        major_name, session = request.form.get('major'), request.form.get('session')
+        entries = [{'student_id': student_id,
+                    'justified': request.form.get(f'justified_{student_id}'),
+                    'details': request.form.get(f'details_{student_id}')}
+                   for student_id in request.form.getlist('absent')]
+    try:
+        result = attendance.roll_call(major_name, session, entries)
+    except attendance.RollCallError as e:
+        if request.is_json:
+            return json_response({"success": False, "errors": e.errors}, 400)
+        for error in e.errors:
+            flash(error, 'error')
+        return redirect(url_for('main.roll_call', major=major_name, session=session))
+    
+    logger.info("Roll call recorded", extra={'major': major_name, 'by': current_user.id, **result})
+    if request.is_json:
+        return json_response({"success": True, **result})
+    flash(f"Appel enregistré : {result['absent']} absent(s) sur {result['students']} étudiant(s)", 'success')
+    return redirect(url_for('main.roll_call', major=major_name, session=result['session']))
+
 ####################################################################
 
 @main.route('/consultGrades/<user_id>')
 @login_required
 def consultGrades(user_id):
+    include_archived = archive.requested()
     all_subject = get_all_subjects()
-    all_grades = get_all_grades(user_id)
+    all_grades = get_all_grades(user_id, include_archived)
     student_infos = get_student_infos(user_id)
-    return render_template('grades.html', all_grades=all_grades, student_infos=student_infos, all_subject=all_subject)
+    return render_template('grades.html', all_grades=all_grades, student_infos=student_infos, all_subject=all_subject, include_archived=include_archived)
 
 @main.route('/consultGradesStudent/<user_id>')
 @login_required
 def consultGradesStudent(user_id):
     if int(user_id) == current_user.id or current_user.role == 'admin':
-        all_grades = get_all_grades(user_id)
+        include_archived = archive.requested()
+        all_grades = get_all_grades(user_id, include_archived)
         student_infos = get_student_infos(user_id)
-        grades_mean = get_grades_mean(user_id)
-        return render_template('grades_student.html', all_grades=all_grades, student_infos=student_infos, grades_mean=grades_mean)
+        grades_mean = get_grades_mean(user_id, include_archived)
+        return render_template('grades_student.html', all_grades=all_grades, student_infos=student_infos, grades_mean=grades_mean, include_archived=include_archived)
     else:
         return redirect('/forbidden')
 
@@ -640,6 +933,7 @@ def deleteGrade():
         grade_id = request.form.get('grade_id')
 
         grade = Grade.query.filter(Grade.id == grade_id).delete()
+        refcache.invalidate('grades')  # bulk delete, not seen by the session
         db.session.commit()
         return redirect(f'consultGrades/{user_id}')
 
@@ -665,6 +959,34 @@ def editGrade():
         db.session.commit()
         return redirect(f'consultGrades/{user_id}')
 
+@main.route('/gradebook', methods=['GET', 'POST'])
+@login_required
+def gradebook_view():
+    """Grades of one subject for a whole major, edited as a grid. POST takes a
+    JSON body {"subject", "major", "changes": [{"student_id", "grade_date", "grade", "id"}]}"""
+    if current_user.role not in ['admin', 'owner', 'teacher']:
+        return redirect('/forbidden')
+    
+    if request.method == 'GET':
+        subject, major_name = request.args.get('subject'), request.args.get('major')
+        students, dates, cells = [], [], {}
+        if subject and major_name:
+            students, dates, cells = gradebook.sheet(subject, major_name)
+        return render_template('gradebook.html', subjects=get_all_subjects(), majors=get_all_majors(), subject=subject,
+                               major_name=major_name, students=students, dates=dates, cells=cells)
+    
+    body = request.get_json(silent=True) or {}
+    try:
+        result = gradebook.apply_changes(body.get('subject'), body.get('major'), body.get('changes') or [])
+    except gradebook.GradebookError as e:
+        return json_response({"success": False, "errors": e.errors}, 400)
+    
+    logger.info("Gradebook saved", extra={'subject': body.get('subject'), 'major': body.get('major'), 'by': current_user.id,
+                                          'inserted': result['inserted'], 'updated': result['updated'], 'deleted': result['deleted']})
+    if result['means']:
+        events.publish('grades_updated', {'subject': body.get('subject')}, user_ids=result['means'])
+    return json_response({"success": True, **result})
+
 ####################################################################
 
 @main.route('/addMajor', methods=['GET', 'POST'])
@@ -689,7 +1011,13 @@ def deleteMajor():
         return redirect('/forbidden')
     else:
         major_id = request.form.get('major_id')
+        # the students keep their major name but are no longer linked to it
+        unlinked = [row.id for row in User.query.with_entities(User.id).filter(User.major_id == major_id)]
+        User.query.filter(User.id.in_(unlinked)).update({'major_id': None}, synchronize_session=False)
         major = Major.query.filter(Major.id == major_id).delete()
+        # bulk UPDATE/DELETE, not seen by the session nor by the flush hooks
+        refcache.invalidate('majors')
+        cache.invalidate_after_commit(db.session(), 'users', unlinked)
         db.session.commit()
         return redirect('/dashboard')
 
@@ -721,9 +1049,9 @@ def addSubject():
         return redirect('/forbidden')
     else:
         subject_name = request.form.get('subject_name')
-        teacher_id = request.form.get('prof_id')
+        teacher_id = request.form.get('prof_id') or None  # '' (no teacher) breaks fk_subject_id_prof
 
-        print("===> ", teacher_id)
+        logger.debug("addSubject", extra={'teacher_id': teacher_id})
 
         if subject_name != None and subject_name != '':
             new_subject = Subject(name=subject_name, id_prof=teacher_id)
@@ -739,6 +1067,7 @@ def deleteSubject():
     else:
         subject_id = request.form.get('subject_id')
         subject = Subject.query.filter(Subject.id == subject_id).delete()
+        refcache.invalidate('subjects')  # bulk delete, not seen by the session
         db.session.commit()
         return redirect('/dashboard')
 
@@ -750,7 +1079,7 @@ def editSubject():
     else:
         subject_id = request.form.get('subject_id')
         subject_name = request.form.get('subject_name')
-        teacher_id = request.form.get('prof_id')
+        teacher_id = request.form.get('prof_id') or None  # '' (no teacher) breaks fk_subject_id_prof
 
         subject_row = Subject.query.filter(Subject.id == subject_id).first()
         subject_row.name = subject_name
@@ -781,11 +1110,20 @@ def addPayment():
         status = request.form.get('status')
         type = request.form.get('type')
 
+        invalid = invalid_codes(Payment, status=status, type=type)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(f'consultPayments/{user_id}')
+
         month_paid_obj = datetime.strptime(month_paid, "%Y-%m")
         payment_date_obj = datetime.strptime(payment_date, "%Y-%m-%d")
         new_payment = Payment(student_id=user_id, month_paid=month_paid_obj, payment_date=payment_date_obj, amount=amount, status=status, type=type)
         db.session.add(new_payment)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:  # ux_payment_dues: one fees payment per month
+            db.session.rollback()
+            flash('Des frais existent déjà pour ce mois', 'error')
 
         return redirect(f'consultPayments/{user_id}')
         #return render_template('payments.html', all_payments=all_payments)
@@ -818,6 +1156,11 @@ def editPayment():
         status = request.form.get('status')
         type = request.form.get('type')
 
+        invalid = invalid_codes(Payment, status=status, type=type)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(f'consultPayments/{user_id}')
+
         month_paid_obj = datetime.strptime(month_paid, "%Y-%m")
         payment_date_obj = datetime.strptime(payment_date, "%Y-%m-%d")
 
@@ -828,7 +1171,11 @@ def editPayment():
         payment.status = status
         payment.type = type
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:  # ux_payment_dues: one fees payment per month
+            db.session.rollback()
+            flash('Des frais existent déjà pour ce mois', 'error')
         return redirect(f'consultPayments/{user_id}')
 
 @main.route('/generatePdfPayment/<user_id>/<payment_id>', methods=['GET', 'POST'])
@@ -879,12 +1226,16 @@ def addStudent():
         major = request.form.get('major')
         gender = request.form.get('gender')
         role = request.form.get('role')
+        invalid = invalid_codes(User, role=role, gender=gender)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(url_for('main.dashboard'))
         user = User.query.filter_by(email=email).first() # if this returns a user, then the email already exists in database
         if user: # if a user is found, we want to redirect back to
             flash('Email address already exists')
             results = get_all_students()
             return render_template('dashboard.html', users=results)
-        new_user = User(email=email, name=name, password=generate_password_hash(password, method='pbkdf2:sha256'), role=role, age=age, address=address, registration=registration, gender=gender)
+        new_user = User(email=email, name=name, password=generate_password_hash(password, method='pbkdf2:sha256'), role=role, age=age, address=address, registration=registration, gender=gender, major=major)
         db.session.add(new_user)
         db.session.commit()
 
@@ -926,6 +1277,11 @@ def editStudent():
         register_date = request.form.get('register_date')
         role = request.form.get('role')
 
+        invalid = invalid_codes(User, role=role, gender=gender)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(url_for('main.dashboard'))
+
         user = User.query.filter_by(id=user_id).first()
         user.email = email
         user.name = name
@@ -969,6 +1325,11 @@ def editTeacher():
         major = request.form.get('major')
         current_year = request.form.get('current_year')
         
+        invalid = invalid_codes(User, role=role)
+        if invalid:
+            flash(f"Valeur invalide : {', '.join(invalid)}", 'error')
+            return redirect(url_for('main.dashboard'))
+        
         user = User.query.filter_by(id=user_id).first()
         if user:
             user.email = email
@@ -1026,6 +1387,74 @@ def get_student_data(student_id):
     
     return jsonify({"success": True, "student": student_data})
 
+MAX_BATCH_IDS = 500
+
+@main.route('/get_students_data', methods=['GET', 'POST'])
+@login_required
+def get_students_data():
+    """Batch version of get_student_data: ?ids=1,2,3&fields=name,email
+    (or a JSON body {"ids": [...], "fields": [...]}), one query for all ids"""
+    if current_user.role not in ['admin', 'owner', 'teacher']:
+        return json_response({"success": False, "message": "Unauthorized"}, 403)
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        ids = body.get('ids') or []
+        fields = body.get('fields') or list(USER_DATA_FIELDS)
+    else:
+        ids = [value for value in request.args.get('ids', '').split(',') if value]
+        fields = [value for value in request.args.get('fields', '').split(',') if value] or list(USER_DATA_FIELDS)
+    
+    try:
+        ids = sorted({int(user_id) for user_id in ids})
+    except (TypeError, ValueError):
+        return json_response({"success": False, "message": "Invalid ids"}, 400)
+    if len(ids) > MAX_BATCH_IDS:
+        return json_response({"success": False, "message": f"At most {MAX_BATCH_IDS} ids per request"}, 400)
+    unknown_fields = [field for field in fields if field not in USER_DATA_FIELDS]
+    if unknown_fields:
+        return json_response({"success": False, "message": f"Unknown fields: {', '.join(map(str, unknown_fields))}"}, 400)
+    
+    students = get_users_data(ids, fields) if ids else []
+    found = {student['id'] for student in students}
+    return json_response({"success": True, "students": students, "missing": [user_id for user_id in ids if user_id not in found]})
+
+@main.route('/admin/jobs')
+@login_required
+def admin_jobs():
+    if current_user.role not in ['admin', 'owner']:
+        return redirect('/forbidden')
+    
+    return render_template('admin_jobs.html', stats=jobs.queue_stats(), tasks=sorted(jobs.TASKS))
+
+@main.route('/admin/cache')
+@login_required
+def admin_cache():
+    if current_user.role not in ['admin', 'owner']:
+        return redirect('/forbidden')
+    
+    # hit ratios and flights are counted per process, the entries are shared by the workers
+    app_cache = cache.get_cache()
+    return json_response({"success": True, "backend": app_cache.backend.name, "entries": app_cache.backend.size(),
+                          "stats": app_cache.stats(), "flights": singleflight.stats()})
+
+@main.route('/admin/jobs/enqueue', methods=['POST'])
+@login_required
+def admin_enqueue_job():
+    if current_user.role not in ['admin', 'owner']:
+        return redirect('/forbidden')
+    
+    name = request.form.get('name')
+    if name not in jobs.TASKS:
+        flash('Tâche inconnue', 'error')
+        return redirect(url_for('main.admin_jobs'))
+    
+    jobs.enqueue(name)
+    db.session.commit()
+    jobs.notify(current_app)
+    flash(f'Tâche {name} ajoutée à la file', 'success')
+    return redirect(url_for('main.admin_jobs'))
+
 # Admin routes for user management
 @main.route('/admin/notifications')
 @login_required
@@ -1033,16 +1462,10 @@ def admin_notifications():
     if current_user.role not in ['admin', 'owner']:
         return redirect('/forbidden')
     
-    # Get all notifications with user information
-    notifications = AdminNotification.query.order_by(AdminNotification.created_at.desc()).all()
-    
-    # Fetch users for each notification and attach them to the notification objects
-    for notification in notifications:
-        user = User.query.get(notification.user_id)
-        # Set the user attribute for all notifications (will be None if user doesn't exist)
-        notification.user = user
+    # Get all notifications with the name of their user (None if the user doesn't exist)
+    notifications = get_admin_notifications()
     
-    return render_template('admin_notifications.html', notifications=notifications)
+    return render_template('admin_notifications.html', notifications=notifications, majors=get_all_majors())
 
 @main.route('/admin/approve_user', methods=['POST'])
 @login_required
@@ -1052,6 +1475,9 @@ def approve_user():
     
     user_id = request.form.get('user_id')
     new_role = request.form.get('role')  # student or teacher
+    if new_role not in registrations.APPROVABLE_ROLES:
+        flash('Rôle invalide', 'error')
+        return redirect(url_for('main.admin_notifications'))
     
     user = User.query.get(user_id)
     if user:
@@ -1066,6 +1492,8 @@ def approve_user():
             notification.resolved_by = current_user.id
         
         db.session.commit()
+        events.publish('registration_resolved', {'user_id': user.id, 'name': user.name, 'status': 'approved', 'role': new_role},
+                       user_ids=[user.id], roles=events.ADMIN_ROLES)
         flash(f'Utilisateur {user.name} approuvé avec le rôle {new_role}', 'success')
     
     return redirect(url_for('main.admin_notifications'))
@@ -1090,10 +1518,65 @@ def reject_user():
             notification.resolved_by = current_user.id
         
         db.session.commit()
+        events.publish('registration_resolved', {'user_id': user.id, 'name': user.name, 'status': 'rejected'},
+                       user_ids=[user.id], roles=events.ADMIN_ROLES)
         flash(f'Utilisateur {user.name} rejeté', 'warning')
     
     return redirect(url_for('main.admin_notifications'))
 
+def _resolve_users(decision):
+    """Shared by approve_users/reject_users: ids (form user_ids or JSON
+    {"user_ids": [...]}) or {"major": ...} for every pending user of a major"""
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        user_ids, major, role = body.get('user_ids'), body.get('major'), body.get('role')
+    else:
+        user_ids, major, role = request.form.getlist('user_ids') or None, request.form.get('major'), request.form.get('role')
+    if user_ids is not None and len(user_ids) > MAX_BATCH_IDS:
+        return json_response({"success": False, "message": f"At most {MAX_BATCH_IDS} ids per request"}, 400)
+    
+    try:
+        results = registrations.resolve(decision, current_user.id, user_ids=user_ids, major=major, role=role)
+    except registrations.RegistrationError as e:
+        if request.is_json:
+            return json_response({"success": False, "message": str(e)}, 400)
+        flash('Sélectionnez des utilisateurs (ou une filière) et un rôle', 'error')
+        return redirect(url_for('main.admin_notifications'))
+    
+    for result in results:
+        if result['result'] == decision:
+            data = {'user_id': result['id'], 'name': result['name'], 'status': decision}
+            if decision == registrations.APPROVED:
+                data['role'] = role
+            events.publish('registration_resolved', data, user_ids=[result['id']], roles=events.ADMIN_ROLES)
+    totals = registrations.counts(results)
+    logger.info("Registrations resolved", extra={'decision': decision, 'by': current_user.id, 'totals': totals})
+    
+    if request.is_json:
+        return json_response({"success": True, "totals": totals, "results": results})
+    verb = 'approuvé(s)' if decision == registrations.APPROVED else 'rejeté(s)'
+    message = f"{totals.get(decision, 0)} utilisateur(s) {verb}"
+    if totals.get('skipped'):
+        message += f", {totals['skipped']} déjà traité(s)"
+    if totals.get('not_found'):
+        message += f", {totals['not_found']} introuvable(s)"
+    flash(message, 'success')
+    return redirect(url_for('main.admin_notifications'))
+
+@main.route('/admin/approve_users', methods=['POST'])
+@login_required
+def approve_users():
+    if current_user.role not in ['admin', 'owner']:
+        return redirect('/forbidden')
+    return _resolve_users(registrations.APPROVED)
+
+@main.route('/admin/reject_users', methods=['POST'])
+@login_required
+def reject_users():
+    if current_user.role not in ['admin', 'owner']:
+        return redirect('/forbidden')
+    return _resolve_users(registrations.REJECTED)
+
 @main.route('/admin/send_email', methods=['GET', 'POST'])
 @login_required
 def send_email():
@@ -1110,18 +1593,12 @@ def send_email():
         subject = request.form.get('subject')
         message = request.form.get('message')
         
-        # Log the email (in a real application, you would send an actual email)
-        email_log = EmailLog(
-            recipient_id=recipient_id,
-            sender_id=current_user.id,
-            subject=subject,
-            message=message,
-            status='sent'
-        )
-        db.session.add(email_log)
+        # Queue the email, the outbox dispatcher delivers it in the background
+        outbox.enqueue_email(recipient_id, current_user.id, subject, message)
         db.session.commit()
+        outbox.notify(current_app)
         
-        flash('Email envoyé avec succès', 'success')
+        flash('Email ajouté à la file d\'envoi', 'success')
         return redirect(url_for('main.admin_notifications'))
 
 @main.route('/admin/pending_users')
@@ -1130,7 +1607,7 @@ def pending_users():
     if current_user.role != 'admin':
         return redirect('/forbidden')
     
-    pending_users = User.query.filter_by(status='pending').all()
+    pending_users = get_pending_users()
     return render_template('pending_users.html', users=pending_users)
 
 ####################################################################
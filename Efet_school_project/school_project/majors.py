@@ -0,0 +1,115 @@
+####################################################################
+###############      Major membership and counts      ##############
+####################################################################
+# user.major_id references major.id and major.student_count holds the
+# number of students of each major, so the dashboards read the majors
+# table alone instead of joining "user" on the major name and grouping.
+#
+# Both are kept up to date at flush time, whatever route changed the
+# user: when user.major (the name shown everywhere) changes, major_id is
+# resolved from it, and the counts of the majors a student left or
+# joined are recomputed from the major_id index in the same transaction.
+# Renaming a major renames it for its students instead of orphaning them.
+from sqlalchemy import event, func, inspect, select, update
+
+from school_project.routing import RoutingSession
+
+AFFECTED_KEY = 'majors_affected'
+RENAMED_KEY = 'majors_renamed'
+CREATED_KEY = 'majors_created'
+
+
+def major_id_for(session, major_name):
+    """Id of the major called major_name, None if there is none"""
+    from school_project.models import Major
+    if not major_name:
+        return None
+    with session.no_autoflush:
+        return session.execute(select(Major.id).where(Major.major_name == major_name)
+                               .order_by(Major.id).limit(1)).scalar()
+
+def major_name_for(session, major_id):
+    from school_project.models import Major
+    if major_id is None:
+        return None
+    with session.no_autoflush:
+        return session.execute(select(Major.major_name).where(Major.id == major_id)).scalar()
+
+def refresh_student_counts(connection, major_ids=None):
+    """Recompute major.student_count for major_ids (every major if None)"""
+    from school_project.models import Major, User
+    major, user = Major.__table__, User.__table__
+    count = (select(func.count(user.c.id))
+             .where(user.c.major_id == major.c.id, user.c.role == 'student')
+             .scalar_subquery())
+    statement = update(major).values(student_count=count)
+    if major_ids is not None:
+        major_ids = sorted(major_id for major_id in major_ids if major_id is not None)
+        if not major_ids:
+            return
+        statement = statement.where(major.c.id.in_(major_ids))
+    connection.execute(statement)
+
+def link_students(connection, major_id, major_name):
+    """Attach the users whose major name is major_name but have no major_id yet"""
+    from school_project.models import User
+    user = User.__table__
+    connection.execute(update(user)
+                       .where(user.c.major == major_name, user.c.major_id.is_(None))
+                       .values(major_id=major_id))
+
+def _previous(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.obj(), name)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _track_majors(session, flush_context, instances):
+    from school_project.models import Major, User
+    affected = session.info.setdefault(AFFECTED_KEY, set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if obj in session.new or state.attrs.major.history.has_changes():
+                affected.add(_previous(state, 'major_id'))
+                obj.major_id = major_id_for(session, obj.major)
+                affected.add(obj.major_id)
+            elif state.attrs.major_id.history.has_changes():
+                affected.add(_previous(state, 'major_id'))
+                obj.major = major_name_for(session, obj.major_id)
+                affected.add(obj.major_id)
+            elif state.attrs.role.history.has_changes():
+                affected.add(obj.major_id)
+        elif isinstance(obj, Major):
+            if obj in session.new:
+                session.info.setdefault(CREATED_KEY, []).append(obj)
+            elif inspect(obj).attrs.major_name.history.has_changes():
+                session.info.setdefault(RENAMED_KEY, {})[obj.id] = obj.major_name
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            affected.add(obj.major_id)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _update_majors(session, flush_context):
+    from school_project.models import User
+    affected = session.info.pop(AFFECTED_KEY, set())
+    connection = session.connection()
+    user = User.__table__
+    renamed, created = session.info.pop(RENAMED_KEY, {}), session.info.pop(CREATED_KEY, [])
+    for major_id, major_name in renamed.items():
+        connection.execute(update(user).where(user.c.major_id == major_id).values(major=major_name))
+    for major in created:
+        link_students(connection, major.id, major.major_name)
+        affected.add(major.id)
+    if renamed or created:
+        # the users changed above are not in the session, drop every cached user
+        from school_project.cache import invalidate_after_commit
+        invalidate_after_commit(session, 'users')
+    refresh_student_counts(connection, affected)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_majors(session):
+    for key in (AFFECTED_KEY, RENAMED_KEY, CREATED_KEY):
+        session.info.pop(key, None)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Migration script to create the attendance_bitmap table and fill it
+from the existing absence rows.
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+def migrate_attendance(app=None):
+    from school_project import create_app, db
+    from school_project import attendance
+    
+    app = app or create_app()
+    
+    with app.app_context():
+        db.create_all()
+        print("Created attendance_bitmap table")
+        
+        count = attendance.rebuild_all()
+        print(f"Rebuilt {count} student/term bitmaps from the absence table")
+
+if __name__ == "__main__":
+    try:
+        migrate_attendance()
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the ux_payment_dues unique index (one fees
+payment per student and month) to an existing payment table.
+Copies of a generated payment (pending, never paid) are removed first;
+any other duplicate is listed and must be settled by hand.
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+def migrate_dues(app=None):
+    from school_project import create_app, db, dues
+    from school_project.enums import PaymentStatus, PaymentType
+    
+    app = app or create_app()
+    
+    with app.app_context():
+        fees, pending = int(PaymentType.fees), int(PaymentStatus.pending)
+        removed = db.session.execute(db.text("""
+            DELETE FROM payment
+            WHERE type = :fees AND status = :pending AND payment_date IS NULL
+              AND EXISTS (SELECT 1 FROM payment first
+                          WHERE first.student_id = payment.student_id AND first.month_paid = payment.month_paid
+                            AND first.type = :fees AND first.id < payment.id)
+        """), {'fees': fees, 'pending': pending}).rowcount
+        print(f"Removed {removed} duplicate pending fees payments")
+        
+        duplicates = db.session.execute(db.text("""
+            SELECT student_id, month_paid, COUNT(*) FROM payment
+            WHERE type = :fees
+            GROUP BY student_id, month_paid HAVING COUNT(*) > 1
+        """), {'fees': fees}).all()
+        if duplicates:
+            db.session.rollback()
+            for student_id, month_paid, count in duplicates:
+                print(f"Student {student_id} has {count} fees payments for {month_paid}")
+            raise RuntimeError("Settle these payments, then run the migration again")
+        
+        dues.ensure_index()
+        db.session.commit()
+        print("Created unique index ux_payment_dues")
+
+if __name__ == "__main__":
+    try:
+        migrate_dues()
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
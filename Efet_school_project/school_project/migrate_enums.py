@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Migration script to store role, status, gender, payment status/type,
+justified and priority as small-integer codes (see enums.py) instead of
+text. Values are matched case-insensitively; the script stops without
+changing anything if a column holds a value that has no code.
+
+PostgreSQL: the columns are converted in place (ALTER COLUMN ... TYPE
+SMALLINT USING ...). SQLite: the tables are rebuilt like in
+migrate_foreign_keys.py, with their foreign keys. The new role/status
+indexes are then created. Works on both SQLite and PostgreSQL.
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+def text_columns(db, inspector):
+    """{table: [(column name, enum class)]} of the coded columns still stored as text"""
+    from sqlalchemy import Integer
+    from school_project.enums import Code
+
+    pending = {}
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if isinstance(column.type, Code) and column.name in types and not isinstance(types[column.name], Integer):
+                pending.setdefault(table, []).append((column.name, column.type.enum_class))
+    return pending
+
+def to_code(column, enum_class):
+    whens = ' '.join(f"WHEN '{member.name}' THEN {member.value}" for member in enum_class)
+    return f'CASE lower(trim("{column}")) {whens} END'
+
+def unknown_values(conn, db, table, column, enum_class):
+    names = ', '.join(f"'{member.name}'" for member in enum_class)
+    return conn.execute(db.text(
+        f'SELECT "{column}", COUNT(*) FROM "{table.name}" '
+        f'WHERE "{column}" IS NOT NULL AND trim("{column}") != \'\' AND lower(trim("{column}")) NOT IN ({names}) '
+        f'GROUP BY "{column}"')).fetchall()
+
+def migrate_enums(app=None):
+    from school_project import create_app, db, integrity, majors
+    from school_project.migrate_foreign_keys import create_missing_indexes, rebuild_sqlite_table
+
+    app = app or create_app()
+
+    with app.app_context():
+        db.create_all()
+        pending = text_columns(db, db.inspect(db.engine))
+        if not pending:
+            print("All coded columns are already small integers.")
+
+        with db.engine.connect() as conn:
+            problems = []
+            for table, columns in pending.items():
+                for column, enum_class in columns:
+                    for value, count in unknown_values(conn, db, table, column, enum_class):
+                        problems.append(f"{table.name}.{column}: {value!r} ({count} rows)")
+        if problems:
+            print("These values have no code in enums.py, fix them first:")
+            for problem in problems:
+                print(f"  {problem}")
+            raise SystemExit(1)
+
+        if pending and db.engine.dialect.name != 'postgresql':
+            # the rebuilt tables get the foreign keys of models.py as well
+            print("Sweeping orphan rows...")
+            integrity.sweep_orphans()
+
+        for table, columns in pending.items():
+            print(f"Converting {table.name} ({', '.join(column for column, _ in columns)})...")
+            if db.engine.dialect.name == 'postgresql':
+                changes = ', '.join(
+                    f'ALTER COLUMN "{column}" DROP DEFAULT, '
+                    f'ALTER COLUMN "{column}" TYPE SMALLINT USING ({to_code(column, enum_class)})'
+                    for column, enum_class in columns)
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(f'ALTER TABLE "{table.name}" {changes}'))
+            else:
+                rebuild_sqlite_table(db, table, db.inspect(db.engine),
+                                     {column: to_code(column, enum_class) for column, enum_class in columns})
+
+        for table in db.metadata.sorted_tables:
+            inspector = db.inspect(db.engine)
+            if inspector.has_table(table.name):
+                create_missing_indexes(db, table, inspector)
+
+        # refresh_student_counts matches the role code: counts computed by
+        # migrate_majors.py while the roles were still text found no student
+        if 'student_count' in {column['name'] for column in db.inspect(db.engine).get_columns('major')}:
+            with db.engine.begin() as conn:
+                majors.refresh_student_counts(conn)
+            print("Recomputed the student count of every major.")
+
+if __name__ == "__main__":
+    try:
+        migrate_enums()
+        print("Migration completed successfully!")
+    except SystemExit:
+        raise
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
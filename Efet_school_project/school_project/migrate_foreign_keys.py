@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the foreign keys of models.py (ON DELETE CASCADE /
+SET NULL, see integrity.py) to an existing database. Orphan rows are swept
+first in small transactions, then the missing indexes are created.
+
+PostgreSQL: each constraint is added NOT VALID (no table scan under lock)
+and validated afterwards, and indexes are built CONCURRENTLY.
+SQLite cannot alter a constraint: the tables are rebuilt with their new
+definition, keeping their rows, indexes and triggers (search.py).
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+def wanted_foreign_keys(table):
+    return {(fk.parent.name, fk.column.table.name, (fk.ondelete or '').upper()): fk
+            for fk in table.foreign_keys}
+
+def existing_foreign_keys(inspector, table_name):
+    return {(fk['constrained_columns'][0], fk['referred_table'], (fk['options'].get('ondelete') or '').upper()): fk['name']
+            for fk in inspector.get_foreign_keys(table_name)}
+
+def create_missing_indexes(db, table, inspector):
+    from sqlalchemy.schema import CreateIndex
+    existing = {index['name'] for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        print(f"Creating index {index.name}...")
+        statement = str(CreateIndex(index).compile(dialect=db.engine.dialect))
+        if db.engine.dialect.name == 'postgresql':
+            # does not block writes, but cannot run inside a transaction
+            statement = statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1)
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(db.text(statement))
+        else:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(statement.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)))
+
+def migrate_postgresql(db, table, missing, stale):
+    with db.engine.begin() as conn:
+        for name in stale:
+            print(f"Dropping constraint {name} of {table.name}...")
+            conn.execute(db.text(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{name}"'))
+        for (column, referred, action), fk in missing.items():
+            if action == 'SET NULL' and table.c[column].nullable:
+                conn.execute(db.text(f'ALTER TABLE "{table.name}" ALTER COLUMN "{column}" DROP NOT NULL'))
+            print(f"Adding constraint {fk.name} ({table.name}.{column} -> {referred}, ON DELETE {action})...")
+            conn.execute(db.text(
+                f'ALTER TABLE "{table.name}" ADD CONSTRAINT "{fk.name}" FOREIGN KEY ("{column}") '
+                f'REFERENCES "{referred}" ({fk.column.name}) ON DELETE {action} NOT VALID'))
+    # validation only takes a SHARE UPDATE EXCLUSIVE lock: reads and writes go on
+    for fk in missing.values():
+        with db.engine.begin() as conn:
+            conn.execute(db.text(f'ALTER TABLE "{table.name}" VALIDATE CONSTRAINT "{fk.name}"'))
+
+def rebuild_sqlite_table(db, table, inspector, expressions=None):
+    """Recreate `table` with the definition of models.py (the 12 steps of
+    https://www.sqlite.org/lang_altertable.html#otheralter). `expressions`
+    maps a column to the SQL converting its old values."""
+    from sqlalchemy.schema import CreateTable
+    columns = [column['name'] for column in inspector.get_columns(table.name)]
+    extra = [name for name in columns if name not in table.c]
+    if extra:
+        print(f"Skipping {table.name}: columns {', '.join(extra)} are not in models.py")
+        return False
+    kept = ', '.join(f'"{name}"' for name in columns)
+    values = ', '.join((expressions or {}).get(name, f'"{name}"') for name in columns)
+    quoted = db.engine.dialect.identifier_preparer.quote(table.name)
+    create = str(CreateTable(table).compile(dialect=db.engine.dialect)).replace(
+        f'CREATE TABLE {quoted} (', f'CREATE TABLE "{table.name}_new" (', 1)
+
+    print(f"Rebuilding {table.name}...")
+    raw = db.engine.raw_connection()
+    try:
+        connection = raw.driver_connection
+        isolation_level, connection.isolation_level = connection.isolation_level, None  # explicit BEGIN / COMMIT below
+        cursor = connection.cursor()
+        enforced = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        cursor.execute('BEGIN')
+        try:
+            saved = [row[0] for row in cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                (table.name,))]
+            cursor.execute(create)
+            cursor.execute(f'INSERT INTO "{table.name}_new" ({kept}) SELECT {values} FROM "{table.name}"')
+            cursor.execute(f'DROP TABLE "{table.name}"')
+            cursor.execute(f'ALTER TABLE "{table.name}_new" RENAME TO "{table.name}"')
+            for statement in saved:
+                cursor.execute(statement)
+            problems = cursor.execute(f'PRAGMA foreign_key_check("{table.name}")').fetchall()
+            if problems:
+                raise RuntimeError(f"{len(problems)} rows of {table.name} still reference a missing row")
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.execute(f'PRAGMA foreign_keys = {enforced}')
+            connection.isolation_level = isolation_level
+    finally:
+        raw.close()
+    return True
+
+def dialect_is_sqlite(db):
+    return db.engine.dialect.name == 'sqlite'
+
+def migrate_foreign_keys(app=None):
+    from school_project import create_app, db, integrity
+
+    app = app or create_app()
+
+    with app.app_context():
+        db.create_all()
+        if dialect_is_sqlite(db):
+            from school_project.migrate_enums import text_columns
+            if text_columns(db, db.inspect(db.engine)):
+                # rebuilding would copy text into the small-integer columns
+                print("Run migrate_enums.py instead: it converts the coded columns and adds the foreign keys.")
+                raise SystemExit(1)
+
+        print("Sweeping orphan rows...")
+        for name, fixed in integrity.sweep_orphans().items():
+            if fixed:
+                print(f"{name}: {fixed} rows fixed")
+
+        dialect = db.engine.dialect.name
+        for table in db.metadata.sorted_tables:
+            inspector = db.inspect(db.engine)
+            if not table.foreign_keys or not inspector.has_table(table.name):
+                continue
+            create_missing_indexes(db, table, inspector)
+
+            wanted = wanted_foreign_keys(table)
+            existing = existing_foreign_keys(inspector, table.name)
+            missing = {key: fk for key, fk in wanted.items() if key not in existing}
+            if not missing:
+                print(f"{table.name}: foreign keys up to date.")
+                continue
+            if dialect == 'postgresql':
+                missing_columns = {column for column, _, _ in missing}
+                stale = [name for (column, _, _), name in existing.items() if column in missing_columns and name]
+                migrate_postgresql(db, table, missing, stale)
+            else:
+                rebuild_sqlite_table(db, table, inspector)
+
+if __name__ == "__main__":
+    try:
+        migrate_foreign_keys()
+        print("Migration completed successfully!")
+    except SystemExit:
+        raise
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Migration script to link users to their major by id: adds user.major_id
+(referencing major.id) and major.student_count, fills major_id from the
+major names and computes the counts. Works on both SQLite and PostgreSQL.
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+def migrate_majors(app=None):
+    from school_project import create_app, db
+    from school_project import majors
+
+    app = app or create_app()
+
+    with app.app_context():
+        db.create_all()
+        inspector = db.inspect(db.engine)
+        user_columns = [column['name'] for column in inspector.get_columns('user')]
+        major_columns = [column['name'] for column in inspector.get_columns('major')]
+
+        with db.engine.begin() as conn:
+            if 'major_id' not in user_columns:
+                print("Adding 'major_id' column to user...")
+                conn.execute(db.text('ALTER TABLE "user" ADD COLUMN major_id INTEGER REFERENCES major(id)'))
+            else:
+                print("'major_id' column already exists.")
+            conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_user_major_id ON "user" (major_id)'))
+
+            if 'student_count' not in major_columns:
+                print("Adding 'student_count' column to major...")
+                conn.execute(db.text('ALTER TABLE major ADD COLUMN student_count INTEGER DEFAULT 0'))
+            else:
+                print("'student_count' column already exists.")
+
+            print("Linking users to their major...")
+            result = conn.execute(db.text(
+                'UPDATE "user" SET major_id = (SELECT MIN(m.id) FROM major m WHERE m.major_name = "user".major) '
+                'WHERE major_id IS NULL AND major IS NOT NULL'))
+            print(f"{result.rowcount} users checked.")
+
+            majors.refresh_student_counts(conn)
+            unmatched = conn.execute(db.text(
+                'SELECT COUNT(*) FROM "user" WHERE major_id IS NULL AND major IS NOT NULL AND major != \'\'')).scalar()
+            if unmatched:
+                print(f"{unmatched} users have a major name that matches no major.")
+
+if __name__ == "__main__":
+    try:
+        migrate_majors()
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
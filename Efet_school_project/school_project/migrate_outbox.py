@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the outbox delivery columns to the email_log
+table. Works on both SQLite and PostgreSQL.
+"""
+
+import os
+import sys
+
+# Make sure we can import from parent directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+NEW_COLUMNS = {
+    'attempts': 'INTEGER DEFAULT 0',
+    'next_attempt_at': 'TIMESTAMP',
+    'claimed_by': 'VARCHAR(64)',
+    'last_error': 'VARCHAR(500)',
+}
+
+def migrate_outbox(app=None):
+    from school_project import create_app, db
+    
+    app = app or create_app()
+    
+    with app.app_context():
+        db.create_all()
+        columns = [column['name'] for column in db.inspect(db.engine).get_columns('email_log')]
+        
+        with db.engine.begin() as conn:
+            for name, definition in NEW_COLUMNS.items():
+                if name not in columns:
+                    print(f"Adding '{name}' column to email_log...")
+                    conn.execute(db.text(f"ALTER TABLE email_log ADD COLUMN {name} {definition}"))
+                else:
+                    print(f"'{name}' column already exists.")
+            conn.execute(db.text("UPDATE email_log SET attempts = 0 WHERE attempts IS NULL"))
+
+if __name__ == "__main__":
+    try:
+        migrate_outbox()
+        print("Migration completed successfully!")
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        sys.exit(1)
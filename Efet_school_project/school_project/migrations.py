@@ -0,0 +1,88 @@
+####################################################################
+###############         Ordered migrations          ################
+####################################################################
+# The migrate_*.py scripts bring a database created by an older version
+# up to models.py. They only work in one order:
+#   majors        user.major_id and major.student_count: every query
+#                 on "user" (login included) selects major_id
+#   outbox        delivery columns of email_log
+#   enums         text -> small-integer codes, then the major counts
+#   foreign_keys  refuses to rebuild SQLite tables still holding text
+#   attendance    reads absence.justified as codes
+#   dues          unique index ux_payment_dues
+#   email_sender  migrate_foreign_keys.py again: email_log.sender_id
+#                 became nullable, ON DELETE SET NULL
+# A step is never renamed nor reordered once released, new ones go at the
+# end (a script may appear twice, it only changes what models.py added).
+# run() applies the steps a database has not seen yet, in that order,
+# and records each one in schema_migration, so running it on every
+# deploy only does work once. A new database (create_all) goes through
+# them once as well, they change nothing there.
+#
+# `flask --app wsgi migrate run` (migrate_for_railway.py runs it before
+# gunicorn starts, see the Procfile) and `flask --app wsgi migrate status`.
+import importlib
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from school_project import db
+
+STEPS = (  # (name recorded in schema_migration, migrate_*.py script)
+    ('majors', 'migrate_majors'),
+    ('outbox', 'migrate_outbox'),
+    ('enums', 'migrate_enums'),
+    ('foreign_keys', 'migrate_foreign_keys'),
+    ('attendance', 'migrate_attendance'),
+    ('dues', 'migrate_dues'),
+    ('email_sender', 'migrate_foreign_keys'),
+)
+
+
+def applied():
+    """{step name: applied_at} of the steps recorded in schema_migration"""
+    from school_project.models import SchemaMigration
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return dict(db.session.query(SchemaMigration.name, SchemaMigration.applied_at).all())
+
+def pending():
+    done = applied()
+    db.session.remove()
+    return [(step, script) for step, script in STEPS if step not in done]
+
+def run(app=None, log=print):
+    """Apply the pending steps in order, stop at the first failure. Returns the steps applied."""
+    from school_project.models import SchemaMigration
+    app = app or current_app._get_current_object()
+    done = []
+    with app.app_context():
+        for step, script in pending():
+            log(f"Migration {step}...")
+            getattr(importlib.import_module(f'school_project.{script}'), script)(app)
+            db.session.remove()  # the step may have rebuilt tables under the session
+            db.session.add(SchemaMigration(name=step, applied_at=datetime.now()))
+            db.session.commit()
+            done.append(step)
+    return done
+
+####################################################################
+
+migrate_cli = AppGroup('migrate', help='Database migrations')
+
+@migrate_cli.command('run')
+def run_command():
+    """Apply the migrations this database has not seen yet, in order"""
+    done = run(log=click.echo)
+    click.echo(f"{len(done)} migrations applied" if done else "Database up to date")
+
+@migrate_cli.command('status')
+def status_command():
+    """List the migrations and when they were applied"""
+    done = applied()
+    for step, _ in STEPS:
+        click.echo(f"{step:<14} {done[step].strftime('%Y-%m-%d %H:%M') if step in done else 'pending'}")
+
+def init_app(app):
+    app.cli.add_command(migrate_cli)
@@ -8,46 +8,58 @@ def get_db():
 
 # Import the db instance directly - this should work now
 from school_project import db
+from school_project.enums import Code, Gender, Justified, PaymentStatus, PaymentType, Priority, Role, UserStatus
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_user_role_status', 'role', 'status'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True) # primary keys are required by SQLAlchemy
     email = db.Column(db.String(100), unique=True)
     password = db.Column(db.String(100))
     name = db.Column(db.String(1000))
-    role = db.Column(db.String(1000))
-    status = db.Column(db.String(100), default='pending')  # pending, approved, rejected
+    role = db.Column(Code(Role))  # stored as small-integer codes, see enums.py
+    status = db.Column(Code(UserStatus), default='pending', index=True)  # pending, approved, rejected
     age = db.Column(db.Integer)
     address = db.Column(db.String(1000))
     registration = db.Column(db.String(1000))
-    gender = db.Column(db.String(1000))
+    gender = db.Column(Code(Gender))
     profile_picture = db.Column(db.String(1000))
     about_me = db.Column(db.String(1000))
     phone = db.Column(db.String(100))
     major = db.Column(db.String(100))
+    major_id = db.Column(db.Integer, db.ForeignKey('major.id', name='fk_user_major_id', ondelete='SET NULL'), index=True)  # kept in sync with major by majors.py
     register_date = db.Column(db.Date)
     year = db.Column(db.Integer)
 
 class Payment(db.Model):
     __tablename__ = 'payment'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_payment_student_month', 'student_id', 'month_paid'),
+        # one fees payment per student and month, what dues.generate_dues relies on
+        db.Index('ux_payment_dues', 'student_id', 'month_paid', unique=True,
+                 sqlite_where=db.text(f'type = {int(PaymentType.fees)}'),
+                 postgresql_where=db.text(f'type = {int(PaymentType.fees)}')),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True) # primary keys are required by SQLAlchemy
-    student_id = db.Column(db.Integer)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_payment_student_id', ondelete='CASCADE'))
     month_paid = db.Column(db.Date)
     payment_date = db.Column(db.Date)
     amount = db.Column(db.Float)
-    status = db.Column(db.String(1000))
-    type = db.Column(db.String(1000))
+    status = db.Column(Code(PaymentStatus))
+    type = db.Column(Code(PaymentType))
 
 class Grade(db.Model):
     __tablename__ = 'grade'
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_grade_student_id', ondelete='CASCADE'), index=True)
     grade = db.Column(db.Float)
     subject = db.Column(db.String(1000))
     grade_date = db.Column(db.Date)
@@ -59,17 +71,18 @@ class Major(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     major_name = db.Column(db.String(100))
     duration = db.Column(db.Float)
+    student_count = db.Column(db.Integer, default=0)  # maintained by majors.py
 
 class Message(db.Model):
     __tablename__ = 'message'
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    msg_from = db.Column(db.Integer)
-    msg_to = db.Column(db.Integer)
+    msg_from = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_message_msg_from', ondelete='CASCADE'), index=True)
+    msg_to = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_message_msg_to', ondelete='CASCADE'), index=True)
     content = db.Column(db.String(1000))
     date_sent = db.Column(db.DateTime)  # Changed to DateTime for better precision
-    priority = db.Column(db.String(20), default='normal')  # normal, important, urgent
+    priority = db.Column(Code(Priority), default='normal')  # normal, important, urgent
     is_read = db.Column(db.Boolean, default=False)  # Track read status
     
     def __repr__(self):
@@ -80,9 +93,9 @@ class Absence(db.Model):
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_absence_student_id', ondelete='CASCADE'), index=True)
     date_absence = db.Column(db.DateTime)
-    justified = db.Column(db.String(10))
+    justified = db.Column(Code(Justified))  # yes, no, waiting
     details = db.Column(db.String(1000))
 
 class Subject(db.Model):
@@ -91,29 +104,138 @@ class Subject(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    id_prof = db.Column(db.Integer)
+    id_prof = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_subject_id_prof', ondelete='SET NULL'), index=True)  # NULL once the teacher is deleted
 
 class AdminNotification(db.Model):
     __tablename__ = 'admin_notification'
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_admin_notification_user_id', ondelete='CASCADE'), nullable=False, index=True)
     notification_type = db.Column(db.String(50), default='new_registration')  # new_registration, role_change, etc.
     message = db.Column(db.String(1000))
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     resolved_at = db.Column(db.DateTime)
-    resolved_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    resolved_by = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_admin_notification_resolved_by', ondelete='SET NULL'))
     
 class EmailLog(db.Model):
     __tablename__ = 'email_log'
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_email_log_recipient_id', ondelete='CASCADE'), nullable=False, index=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_email_log_sender_id', ondelete='SET NULL'), index=True)  # NULL once the sender is deleted, the recipient keeps the log
     subject = db.Column(db.String(200))
     message = db.Column(db.Text)
     sent_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    status = db.Column(db.String(50), default='sent')  # sent, failed, pending
+    status = db.Column(db.String(50), default='pending')  # pending, sending, sent, failed
+    # delivery bookkeeping for the outbox dispatcher (see outbox.py)
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)  # retry time, or lease expiry while sending
+    claimed_by = db.Column(db.String(64))
+    last_error = db.Column(db.String(500))
+
+class AttendanceBitmap(db.Model):
+    __tablename__ = 'attendance_bitmap'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'term', name='uq_attendance_student_term'),
+        {'extend_existing': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_attendance_bitmap_student_id', ondelete='CASCADE'), index=True)
+    term = db.Column(db.String(20))  # e.g. 2024-S1, see attendance.term_of()
+    justified = db.Column(db.LargeBinary, default=b'')  # bit n = day n of the term
+    unjustified = db.Column(db.LargeBinary, default=b'')
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_version'
+    __table_args__ = {'extend_existing': True}
+    
+    name = db.Column(db.String(50), primary_key=True)  # majors, subjects, teachers, see refcache.py
+    version = db.Column(db.Integer, default=0)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migration'
+    __table_args__ = {'extend_existing': True}
+    
+    name = db.Column(db.String(50), primary_key=True)  # majors, enums, ... see migrations.py
+    applied_at = db.Column(db.DateTime)
+
+class SequenceBlock(db.Model):
+    __tablename__ = 'sequence_block'
+    __table_args__ = {'extend_existing': True}
+    
+    name = db.Column(db.String(50), primary_key=True)  # registration, see sequences.py
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)  # first value not handed out yet
+
+class Job(db.Model):
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_due', 'status', 'run_at'),
+        {'extend_existing': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))  # task name, see jobs.task()
+    payload = db.Column(db.Text)  # JSON keyword arguments of the task
+    priority = db.Column(db.Integer, default=0)  # higher runs first
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_at = db.Column(db.DateTime)  # not before, or lease expiry while running
+    claimed_by = db.Column(db.String(64))
+    last_error = db.Column(db.String(1000))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class JobSchedule(db.Model):
+    __tablename__ = 'job_schedule'
+    __table_args__ = {'extend_existing': True}
+    
+    name = db.Column(db.String(100), primary_key=True)  # see jobs.SCHEDULE
+    next_run_at = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+
+# Rows of past academic years moved out of grade, absence and message by
+# archive.py. Same columns plus the academic year ('2023-2024'), which is
+# the partition key on PostgreSQL (one partition per year, see archive.py)
+class GradeArchive(db.Model):
+    __tablename__ = 'grade_archive'
+    __table_args__ = {'extend_existing': True, 'postgresql_partition_by': 'LIST (academic_year)'}
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    academic_year = db.Column(db.String(9), primary_key=True)
+    student_id = db.Column(db.Integer, index=True)
+    grade = db.Column(db.Float)
+    subject = db.Column(db.String(1000))
+    grade_date = db.Column(db.Date)
+    archived_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class AbsenceArchive(db.Model):
+    __tablename__ = 'absence_archive'
+    __table_args__ = {'extend_existing': True, 'postgresql_partition_by': 'LIST (academic_year)'}
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    academic_year = db.Column(db.String(9), primary_key=True)
+    student_id = db.Column(db.Integer, index=True)
+    date_absence = db.Column(db.DateTime)
+    justified = db.Column(Code(Justified))
+    details = db.Column(db.String(1000))
+    archived_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class MessageArchive(db.Model):
+    __tablename__ = 'message_archive'
+    __table_args__ = {'extend_existing': True, 'postgresql_partition_by': 'LIST (academic_year)'}
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    academic_year = db.Column(db.String(9), primary_key=True)
+    msg_from = db.Column(db.Integer, index=True)
+    msg_to = db.Column(db.Integer, index=True)
+    content = db.Column(db.String(1000))
+    date_sent = db.Column(db.DateTime)
+    priority = db.Column(Code(Priority), default='normal')
+    is_read = db.Column(db.Boolean, default=False)
+    archived_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -0,0 +1,212 @@
+####################################################################
+################         Email outbox          #####################
+####################################################################
+# Request handlers only enqueue EmailLog rows with status 'pending'.
+# A dispatcher thread (one per worker process) claims them in batches,
+# delivers each batch over a single SMTP connection and records the
+# outcome. Failed deliveries are retried with exponential backoff until
+# OUTBOX_MAX_ATTEMPTS is reached, then marked 'failed'.
+#
+# Claiming sets status 'sending' and uses next_attempt_at as a lease:
+# rows left in 'sending' by a crashed worker become claimable again once
+# the lease expires, and the claim UPDATE is conditional so two workers
+# never deliver the same row.
+import logging
+import os
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from school_project import db
+from school_project.models import EmailLog, User
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300
+
+
+def enqueue_email(recipient_id, sender_id, subject, message):
+    """Add an email to the outbox, the caller commits"""
+    email_log = EmailLog(
+        recipient_id=recipient_id,
+        sender_id=sender_id,
+        subject=subject,
+        message=message,
+        status='pending',
+        attempts=0
+    )
+    db.session.add(email_log)
+    return email_log
+
+def configure(app):
+    """Read the SMTP and outbox settings from the environment"""
+    app.config.setdefault('MAIL_SERVER', os.environ.get('MAIL_SERVER'))
+    app.config.setdefault('MAIL_PORT', int(os.environ.get('MAIL_PORT', 25)))
+    app.config.setdefault('MAIL_USERNAME', os.environ.get('MAIL_USERNAME'))
+    app.config.setdefault('MAIL_PASSWORD', os.environ.get('MAIL_PASSWORD'))
+    app.config.setdefault('MAIL_USE_TLS', os.environ.get('MAIL_USE_TLS', '').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('MAIL_DEFAULT_SENDER', os.environ.get('MAIL_DEFAULT_SENDER', 'no-reply@efet.ma'))
+    app.config.setdefault('OUTBOX_BATCH_SIZE', int(os.environ.get('OUTBOX_BATCH_SIZE', 50)))
+    app.config.setdefault('OUTBOX_INTERVAL', float(os.environ.get('OUTBOX_INTERVAL', 5)))
+    app.config.setdefault('OUTBOX_MAX_ATTEMPTS', int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5)))
+    app.config.setdefault('OUTBOX_BACKOFF', float(os.environ.get('OUTBOX_BACKOFF', 30)))
+
+####################################################################
+
+class OutboxDispatcher:
+    def __init__(self, app):
+        self.app = app
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='outbox-dispatcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+
+    def notify(self):
+        """Wake the dispatcher up after an enqueue instead of waiting for the next tick"""
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with self.app.app_context():
+                    # keep going while full batches come back
+                    while self.dispatch_batch() == self.app.config['OUTBOX_BATCH_SIZE']:
+                        pass
+            except Exception as e:
+                logger.exception("Outbox dispatcher error: %s", e)
+            self.wakeup.wait(self.app.config['OUTBOX_INTERVAL'])
+            self.wakeup.clear()
+
+    def claim_batch(self):
+        """Lease up to OUTBOX_BATCH_SIZE due rows for this worker, return them"""
+        now = datetime.now()
+        due = db.or_(
+            db.and_(EmailLog.status == 'pending', db.or_(EmailLog.next_attempt_at.is_(None), EmailLog.next_attempt_at <= now)),
+            db.and_(EmailLog.status == 'sending', EmailLog.next_attempt_at <= now),
+        )
+        ids = [row.id for row in db.session.query(EmailLog.id).filter(due).order_by(EmailLog.id).limit(self.app.config['OUTBOX_BATCH_SIZE'])]
+        if not ids:
+            return []
+        EmailLog.query.filter(EmailLog.id.in_(ids), due).update({
+            'status': 'sending',
+            'claimed_by': self.worker_id,
+            'next_attempt_at': now + timedelta(seconds=LEASE_SECONDS),
+        }, synchronize_session=False)
+        db.session.commit()
+
+        return db.session.query(EmailLog, User.email) \
+            .outerjoin(User, User.id == EmailLog.recipient_id) \
+            .filter(EmailLog.id.in_(ids), EmailLog.claimed_by == self.worker_id, EmailLog.status == 'sending') \
+            .all()
+
+    def connect(self):
+        config = self.app.config
+        smtp = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config['MAIL_USERNAME']:
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return smtp
+
+    def build_message(self, email_log, recipient_email):
+        message = EmailMessage()
+        message['From'] = self.app.config['MAIL_DEFAULT_SENDER']
+        message['To'] = recipient_email
+        message['Subject'] = email_log.subject or ''
+        message.set_content(email_log.message or '')
+        return message
+
+    def dispatch_batch(self):
+        """Deliver one batch over a single SMTP connection, return the number of rows claimed"""
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+
+        smtp = None
+        try:
+            for email_log, recipient_email in batch:
+                if not recipient_email:
+                    self.record_failure(email_log, 'Recipient has no email address', retry=False)
+                    continue
+                try:
+                    if smtp is None:
+                        smtp = self.connect()
+                    smtp.send_message(self.build_message(email_log, recipient_email))
+                except smtplib.SMTPRecipientsRefused as e:
+                    self.record_failure(email_log, str(e), retry=False)
+                    continue
+                except (smtplib.SMTPException, OSError) as e:
+                    # the connection is unusable, reconnect for the next email
+                    self.record_failure(email_log, str(e))
+                    smtp = self.close(smtp)
+                    continue
+                email_log.status = 'sent'
+                email_log.sent_at = datetime.now()
+                email_log.next_attempt_at = None
+                email_log.last_error = None
+                email_log.attempts = (email_log.attempts or 0) + 1
+        finally:
+            self.close(smtp)
+            db.session.commit()
+        return len(batch)
+
+    def record_failure(self, email_log, error, retry=True):
+        config = self.app.config
+        email_log.attempts = (email_log.attempts or 0) + 1
+        email_log.last_error = error[:500]
+        if retry and email_log.attempts < config['OUTBOX_MAX_ATTEMPTS']:
+            email_log.status = 'pending'
+            email_log.next_attempt_at = datetime.now() + timedelta(seconds=config['OUTBOX_BACKOFF'] * 2 ** (email_log.attempts - 1))
+        else:
+            email_log.status = 'failed'
+            email_log.next_attempt_at = None
+
+    @staticmethod
+    def close(smtp):
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
+
+####################################################################
+
+def init_app(app):
+    """Start one dispatcher per worker process, on its first request.
+    Threads started at import time would not survive gunicorn's --preload fork."""
+    configure(app)
+    if not app.config['MAIL_SERVER']:
+        return
+
+    state = {'pid': None, 'dispatcher': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_outbox_dispatcher():
+        if state['pid'] == os.getpid():
+            return
+        with lock:
+            if state['pid'] != os.getpid():
+                state['dispatcher'] = OutboxDispatcher(app)
+                state['dispatcher'].start()
+                state['pid'] = os.getpid()
+
+    app.extensions['outbox'] = state
+
+def notify(app):
+    """Ask the dispatcher of this process to look at the outbox now"""
+    state = app.extensions.get('outbox')
+    if state and state['dispatcher']:
+        state['dispatcher'].notify()
@@ -0,0 +1,151 @@
+####################################################################
+###############       Reference-data cache          ################
+####################################################################
+# Majors, subjects and teachers change a few times per term but are
+# read by every dashboard. The wrapped tools.py helpers keep an
+# immutable snapshot (a tuple of rows) per worker process and only hit
+# the tables again when the snapshot is stale. The grade means and the
+# admin notification lists use the same stamps ('grades',
+# 'notifications'); those helpers take arguments, so their results are
+# only kept in the application cache, keyed by stamp and arguments.
+#
+# Staleness is detected with version stamps in the cache_version table:
+# every write bumps the stamp of the data it touched, in the same
+# transaction, and readers compare their snapshot with the stamps, read
+# once per request with a single primary-key scan. Changes made through
+# the ORM (Major, Subject, teacher users, and the student counts of the
+# majors) are detected at flush time; bulk Query.delete() calls bypass
+# the session and must call invalidate() themselves, set-based writes
+# to a whole table can use invalidate_table().
+#
+# Snapshots are also stored in the 'refdata' namespace of cache.py under
+# their stamp and built through singleflight.py: when a stamp moves, one
+# caller across the workers rebuilds the snapshot and the others wait
+# for it. Stamps start again from 0 in a new database: run
+# `flask --app wsgi cache clear` after recreating one.
+import threading
+from functools import wraps
+from inspect import signature
+from flask import has_request_context, request
+from sqlalchemy import event, inspect, select, update
+
+from school_project.routing import RoutingSession
+
+PENDING_KEY = 'refcache_pending'
+VERSIONS_KEY = 'refcache.versions'
+
+# stamps depending on each table, for the set-based writes of archive.py and integrity.py
+TABLE_STAMPS = {
+    'major': ('majors',),
+    'subject': ('subjects',),
+    'user': ('majors', 'subjects', 'teachers'),
+    'grade': ('grades',),
+    'grade_archive': ('grades',),
+    'admin_notification': ('notifications',),
+}
+
+_snapshots = {}  # (engine url, name, helper) -> (version, rows)
+_lock = threading.Lock()
+
+
+def _versions(session):
+    """name -> version stamp, read once per request"""
+    if has_request_context() and VERSIONS_KEY in request.environ:
+        return request.environ[VERSIONS_KEY]
+    from school_project.models import CacheVersion
+    versions = dict(session.execute(select(CacheVersion.name, CacheVersion.version)).all())
+    if has_request_context():
+        request.environ[VERSIONS_KEY] = versions
+    return versions
+
+def cached(name):
+    """Serve the helper's result from the snapshot of `name` while its stamp is unchanged.
+    Goes under @read_only so that the stamp and the rows come from the same database.
+    Arguments are part of the key, bound to the helper's signature: f(1) and
+    f(1, include_archived=False) share an entry."""
+    def decorator(f):
+        parameters = signature(f)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from school_project import db, singleflight
+            bound = parameters.bind(*args, **kwargs)  # TypeError on a wrong call, like f itself
+            bound.apply_defaults()
+            arguments = [f'{key}={value}' for key, value in bound.arguments.items()]
+            session = db.session()
+            # the stamp is read before the rows: a snapshot is never older than its stamp
+            version = _versions(session).get(name, 0)
+            key = (str(db.engine.url), name, f.__name__)
+            if not arguments:
+                snapshot = _snapshots.get(key)
+                if snapshot is not None and snapshot[0] == version:
+                    return snapshot[1]
+            rows = singleflight.load('refdata', ':'.join(map(str, (f.__name__, version, *arguments))),
+                                     lambda: tuple(f(*bound.args, **bound.kwargs)))
+            if not arguments:
+                with _lock:
+                    _snapshots[key] = (version, rows)
+            return rows
+        return decorated_function
+    return decorator
+
+def invalidate(*names, connection=None):
+    """Bump the stamps of `names` in the current transaction and drop the local snapshots"""
+    from school_project import db
+    from school_project.models import CacheVersion
+    execute = connection.execute if connection is not None else db.session.execute
+    table = CacheVersion.__table__
+    for name in names:
+        result = execute(update(table).where(table.c.name == name).values(version=table.c.version + 1))
+        if result.rowcount == 0:
+            execute(table.insert().values(name=name, version=1))
+    url = str(db.engine.url)
+    with _lock:
+        for key in [key for key in _snapshots if key[0] == url and key[1] in names]:
+            del _snapshots[key]
+    if has_request_context():
+        request.environ.pop(VERSIONS_KEY, None)
+
+def invalidate_table(table_name, connection=None):
+    """invalidate() the stamps depending on `table_name`, if any"""
+    names = TABLE_STAMPS.get(table_name)
+    if names:
+        invalidate(*names, connection=connection)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _track_reference_data(session, flush_context, instances):
+    from school_project.models import AdminNotification, Grade, GradeArchive, Major, Subject, User
+    pending = session.info.setdefault(PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Major):
+            pending.add('majors')
+        elif isinstance(obj, Subject):
+            pending.add('subjects')
+        elif isinstance(obj, (Grade, GradeArchive)):
+            pending.add('grades')
+        elif isinstance(obj, AdminNotification):
+            pending.add('notifications')
+        elif isinstance(obj, User):
+            state = inspect(obj)
+            changed = obj in session.new or obj in session.deleted
+            if obj in session.deleted:
+                # their grades and notifications go with them (ON DELETE CASCADE)
+                pending.update(('grades', 'notifications'))
+            if changed or state.attrs.role.history.has_changes() or state.attrs.major.history.has_changes():
+                # student counts of the majors
+                pending.add('majors')
+            roles = {obj.role, *state.attrs.role.history.deleted}
+            if 'teacher' in roles and (changed or session.is_modified(obj)):
+                # subjects show their teacher's name
+                pending.update(('teachers', 'subjects'))
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _bump_versions(session, flush_context):
+    names = session.info.pop(PENDING_KEY, None)
+    if names:
+        invalidate(*sorted(names), connection=session.connection())
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_reference_data(session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,152 @@
+####################################################################
+###############   Signups and registration decisions  #############
+####################################################################
+# register() creates a pending signup with a single INSERT ... ON
+# CONFLICT (email) DO NOTHING instead of a SELECT followed by an INSERT:
+# the unique constraint on user.email decides who wins when the same
+# email signs up twice at once. The registration number comes from the
+# block allocator of sequences.py, so signups in the same second no
+# longer share one. The user and its admin notification are written in
+# the same transaction, nothing is left behind if one of them fails. The
+# 'notifications' stamp of refcache.py is bumped last, just before the
+# commit, so concurrent signups only queue on it for the commit itself.
+#
+# approve_user/reject_user handle one signup at a time. resolve() takes
+# a list of user ids, or every pending user who asked for a major, and
+# settles them all in one transaction: one UPDATE of "user" (status, and
+# role when approving), one UPDATE resolving their unread admin
+# notifications, then the student counts of the touched majors.
+#
+# These are set-based UPDATEs, so the flush hooks of majors.py,
+# refcache.py and cache.py never see them: the counts, the 'majors'/
+# 'teachers'/'subjects'/'notifications' stamps and the cached users are
+# refreshed here.
+# Users who are no longer pending are reported as skipped and left
+# untouched, so a second run or two admins racing each other change
+# nothing twice.
+from datetime import date, datetime
+
+from sqlalchemy import insert, select, update
+
+from school_project import cache, db, majors, refcache, sequences
+from school_project.models import AdminNotification, Major, User
+
+APPROVED, REJECTED = 'approved', 'rejected'
+APPROVABLE_ROLES = ('student', 'teacher')
+REGISTRATION_SEQUENCE = 'registration'
+
+
+class RegistrationError(ValueError):
+    pass
+
+
+def registration_number():
+    """USER_00000042: unique, unlike the old USER_<timestamp> numbers"""
+    return f'USER_{sequences.next_value(REGISTRATION_SEQUENCE):08d}'
+
+def _insert_new_email(table):
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.email])
+
+def register(email, name, password_hash, **fields):
+    """Create a pending 'visiteur' user and its new_registration notification
+    in one transaction. Returns (user id, notification id), or None when
+    the email is already taken."""
+    number = registration_number()  # reserved outside the signup transaction
+    values = dict(fields, email=email, name=name, password=password_hash, role='visiteur', status='pending',
+                  registration=number, register_date=date.today())
+    # INSERTs bypass the flush hooks of majors.py (a visiteur does not count in student_count).
+    # major_id is a subquery rather than a SELECT beforehand: the INSERT must be the first
+    # statement, a SQLite read transaction cannot always be upgraded to a write under load
+    if values.get('major'):
+        values['major_id'] = select(Major.id).where(Major.major_name == values['major']) \
+            .order_by(Major.id).limit(1).scalar_subquery()
+    try:
+        user_id = db.session.execute(_insert_new_email(User.__table__).values(values)
+                                     .returning(User.__table__.c.id)).scalar()
+        if user_id is None:
+            db.session.rollback()
+            return None
+        notification_id = db.session.execute(insert(AdminNotification.__table__).values(
+            user_id=user_id,
+            notification_type='new_registration',
+            message=f"Nouvel utilisateur {name} ({email}) s'est inscrit et attend l'approbation.",
+            is_read=False,
+            created_at=datetime.now(),
+        ).returning(AdminNotification.__table__.c.id)).scalar()
+        # last statement: the stamp row stays locked only until the commit
+        refcache.invalidate('notifications')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return user_id, notification_id
+
+def resolve(decision, resolved_by, user_ids=None, major=None, role=None):
+    """Approve (with `role`) or reject the pending users among `user_ids`, or
+    all pending users of `major`. Returns one {'id', 'name', 'result'} per
+    user, result being the decision, 'skipped' (with 'status') or 'not_found'."""
+    if decision not in (APPROVED, REJECTED):
+        raise RegistrationError(f'Invalid decision: {decision}')
+    if decision == APPROVED and role not in APPROVABLE_ROLES:
+        raise RegistrationError(f'Invalid role: {role}')
+    if user_ids is None and not major:
+        raise RegistrationError('Give user ids or a major')
+
+    query = select(User.id, User.name, User.status, User.major_id)
+    if user_ids is not None:
+        try:
+            user_ids = sorted({int(user_id) for user_id in user_ids})
+        except (TypeError, ValueError):
+            raise RegistrationError('Invalid user ids') from None
+        query = query.where(User.id.in_(user_ids))
+    else:
+        query = query.where(User.major == major, User.status == 'pending')
+
+    try:
+        # the rows stay locked until the commit (no-op on SQLite, writes are serialized)
+        rows = db.session.execute(query.order_by(User.id).with_for_update()).all()
+        pending = [row for row in rows if row.status == 'pending']
+        ids = [row.id for row in pending]
+        if ids:
+            values = {'status': decision}
+            if decision == APPROVED:
+                values['role'] = role
+            db.session.execute(update(User).where(User.id.in_(ids), User.status == 'pending').values(values)
+                               .execution_options(synchronize_session=False))
+            db.session.execute(update(AdminNotification)
+                               .where(AdminNotification.user_id.in_(ids), AdminNotification.is_read.is_(False))
+                               .values(is_read=True, resolved_at=datetime.now(), resolved_by=resolved_by)
+                               .execution_options(synchronize_session=False))
+            if decision == APPROVED:
+                # visiteur -> student/teacher changes the counts, and teachers show up in the subjects
+                majors.refresh_student_counts(db.session.connection(), {row.major_id for row in pending})
+                refcache.invalidate('majors', 'subjects', 'teachers')
+            refcache.invalidate('notifications')
+            cache.invalidate_after_commit(db.session(), 'users', ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    found = {row.id: row for row in rows}
+    results = []
+    for user_id in (user_ids if user_ids is not None else sorted(found)):
+        row = found.get(user_id)
+        if row is None:
+            results.append({'id': user_id, 'name': None, 'result': 'not_found'})
+        elif row.status != 'pending':
+            results.append({'id': user_id, 'name': row.name, 'result': 'skipped', 'status': row.status})
+        else:
+            results.append({'id': user_id, 'name': row.name, 'result': decision})
+    return results
+
+def counts(results):
+    """{'approved': 3, 'skipped': 1, ...} of a resolve() summary"""
+    totals = {}
+    for result in results:
+        totals[result['result']] = totals.get(result['result'], 0) + 1
+    return totals
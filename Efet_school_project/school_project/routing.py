@@ -0,0 +1,75 @@
+####################################################################
+###############     Read-replica session routing    ################
+####################################################################
+# When REPLICA_DATABASE_URL is set, the read-only helpers of tools.py
+# (wrapped with @read_only) run their SELECTs on the 'replica' bind
+# while everything else, and every flush, goes to the primary.
+#
+# Read-your-writes: once a session has committed a write, all its
+# following reads stay on the primary, and the user's Flask session is
+# pinned to the primary for REPLICA_STICKY_SECONDS so the page shown
+# after a POST/redirect does not miss the row that was just written.
+import os
+import time
+from functools import wraps
+from flask import has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('use_replica') and not self._flushing and not self.info.get('wrote'):
+            engines = self._db.engines
+            if REPLICA_BIND in engines:
+                return engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['pending_write'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.pop('pending_write', False):
+        return
+    session.info['wrote'] = True
+    if has_request_context():
+        from flask import current_app
+        flask_session[STICKY_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('pending_write', None)
+
+
+def configure(app):
+    """Register the replica bind when REPLICA_DATABASE_URL is set"""
+    replica_url = os.environ.get('REPLICA_DATABASE_URL')
+    app.config.setdefault('REPLICA_STICKY_SECONDS', float(os.environ.get('REPLICA_STICKY_SECONDS', 5)))
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = replica_url
+
+def primary_pinned():
+    return has_request_context() and flask_session.get(STICKY_KEY, 0) > time.time()
+
+def read_only(f):
+    """Run a read-only helper on the replica unless the caller must read its own writes"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from school_project import db
+        session = db.session()
+        if session.info.get('use_replica') or primary_pinned():
+            return f(*args, **kwargs)
+        session.info['use_replica'] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            session.info['use_replica'] = False
+    return decorated_function
@@ -0,0 +1,215 @@
+####################################################################
+###############      Indexed full-text search      #################
+####################################################################
+# Backs the typeahead used by the recipient pickers and the admin
+# screens, and the message history search. SQLite gets FTS5
+# external-content tables kept in sync by triggers (so every insert by
+# sendMessage or signup is indexed in the same transaction), PostgreSQL
+# gets tsvector expression indexes plus a trigram index on the user
+# name. Anything else falls back to LIKE.
+import logging
+import re
+from sqlalchemy.exc import SQLAlchemyError
+from school_project import db
+from school_project.enums import Priority, Role, UserStatus
+from school_project.models import Message, User
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ('name', 'email', 'registration', 'phone', 'major')
+MESSAGE_FIELDS = ('content',)
+
+_index_ready = {}  # engine url -> backend name ('fts5', 'postgresql' or 'like')
+
+def _pg_document(fields, alias=''):
+    return "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({alias}{f}, '')" for f in fields) + ")"
+
+PG_DOCUMENT = _pg_document(SEARCH_FIELDS, 'u.')
+PG_MESSAGE_DOCUMENT = _pg_document(MESSAGE_FIELDS, 'm.')
+
+
+def _sqlite_update_trigger(table, fields):
+    """Re-index a row only when one of its indexed columns changes, not on
+    is_read, status or major_id updates"""
+    fts = f'{table}_fts'
+    columns = ', '.join(fields)
+    new_values = ', '.join(f'new.{f}' for f in fields)
+    old_values = ', '.join(f'old.{f}' for f in fields)
+    return (f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END")
+
+def _sqlite_fts_statements(table, fields):
+    """FTS5 external-content table over `table`, kept in sync by triggers"""
+    fts = f'{table}_fts'
+    columns = ', '.join(fields)
+    new_values = ', '.join(f'new.{f}' for f in fields)
+    old_values = ', '.join(f'old.{f}' for f in fields)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        _sqlite_update_trigger(table, fields),
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+def ensure_search_indexes():
+    """Create the user and message search indexes for the current backend if needed,
+    return the backend used"""
+    url = str(db.engine.url)
+    if url in _index_ready:
+        return _index_ready[url]
+
+    dialect = db.engine.dialect.name
+    backend = 'like'
+    try:
+        with db.engine.begin() as conn:
+            if dialect == 'sqlite':
+                for table, fields in (('user', SEARCH_FIELDS), ('message', MESSAGE_FIELDS)):
+                    exists = conn.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': f'{table}_fts'}).first()
+                    if not exists:
+                        for statement in _sqlite_fts_statements(table, fields):
+                            conn.execute(db.text(statement))
+                        continue
+                    # indexes created before the trigger had a column list fired on every UPDATE
+                    trigger = conn.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"),
+                                           {'name': f'{table}_fts_au'}).scalar()
+                    if trigger is None or ' UPDATE OF ' not in trigger.upper():
+                        conn.execute(db.text(f'DROP TRIGGER IF EXISTS {table}_fts_au'))
+                        conn.execute(db.text(_sqlite_update_trigger(table, fields)))
+                backend = 'fts5'
+            elif dialect == 'postgresql':
+                conn.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(db.text(f'CREATE INDEX IF NOT EXISTS ix_user_search_tsv ON "user" USING GIN ({_pg_document(SEARCH_FIELDS)})'))
+                conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_user_name_trgm ON "user" USING GIN (name gin_trgm_ops)'))
+                conn.execute(db.text(f'CREATE INDEX IF NOT EXISTS ix_message_search_tsv ON message USING GIN ({_pg_document(MESSAGE_FIELDS)})'))
+                backend = 'postgresql'
+    except SQLAlchemyError as e:
+        # e.g. SQLite built without FTS5 or no permission to create the extension
+        logger.warning("Search indexes unavailable, using LIKE: %s", e)
+        backend = 'like'
+
+    _index_ready[url] = backend
+    return backend
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())[:8]
+
+def search_users(query, role=None, limit=10, roles=None):
+    """Prefix search over name, email, registration, phone and major, best matches first.
+    `roles` restricts the results to the approved users of these roles (the
+    scope of the caller), `role` to one role."""
+    tokens = _tokens(query or '')
+    if not tokens:
+        return []
+    if role and (role not in Role.__members__ or (roles is not None and role not in roles)):
+        return []
+
+    backend = ensure_search_indexes()
+    params = {'limit': limit}
+    role_filter = ''
+    # coded columns, bound as codes, see enums.py
+    if role:
+        role_filter += ' AND u.role = :role'
+        params['role'] = int(Role[role])
+    if roles is not None:
+        codes = [int(Role[name]) for name in roles] or [0]
+        role_filter += f" AND u.role IN ({', '.join(map(str, codes))}) AND u.status = :approved"
+        params['approved'] = int(UserStatus.approved)
+
+    if backend == 'fts5':
+        # every token must match as a prefix, bm25 weights favour the name
+        params['match'] = ' '.join(f'"{t}"*' for t in tokens)
+        sql = f"""
+            SELECT u.id, u.name, u.email, u.role, u.major, u.registration, u.phone
+            FROM user_fts JOIN user u ON u.id = user_fts.rowid
+            WHERE user_fts MATCH :match{role_filter}
+            ORDER BY bm25(user_fts, 10.0, 5.0, 3.0, 3.0, 1.0)
+            LIMIT :limit
+        """
+    elif backend == 'postgresql':
+        params['tsquery'] = ' & '.join(f'{t}:*' for t in tokens)
+        params['raw'] = ' '.join(tokens)
+        sql = f"""
+            SELECT u.id, u.name, u.email, u.role, u.major, u.registration, u.phone
+            FROM "user" u
+            WHERE ({PG_DOCUMENT} @@ to_tsquery('simple', :tsquery) OR u.name % :raw){role_filter}
+            ORDER BY ts_rank({PG_DOCUMENT}, to_tsquery('simple', :tsquery)) + similarity(u.name, :raw) DESC
+            LIMIT :limit
+        """
+    else:
+        conditions = []
+        for i, token in enumerate(tokens):
+            params[f't{i}'] = f'%{token}%'
+            conditions.append('(' + ' OR '.join(f'lower(u.{f}) LIKE :t{i}' for f in SEARCH_FIELDS) + ')')
+        sql = f"""
+            SELECT u.id, u.name, u.email, u.role, u.major, u.registration, u.phone
+            FROM {'"user"' if db.engine.dialect.name == 'postgresql' else 'user'} u
+            WHERE {' AND '.join(conditions)}{role_filter}
+            ORDER BY u.name
+            LIMIT :limit
+        """
+
+    return db.session.execute(db.text(sql).columns(role=User.role.type), params).fetchall()
+
+def search_messages(user_id, query, priority=None, is_read=None, date_from=None, date_to=None, page=1, per_page=20):
+    """Full-text search in the conversations of user_id, most relevant first.
+    Returns (rows, has_more)."""
+    tokens = _tokens(query or '')
+    if not tokens:
+        return [], False
+
+    backend = ensure_search_indexes()
+    user_table = '"user"' if db.engine.dialect.name == 'postgresql' else 'user'
+    params = {'user_id': user_id, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+
+    filters = ['(m.msg_from = :user_id OR m.msg_to = :user_id)']
+    if priority:
+        if priority not in Priority.__members__:
+            return [], False
+        filters.append('m.priority = :priority')
+        params['priority'] = int(Priority[priority])
+    if is_read is not None:
+        filters.append('m.is_read = :is_read')
+        params['is_read'] = is_read
+    if date_from:
+        filters.append('m.date_sent >= :date_from')
+        params['date_from'] = date_from
+    if date_to:
+        filters.append('m.date_sent < :date_to')
+        params['date_to'] = date_to
+
+    if backend == 'fts5':
+        params['match'] = ' '.join(f'"{t}"*' for t in tokens)
+        source = 'message_fts JOIN message m ON m.id = message_fts.rowid'
+        filters.append('message_fts MATCH :match')
+        order = 'bm25(message_fts), m.date_sent DESC'
+    elif backend == 'postgresql':
+        params['tsquery'] = ' & '.join(f'{t}:*' for t in tokens)
+        source = 'message m'
+        filters.append(f"{PG_MESSAGE_DOCUMENT} @@ to_tsquery('simple', :tsquery)")
+        order = f"ts_rank({PG_MESSAGE_DOCUMENT}, to_tsquery('simple', :tsquery)) DESC, m.date_sent DESC"
+    else:
+        source = 'message m'
+        for i, token in enumerate(tokens):
+            params[f't{i}'] = f'%{token}%'
+            filters.append(f'lower(m.content) LIKE :t{i}')
+        order = 'm.date_sent DESC'
+
+    sql = f"""
+        SELECT m.id AS mid, m.content AS content, m.date_sent AS date_sent,
+               m.priority AS priority, m.is_read AS is_read,
+               m.msg_from AS msg_from_id, m.msg_to AS msg_to_id,
+               u1.name AS msg_from, u2.name AS msg_to
+        FROM {source}
+        JOIN {user_table} u1 ON m.msg_from = u1.id
+        JOIN {user_table} u2 ON m.msg_to = u2.id
+        WHERE {' AND '.join(filters)}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """
+    # typed like tools.get_user_messages: a datetime on every backend
+    rows = db.session.execute(db.text(sql).columns(date_sent=db.DateTime, priority=Message.priority.type), params).fetchall()
+    return rows[:per_page], len(rows) > per_page
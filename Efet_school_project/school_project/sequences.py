@@ -0,0 +1,63 @@
+####################################################################
+###############      Block-allocated sequences      ################
+####################################################################
+# Numbers that must never repeat (registration numbers) come from the
+# sequence_block table. Each process reserves a block of
+# SEQUENCE_BLOCK_SIZE values with a single UPDATE ... RETURNING in its
+# own short transaction, then hands them out from memory under a lock.
+# The database is touched once per block instead of once per number,
+# signups never wait on each other's transaction, and it works the same
+# on SQLite, which has no sequences, and on PostgreSQL.
+#
+# Numbers are unique but not gap-free: whatever is left of a block when
+# a process stops is never used.
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from school_project import db
+from school_project.models import SequenceBlock
+
+_blocks = {}  # (engine url, name) -> [next value, end of block (excluded)]
+_lock = threading.Lock()
+
+
+def configure(app):
+    app.config.setdefault('SEQUENCE_BLOCK_SIZE', int(os.environ.get('SEQUENCE_BLOCK_SIZE', 50)))
+
+def reserve(name, size):
+    """Reserve `size` values of sequence `name` in their own transaction, return the first one"""
+    table = SequenceBlock.__table__
+    for _ in range(2):
+        with db.engine.begin() as conn:
+            end = conn.execute(update(table).where(table.c.name == name)
+                               .values(next_value=table.c.next_value + size)
+                               .returning(table.c.next_value)).scalar()
+            if end is not None:
+                return end - size
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, next_value=1 + size))
+            return 1
+        except IntegrityError:
+            continue  # another process created it first, reserve from its row
+    raise RuntimeError(f'Could not reserve values of sequence {name}')
+
+def next_value(name, block_size=None):
+    """Next value of sequence `name`, unique across threads and processes"""
+    key = (str(db.engine.url), name)
+    with _lock:
+        block = _blocks.get(key)
+        if block is None or block[0] >= block[1]:
+            size = block_size or current_app.config['SEQUENCE_BLOCK_SIZE']
+            start = reserve(name, size)
+            block = _blocks[key] = [start, start + size]
+        value = block[0]
+        block[0] += 1
+    return value
+
+def init_app(app):
+    configure(app)
@@ -0,0 +1,22 @@
+####################################################################
+################       Fast JSON responses       ###################
+####################################################################
+# orjson is several times faster than the json module on the large
+# payloads of the batch endpoints. It is optional: without it we fall
+# back to the standard library.
+import json
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':'), default=str)
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
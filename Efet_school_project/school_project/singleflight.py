@@ -0,0 +1,148 @@
+####################################################################
+###############        Single-flight loading        ################
+####################################################################
+# When a cached aggregate expires, or right after a deploy when every
+# cache is cold, each request in flight would recompute it at the same
+# moment. load() lets one caller compute a key while the others wait
+# for its result:
+#   - within a process, the first thread to miss becomes the leader and
+#     the other threads wait on its Flight;
+#   - across workers, the leader also takes a lock in the shared cache
+#     with add(), which only succeeds when the key is absent (SET NX on
+#     Redis, a conditional upsert on SQLite). The workers that lose the
+#     race poll the cache for the value instead of computing it.
+#
+# Entries outlive their TTL by SINGLEFLIGHT_STALE_TTL seconds: while one
+# caller recomputes an expired entry, the others are served the stale
+# value at once. An entry that was invalidated is gone, never served.
+#
+# The lock expires after SINGLEFLIGHT_LOCK_TTL seconds, so a worker that
+# dies while computing only delays the others, and a caller gives up
+# waiting after SINGLEFLIGHT_WAIT seconds and computes the value itself.
+# With the memory backend the lock is private to the process and only
+# the coalescing between threads applies.
+#
+# Counters per namespace and per process, shown by /admin/cache:
+#   computed   the caller computed the value
+#   coalesced  waited for a thread of the same process computing it
+#   waited     waited for another worker holding the lock
+#   stale      served a stale value while another caller recomputed it
+#   timeouts   gave up waiting and computed the value itself
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+
+COUNTERS = ('computed', 'coalesced', 'waited', 'stale', 'timeouts')
+
+Entry = namedtuple('Entry', 'value fresh_until')  # what load() stores, fresh_until is a time.time()
+
+_flights = {}  # (id of the cache, namespace, key) -> Flight in progress in this process
+_stats = {}  # namespace -> {counter: n}
+_lock = threading.Lock()
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None  # left to None when the leader failed
+
+
+def configure(app):
+    app.config.setdefault('SINGLEFLIGHT_LOCK_TTL', float(os.environ.get('SINGLEFLIGHT_LOCK_TTL', 30)))
+    app.config.setdefault('SINGLEFLIGHT_WAIT', float(os.environ.get('SINGLEFLIGHT_WAIT', 10)))
+    app.config.setdefault('SINGLEFLIGHT_POLL', float(os.environ.get('SINGLEFLIGHT_POLL', 0.05)))
+    app.config.setdefault('SINGLEFLIGHT_STALE_TTL', float(os.environ.get('SINGLEFLIGHT_STALE_TTL', 300)))
+
+def _count(namespace_name, counter):
+    with _lock:
+        stats = _stats.setdefault(namespace_name, dict.fromkeys(COUNTERS, 0))
+        stats[counter] += 1
+
+def stats():
+    """{namespace: {counter: n}} of this process"""
+    with _lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+def _fresh(entry):
+    return isinstance(entry, Entry) and entry.fresh_until > time.time()
+
+def _compute(entries, key, compute, ttl):
+    entry = Entry(compute(), time.time() + ttl)
+    entries.set(key, entry, ttl + current_app.config['SINGLEFLIGHT_STALE_TTL'])
+    _count(entries.name, 'computed')
+    return entry
+
+def _lead(entries, key, compute, ttl, stale):
+    """Compute the entry under the shared lock, or get it from the worker holding it"""
+    config = current_app.config
+    lock_key = f'{key}:lock'
+    if not entries.add(lock_key, os.getpid(), config['SINGLEFLIGHT_LOCK_TTL']):
+        if stale is not None:
+            _count(entries.name, 'stale')
+            return stale
+        _count(entries.name, 'waited')
+        deadline = time.monotonic() + config['SINGLEFLIGHT_WAIT']
+        while True:
+            if time.monotonic() >= deadline:
+                _count(entries.name, 'timeouts')
+                return _compute(entries, key, compute, ttl)
+            time.sleep(config['SINGLEFLIGHT_POLL'])
+            found = entries.get_many([key, lock_key])
+            if _fresh(found.get(key)):
+                return found[key]
+            # no value and no lock: the other worker failed, take over
+            if lock_key not in found and entries.add(lock_key, os.getpid(), config['SINGLEFLIGHT_LOCK_TTL']):
+                break
+    try:
+        return _compute(entries, key, compute, ttl)
+    finally:
+        entries.delete(lock_key)
+
+def load(namespace_name, key, compute, ttl=None):
+    """The value of `key` in the cache namespace, computed with `compute()` by a
+    single caller among the threads and workers asking for it at the same time"""
+    if not has_app_context() or 'cache' not in current_app.extensions:
+        return compute()
+    from school_project import cache
+    entries = cache.namespace(namespace_name)
+    ttl = ttl or entries.cache.default_ttl
+    entry = entries.get(key)
+    if _fresh(entry):
+        return entry.value
+    stale = entry if isinstance(entry, Entry) else None
+
+    flight_key = (id(entries.cache), namespace_name, key)
+    with _lock:
+        flight = _flights.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[flight_key] = Flight()
+    if not leader:
+        if stale is not None:
+            _count(namespace_name, 'stale')
+            return stale.value
+        _count(namespace_name, 'coalesced')
+        if flight.done.wait(current_app.config['SINGLEFLIGHT_WAIT']):
+            if flight.entry is not None:
+                return flight.entry.value
+            return _compute(entries, key, compute, ttl).value  # the leader failed
+        _count(namespace_name, 'timeouts')
+        return _compute(entries, key, compute, ttl).value
+
+    try:
+        flight.entry = _lead(entries, key, compute, ttl, stale)
+        return flight.entry.value
+    finally:
+        with _lock:
+            _flights.pop(flight_key, None)
+        flight.done.set()
+
+def init_app(app):
+    configure(app)
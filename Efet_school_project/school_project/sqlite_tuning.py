@@ -0,0 +1,72 @@
+####################################################################
+###############      SQLite pragma profiles       ##################
+####################################################################
+# Applied on every new SQLite connection (primary and replica binds).
+# The 'production' profile switches to WAL so readers no longer block
+# the writer, relaxes fsyncs to synchronous=NORMAL (safe with WAL), and
+# waits up to busy_timeout ms for a lock instead of failing at once with
+# "database is locked" when teachers enter grades at the same time.
+# It also enforces the foreign keys, which SQLite ignores by default.
+#
+# SQLITE_PRAGMA_PROFILE selects the profile ('production' by default,
+# 'default' keeps SQLite's own settings); SQLITE_PRAGMAS can override
+# single values, e.g. "busy_timeout=10000,mmap_size=0".
+import os
+import sqlite3
+from sqlalchemy import event
+
+PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,          # ms
+        'cache_size': -64000,          # negative = KiB, so 64 MB
+        'mmap_size': 268435456,        # 256 MB
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',          # ON DELETE rules of models.py, see integrity.py
+    },
+}
+
+
+def parse_overrides(value):
+    """'busy_timeout=10000,mmap_size=0' -> {'busy_timeout': '10000', 'mmap_size': '0'}"""
+    overrides = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            overrides[name.strip()] = setting.strip()
+    return overrides
+
+def configure(app):
+    profile = os.environ.get('SQLITE_PRAGMA_PROFILE', 'production')
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown SQLITE_PRAGMA_PROFILE: {profile}')
+    pragmas = dict(PROFILES[profile])
+    pragmas.update(parse_overrides(os.environ.get('SQLITE_PRAGMAS')))
+    app.config.setdefault('SQLITE_PRAGMAS', pragmas)
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if not name.replace('_', '').isalnum():
+                raise ValueError(f'Invalid pragma name: {name}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+def init_app(app, db):
+    """Install the connect hook on every SQLite engine of the app"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite':
+                continue
+
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                if isinstance(dbapi_connection, sqlite3.Connection):
+                    apply_pragmas(dbapi_connection, pragmas)
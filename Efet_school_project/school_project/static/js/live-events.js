@@ -0,0 +1,73 @@
+// Live notifications for new messages and registrations
+//
+// Listens to /events/stream (Server-Sent Events) and falls back to
+// polling /events/poll every POLL_INTERVAL when the stream is refused
+// (disabled on threaded workers, or too many open). Every event is
+// re-dispatched on window as `efet:<type>` so pages can react to it,
+// and a short toast is shown for the ones a user cares about.
+
+(function() {
+    const POLL_INTERVAL = 15000;  // ms between two polls, each one answered at once
+    const POLL_BACKOFF = 30000;   // ms before polling again after an error
+
+    const messages = {
+        new_message: data => `Nouveau message de ${data.from}`,
+        new_registration: data => `Nouvelle inscription : ${data.name}`,
+        registration_resolved: data => `Inscription de ${data.name} : ${data.status === 'approved' ? 'approuvée' : 'rejetée'}`,
+    };
+
+    let lastId = null;
+
+    function toast(text) {
+        const element = document.createElement('div');
+        element.textContent = text;
+        element.style.cssText = 'position:fixed;right:1rem;bottom:1rem;z-index:2000;padding:0.75rem 1rem;' +
+            'background:#1e293b;color:#fff;border-radius:0.5rem;box-shadow:0 4px 12px rgba(0,0,0,0.2);' +
+            'font-size:0.9rem;cursor:pointer;';
+        element.addEventListener('click', () => window.location.reload());
+        document.body.appendChild(element);
+        setTimeout(() => element.remove(), 6000);
+    }
+
+    function handle(type, data, id) {
+        if (id) lastId = id;
+        window.dispatchEvent(new CustomEvent(`efet:${type}`, { detail: data }));
+        // Don't announce the messages the user just sent
+        if (type === 'new_message' && data.from_id === window.EFET_USER_ID) return;
+        if (messages[type]) toast(messages[type](data));
+    }
+
+    function poll() {
+        const params = new URLSearchParams({ wait: 0 });
+        if (lastId !== null) params.set('since', lastId);
+        fetch(`/events/poll?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                data.events.forEach(event => handle(event.type, event.data, event.id));
+                lastId = data.last_id;
+                setTimeout(poll, POLL_INTERVAL);
+            })
+            .catch(() => setTimeout(poll, POLL_BACKOFF));
+    }
+
+    function listen() {
+        if (!window.EventSource) {
+            poll();
+            return;
+        }
+        const source = new EventSource('/events/stream');
+        Object.keys(messages).concat(['message_read']).forEach(type => {
+            source.addEventListener(type, event => handle(type, JSON.parse(event.data), Number(event.lastEventId)));
+        });
+        source.addEventListener('error', () => {
+            // CLOSED means the server refused the stream (SSE disabled or too many streams), switch to polling
+            if (source.readyState === EventSource.CLOSED) poll();
+        });
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', listen);
+    } else {
+        listen();
+    }
+})();
@@ -0,0 +1,123 @@
+// Typeahead recipient picker backed by /search/users
+//
+// Markup:
+//   <div class="user-picker" data-role="student">
+//     <input type="text" class="user-picker-input" placeholder="...">
+//     <input type="hidden" name="recipient_id">
+//   </div>
+// data-role is optional and restricts the results to one role.
+
+(function() {
+    const style = document.createElement('style');
+    style.textContent = `
+        .user-picker { position: relative; }
+        .user-picker-results { position: absolute; z-index: 1060; left: 0; right: 0; top: 100%;
+            margin: 2px 0 0; padding: 0; list-style: none; background: #fff; border: 1px solid #e2e8f0;
+            border-radius: 0.375rem; box-shadow: 0 4px 12px rgba(0,0,0,0.1); max-height: 260px; overflow-y: auto; }
+        .user-picker-results:empty { display: none; }
+        .user-picker-results li { padding: 0.5rem 0.75rem; cursor: pointer; }
+        .user-picker-results li.active, .user-picker-results li:hover { background: #f1f5f9; }
+        .user-picker-results small { color: #64748b; margin-left: 0.5rem; }
+    `;
+    document.head.appendChild(style);
+
+    const roleLabels = { student: 'Étudiant', teacher: 'Enseignant', admin: 'Administration', owner: 'Administration' };
+
+    function initPicker(picker) {
+        const input = picker.querySelector('.user-picker-input');
+        const hidden = picker.querySelector('input[type="hidden"]');
+        const results = document.createElement('ul');
+        results.className = 'user-picker-results';
+        picker.appendChild(results);
+
+        let timer = null;
+        let lastQuery = '';
+        let active = -1;
+
+        function select(user) {
+            hidden.value = user.id;
+            input.value = user.name;
+            results.innerHTML = '';
+            picker.dispatchEvent(new CustomEvent('user-picked', { detail: user }));
+        }
+
+        function render(users) {
+            results.innerHTML = '';
+            active = -1;
+            users.forEach(user => {
+                const li = document.createElement('li');
+                li.textContent = user.name;
+                const details = document.createElement('small');
+                details.textContent = [roleLabels[user.role] || user.role, user.major].filter(Boolean).join(' - ');
+                li.appendChild(details);
+                li.addEventListener('mousedown', e => { e.preventDefault(); select(user); });
+                li.user = user;
+                results.appendChild(li);
+            });
+        }
+
+        function lookup() {
+            const query = input.value.trim();
+            if (query === lastQuery) return;
+            lastQuery = query;
+            if (!query) { render([]); return; }
+
+            const params = new URLSearchParams({ q: query, limit: 10 });
+            if (picker.dataset.role) params.set('role', picker.dataset.role);
+            fetch(`/search/users?${params}`)
+                .then(response => response.json())
+                .then(data => {
+                    // Ignore answers to queries the user already typed past
+                    if (data.success && input.value.trim() === query) render(data.users);
+                })
+                .catch(error => console.error('User search failed:', error));
+        }
+
+        input.setAttribute('autocomplete', 'off');
+        input.addEventListener('input', () => {
+            hidden.value = '';
+            clearTimeout(timer);
+            timer = setTimeout(lookup, 150);
+        });
+        input.addEventListener('keydown', e => {
+            const items = results.querySelectorAll('li');
+            if (!items.length) return;
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                if (active >= 0) items[active].classList.remove('active');
+                active = (active + (e.key === 'ArrowDown' ? 1 : items.length - 1)) % items.length;
+                items[active].classList.add('active');
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                select(items[active].user);
+            } else if (e.key === 'Escape') {
+                results.innerHTML = '';
+            }
+        });
+        input.addEventListener('blur', () => setTimeout(() => { results.innerHTML = ''; }, 100));
+
+        const form = picker.closest('form');
+        if (form) {
+            form.addEventListener('submit', e => {
+                if (!hidden.value) {
+                    e.preventDefault();
+                    input.focus();
+                    alert('Veuillez choisir un destinataire dans la liste.');
+                }
+            });
+        }
+
+        // Allow other scripts to preselect a recipient
+        picker.setUser = select;
+    }
+
+    function initAll() {
+        document.querySelectorAll('.user-picker').forEach(initPicker);
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', initAll);
+    } else {
+        initAll();
+    }
+})();
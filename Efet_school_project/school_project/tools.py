@@ -2,66 +2,84 @@ from flask import Blueprint, render_template, flash, g, request, redirect, url_f
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from school_project import create_app
-from school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog
-import sqlite3
+from school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog, GradeArchive, AbsenceArchive
 from school_project import db
+from school_project.routing import read_only
+from school_project.refcache import cached
+from school_project.enums import Priority
 
+# "user" is quoted in the raw queries below: it is a reserved word on PostgreSQL
 
-def connect_db():
-    import os
-    # Use absolute path for better reliability
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    db_path = os.path.join(base_dir, 'instance', 'db.sqlite')
-    sql = sqlite3.connect(db_path)
-    sql.row_factory = sqlite3.Row
-    return sql
-
-def get_db():
-    #Check if DB is there
-    if not hasattr(g, 'sqlite3'):
-        g.sqlite3_db = connect_db()
-    return g.sqlite3_db
+_message_columns = {}  # engine url -> columns of the message table
 
+@read_only
 def get_all_payments(student_id):
-    db = get_db()
     #create table payment(id integer primary key autoincrement, student_id integer, month_paid date, payment_date date, amount float, status text)
-    cursor = db.execute(f"select p.id, p.student_id, p.month_paid, p.payment_date, p.amount, p.status, p.type, u.name from payment p INNER JOIN user u ON p.student_id=u.id where p.student_id = {student_id}")
-    results = cursor.fetchall()
+    query = db.text('select p.id, p.student_id, p.month_paid, p.payment_date, p.amount, p.status, p.type, u.name from payment p INNER JOIN "user" u ON p.student_id=u.id where p.student_id = :student_id') \
+        .columns(status=Payment.status.type, type=Payment.type.type)
+    results = db.session.execute(query, {'student_id': student_id}).fetchall()
     return results
 
+@read_only
 def get_student_infos(student_id):
     user = User.query.filter_by(id=student_id).first()
     return user
 
+# Listings and <select>s get plain rows of the columns they show, not User objects:
+# no password hash or about_me loaded, no identity map to fill
+USER_LIST_FIELDS = ('id', 'name', 'email', 'role', 'status', 'major', 'register_date', 'profile_picture')
+STUDENT_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'age', 'gender', 'registration', 'role',
+                  'major', 'year', 'register_date', 'profile_picture')
+
+def _user_rows(fields, *criteria):
+    columns = [getattr(User, field) for field in fields]
+    return db.session.execute(db.select(*columns).where(*criteria).order_by(User.id)).all()
+
+@read_only
 def get_all_users():
-    users = User.query.all()
+    users = _user_rows(USER_LIST_FIELDS)
     return users
 
+@read_only
 def get_all_students():
-    users = User.query.filter_by(role='student').all()
+    users = _user_rows(STUDENT_FIELDS, User.role == 'student')
     return users
 
-def get_all_grades(student_id):
+@read_only
+def get_all_grades(student_id, include_archived=False):
     # this function retrieves student's grades from table Grade
     grades = Grade.query.filter_by(student_id=student_id).all()
+    if include_archived:
+        # archived rows carry their academic_year, templates use it to hide the edit actions
+        grades += GradeArchive.query.filter_by(student_id=student_id).order_by(GradeArchive.grade_date).all()
     return grades
 
+@read_only
+@cached('majors')
 def get_all_majors():
-    db = get_db()
-    cursor = db.execute(f"SELECT major.id, major.major_name AS major_name, duration, COUNT(user.id) AS number_students FROM major LEFT JOIN user ON major.major_name = user.major GROUP BY major.major_name ORDER BY number_students desc;")
-    majors = cursor.fetchall()
+    # student_count is maintained by majors.py, no join on "user" needed
+    majors = db.session.execute(db.text('SELECT id, major_name, duration, COALESCE(student_count, 0) AS number_students FROM major ORDER BY number_students desc')).fetchall()
     return majors
 
-def get_user_messages(student_id):
-    db = get_db()
-    
-    # Check if new columns exist in the message table
-    cursor = db.execute("PRAGMA table_info(message)")
-    columns = [col[1] for col in cursor.fetchall()]
+@read_only
+def get_user_messages(student_id, include_archived=False):
+    # Check if new columns exist in the message table (once per database)
+    url = str(db.engine.url)
+    if url not in _message_columns:
+        _message_columns[url] = [col['name'] for col in db.inspect(db.engine).get_columns('message')]
+    columns = _message_columns[url]
     
     has_priority = 'priority' in columns
     has_is_read = 'is_read' in columns
     
+    source = 'message'
+    if include_archived:
+        # the archive always has priority and is_read, the old message table may not
+        fields = 'id, content, msg_from, msg_to, date_sent'
+        hot_fields = fields + (', priority' if has_priority else f', {Priority.normal:d} AS priority') + (', is_read' if has_is_read else ', 0 AS is_read')
+        source = f'(SELECT {hot_fields} FROM message UNION ALL SELECT {fields}, priority, is_read FROM message_archive)'
+        has_priority = has_is_read = True
+    
     # Build query based on available columns
     base_query = f"""
         SELECT m.id AS mid, 
@@ -73,7 +91,7 @@ def get_user_messages(student_id):
     if has_priority:
         base_query += ",\n               m.priority AS priority"
     else:
-        base_query += ",\n               'normal' AS priority"
+        base_query += f",\n               {Priority.normal:d} AS priority"
     
     if has_is_read:
         base_query += ",\n               m.is_read AS is_read"
@@ -83,63 +101,113 @@ def get_user_messages(student_id):
     base_query += f""",
                u1.role AS sender_role,
                u2.role AS recipient_role
-        FROM message m 
-        JOIN user u1 ON m.msg_from = u1.id 
-        JOIN user u2 ON m.msg_to = u2.id 
-        WHERE u1.id = {student_id} OR u2.id = {student_id}
+        FROM {source} m 
+        JOIN "user" u1 ON m.msg_from = u1.id 
+        JOIN "user" u2 ON m.msg_to = u2.id 
+        WHERE u1.id = :student_id OR u2.id = :student_id
         ORDER BY m.date_sent DESC
     """
     
-    cursor = db.execute(base_query)
-    messages = cursor.fetchall()
+    # typed so that templates get a datetime on every backend
+    query = db.text(base_query).columns(date_sent=db.DateTime, priority=Message.priority.type,
+                                        sender_role=User.role.type, recipient_role=User.role.type)
+    messages = db.session.execute(query, {'student_id': student_id}).fetchall()
     return messages
 
-def get_student_absence(student_id):
+@read_only
+def get_student_absence(student_id, include_archived=False):
     absence = Absence.query.filter_by(student_id=student_id).all()
+    if include_archived:
+        absence += AbsenceArchive.query.filter_by(student_id=student_id).order_by(AbsenceArchive.date_absence).all()
     return absence
 
-def get_grades_mean(student_id):
-    db = get_db()
-    cursor = db.execute(f"select sum(grade)/count(*) AS mean, subject from grade where student_id = {student_id} group by subject;")
-    grades_mean = cursor.fetchall()
+@read_only
+@cached('grades')
+def get_grades_mean(student_id, include_archived=False):
+    source = "grade"
+    if include_archived:
+        source = "(select student_id, grade, subject from grade union all select student_id, grade, subject from grade_archive) g"
+    grades_mean = db.session.execute(db.text(f"select sum(grade)/count(*) AS mean, subject from {source} where student_id = :student_id group by subject"), {'student_id': student_id}).fetchall()
     return grades_mean
 
+@read_only
+@cached('subjects')
 def get_all_subjects():
-    db = get_db()
-    cursor = db.execute(f"select subject.id as id, subject.name as name, user.name as teacher_name from subject join user on subject.id_prof = user.id;")
-    subjects = cursor.fetchall()
+    subjects = db.session.execute(db.text('select subject.id as id, subject.name as name, u.name as teacher_name from subject left join "user" u on subject.id_prof = u.id')).fetchall()
     return subjects
 
+TEACHER_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'registration', 'role', 'profile_picture')
+
+@read_only
+@cached('teachers')
 def get_all_teachers():
-    teacher = User.query.filter_by(role='teacher').all()
+    # plain rows rather than User objects: the snapshot outlives the session
+    teacher = _user_rows(TEACHER_FIELDS, User.role == 'teacher')
     return teacher
 
+@read_only
 def get_all_absence():
-    db = get_db()
-    cursor = db.execute(f"select a.id as id, a.student_id as student_id, a.date_absence as date_absence, a.justified as justified, a.details as details, u.name as student_name from absence a join user u on u.id = a.student_id;")
-    all_absence = cursor.fetchall()
+    query = db.text('select a.id as id, a.student_id as student_id, a.date_absence as date_absence, a.justified as justified, a.details as details, u.name as student_name from absence a join "user" u on u.id = a.student_id') \
+        .columns(justified=Absence.justified.type)
+    all_absence = db.session.execute(query).fetchall()
     return all_absence
 
+@read_only
 def get_one_payment(payment_id):
     payment = Payment.query.filter_by(id=payment_id).first()
     return payment
 
+@read_only
 def get_pending_users():
     """Get all users with pending status"""
-    users = User.query.filter_by(status='pending').all()
+    users = _user_rows(USER_LIST_FIELDS, User.status == 'pending')
     return users
 
+NOTIFICATION_FIELDS = ('id', 'user_id', 'notification_type', 'message', 'is_read', 'created_at', 'resolved_at', 'resolved_by')
+
+@read_only
+@cached('notifications')
 def get_admin_notifications():
-    """Get all admin notifications"""
-    notifications = AdminNotification.query.order_by(AdminNotification.created_at.desc()).all()
+    """Get all admin notifications, with the name of their user (None if the user is gone)"""
+    columns = [getattr(AdminNotification, field) for field in NOTIFICATION_FIELDS]
+    notifications = db.session.execute(db.select(*columns, User.name.label('user_name'))
+                                       .outerjoin(User, User.id == AdminNotification.user_id)
+                                       .order_by(AdminNotification.created_at.desc())).all()
+    return notifications
+
+@read_only
+@cached('notifications')
+def get_unread_notifications():
+    """Unread admin notifications, newest first"""
+    columns = [getattr(AdminNotification, field) for field in NOTIFICATION_FIELDS]
+    notifications = db.session.execute(db.select(*columns).where(AdminNotification.is_read.is_(False))
+                                       .order_by(AdminNotification.created_at.desc())).all()
     return notifications
 
+@read_only
 def get_unread_notifications_count():
     """Get count of unread admin notifications"""
     count = AdminNotification.query.filter_by(is_read=False).count()
     return count
 
+@read_only
 def get_user_emails(user_id):
     """Get all emails sent to a user"""
     emails = EmailLog.query.filter_by(recipient_id=user_id).order_by(EmailLog.sent_at.desc()).all()
     return emails
+
+# Columns the JSON user endpoints may return (password hash and free text excluded)
+USER_DATA_FIELDS = ('id', 'name', 'email', 'age', 'address', 'registration', 'gender', 'role', 'status', 'major', 'year', 'phone', 'register_date')
+
+@read_only
+def get_users_data(user_ids, fields=USER_DATA_FIELDS):
+    """Load only the requested columns of many users with a single IN query, as dicts"""
+    columns = [getattr(User, field) for field in fields if field != 'id']
+    rows = db.session.query(User.id, *columns).filter(User.id.in_(user_ids)).all()
+    users = []
+    for row in rows:
+        user_data = dict(row._mapping)
+        if user_data.get('register_date') is not None:
+            user_data['register_date'] = user_data['register_date'].strftime('%Y-%m-%d')
+        users.append(user_data)
+    return users
@@ -2,6 +2,8 @@
 """
 Database Migration Script for Railway Deployment
 This script initializes the PostgreSQL database with all required tables
+and applies the pending migrations (school_project/migrations.py) in order.
+Runs before gunicorn on every deploy, see the Procfile.
 """
 
 import os
@@ -17,23 +19,17 @@ sys.path.insert(0, current_dir)
 sys.path.insert(0, app_dir)
 sys.path.insert(0, school_project_dir)
 
+# The modules import each other as `school_project` (app_dir is on the
+# path): importing them as Efet_school_project.school_project would load
+# a second copy with its own SQLAlchemy instance
 try:
-    from Efet_school_project.school_project import create_app, db
-    from Efet_school_project.school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog
+    from school_project import create_app, db, migrations
+    from school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog
     from werkzeug.security import generate_password_hash
     from datetime import datetime
 except ImportError as e:
     print(f"Import error: {e}")
-    print("Trying alternative import paths...")
-    try:
-        os.chdir(app_dir)  # Change to app directory
-        from school_project import create_app, db
-        from school_project.models import User, Payment, Grade, Major, Message, Absence, Subject, AdminNotification, EmailLog
-        from werkzeug.security import generate_password_hash
-        from datetime import datetime
-    except ImportError as e2:
-        print(f"Secondary import error: {e2}")
-        sys.exit(1)
+    sys.exit(1)
 
 def create_admin_user():
     """Create a default admin user if none exists"""
@@ -121,6 +117,11 @@ def main():
             db.create_all()
             print("✅ Database tables created successfully!")
             
+            # Existing databases: the migrate_*.py scripts not applied yet
+            print("🔧 Applying pending migrations...")
+            applied = migrations.run(app)
+            print(f"✅ {len(applied)} migrations applied: {', '.join(applied)}" if applied else "✅ Migrations up to date")
+            
             # Create admin user
             print("👤 Setting up admin user...")
             create_admin_user()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Absence streaks count school days: a weekend does not break them"""
+
+import sys
+import os
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project.attendance import compress, current_streak, longest_streak, school_days_mask, term_bounds
+
+TERM = '2024-S1'
+START = term_bounds(TERM)[0]
+
+
+def absences(*days):
+    bits = 0
+    for day in days:
+        bits |= 1 << (day - START).days
+    return bits
+
+def streaks(bits, as_of):
+    school_days = school_days_mask(TERM, until=as_of)
+    packed = compress(bits, school_days)
+    return longest_streak(packed), current_streak(packed, school_days.bit_count() - 1)
+
+def test_friday_to_monday_is_a_two_day_streak():
+    # Friday 2024-09-06 and Monday 2024-09-09
+    bits = absences(date(2024, 9, 6), date(2024, 9, 9))
+    assert streaks(bits, date(2024, 9, 9)) == (2, 2)
+    # back on Tuesday: the current streak ends, the longest one stays
+    assert streaks(bits, date(2024, 9, 10)) == (2, 0)
+
+def test_weekend_absences_are_ignored():
+    bits = absences(date(2024, 9, 7), date(2024, 9, 8))
+    assert streaks(bits, date(2024, 9, 9)) == (0, 0)
+
+
+if __name__ == '__main__':
+    test_friday_to_monday_is_a_two_day_streak()
+    test_weekend_absences_are_ignored()
+    print("SUCCESS: absence streaks span weekends")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Cache backends, and cached users dropped after every write that changes them"""
+
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from werkzeug.security import generate_password_hash
+
+from school_project import cache
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_user(email, role, major=None):
+    from school_project import db
+    from school_project.models import User
+    user = User(email=email, name=email, password=generate_password_hash('pw', method='pbkdf2:sha256'),
+                role=role, status='approved', major=major)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def check_backend(backend):
+    users = cache.Cache(backend, prefix='test').namespace('users')
+    users.set(1, {'name': 'Eleve'})
+    assert users.get(1) == {'name': 'Eleve'}
+    assert users.add(1, 'other') is False
+    assert users.add(2, 'lock', ttl=0.05) is True
+    time.sleep(0.1)
+    assert users.get(2) is None
+    assert users.add(2, 'lock again') is True  # the expired entry is replaced
+    users.delete(1)
+    assert users.get(1) is None
+    users.set_many({3: 'a', 4: 'b'})
+    cache.Cache(backend, prefix='test').namespace('pages').set('/', 'page')
+    users.clear()
+    assert users.get_many([3, 4]) == {}
+    assert cache.Cache(backend, prefix='test').namespace('pages').get('/') == 'page'
+
+def test_memory_backend():
+    check_backend(cache.MemoryBackend())
+
+def test_memory_backend_evicts_the_least_recently_used():
+    pages = cache.Cache(cache.MemoryBackend(max_entries=2)).namespace('pages')
+    pages.set('a', 1)
+    pages.set('b', 2)
+    pages.get('a')
+    pages.set('c', 3)
+    assert pages.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+
+def test_sqlite_backend_is_shared_between_processes():
+    path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+    check_backend(cache.SQLiteBackend(path))
+    # two workers on the same file: one deletes, the other misses
+    first = cache.Cache(cache.SQLiteBackend(path)).namespace('users')
+    second = cache.Cache(cache.SQLiteBackend(path)).namespace('users')
+    first.set(7, 'cached')
+    assert second.get(7) == 'cached'
+    second.delete(7)
+    assert first.get(7) is None
+
+def test_cached_user_has_no_password():
+    app = make_app(CACHE_BACKEND='sqlite', CACHE_SQLITE_PATH=os.path.join(tempfile.mkdtemp(), 'cache.sqlite'))
+    from school_project import db
+    with app.app_context():
+        user_id = add_user('eleve@efet.ma', 'student')
+        db.session.remove()
+        cache.load_user(user_id)
+        assert 'password' not in cache.namespace('users').get(user_id)
+        db.session.remove()
+        user = cache.load_user(user_id)  # from the cache this time
+        assert user.email == 'eleve@efet.ma'
+        assert user.password.startswith('pbkdf2:sha256')
+
+def test_user_change_drops_the_cached_user_on_commit():
+    app = make_app()
+    from school_project import db
+    from school_project.models import User
+    with app.app_context():
+        user_id = add_user('eleve@efet.ma', 'student')
+        cache.load_user(user_id)
+        db.session.get(User, user_id).name = 'Nouveau nom'
+        db.session.flush()
+        assert cache.namespace('users').get(user_id) is not None  # not before the commit
+        db.session.commit()
+        assert cache.namespace('users').get(user_id) is None
+        db.session.remove()
+        assert cache.load_user(user_id).name == 'Nouveau nom'
+
+def test_delete_major_drops_the_cached_students():
+    # the students are unlinked by a bulk UPDATE the flush hooks never see
+    app = make_app()
+    from school_project import db
+    from school_project.models import Major
+    with app.app_context():
+        major = Major(major_name='Informatique', duration=2)
+        db.session.add(major)
+        db.session.commit()
+        major_id = major.id
+        add_user('admin@efet.ma', 'admin')
+        student_id = add_user('eleve@efet.ma', 'student', major='Informatique')
+        db.session.remove()
+        assert cache.load_user(student_id).major_id == major_id
+        db.session.remove()
+
+    with app.test_client() as client:
+        client.post('/login', data={'email': 'admin@efet.ma', 'password': 'pw'})
+        assert client.post('/deleteMajor', data={'major_id': major_id}).status_code == 302
+
+    with app.app_context():
+        assert cache.namespace('users').get(student_id) is None
+        assert cache.load_user(student_id).major_id is None
+
+
+if __name__ == '__main__':
+    test_memory_backend()
+    test_memory_backend_evicts_the_least_recently_used()
+    test_sqlite_backend_is_shared_between_processes()
+    test_cached_user_has_no_password()
+    test_user_change_drops_the_cached_user_on_commit()
+    test_delete_major_drops_the_cached_students()
+    print("SUCCESS: cached users follow the database")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""A gradebook batch inserts, updates and deletes cells at once, or is refused as a whole"""
+
+import sys
+import os
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import gradebook
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def setup():
+    """The Algèbre subject, two students of Informatique and one of Gestion
+    with a grade each, returns (student ids, grade ids)"""
+    from school_project import db
+    from school_project.models import Grade, Major, Subject, User
+    db.session.add_all([Major(major_name='Informatique', duration=2), Major(major_name='Gestion', duration=2),
+                        Subject(name='Algèbre')])
+    students = [User(email=f'{name}@efet.ma', name=name, role='student', status='approved', major=major)
+                for name, major in (('Amine', 'Informatique'), ('Sara', 'Informatique'), ('Youssef', 'Gestion'))]
+    db.session.add_all(students)
+    db.session.flush()
+    grades = [Grade(student_id=student.id, subject='Algèbre', grade=10, grade_date=date(2024, 10, 1)) for student in students]
+    db.session.add_all(grades)
+    db.session.commit()
+    return [student.id for student in students], [grade.id for grade in grades]
+
+def test_batch_is_written_at_once():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        from school_project.models import Grade
+        (amine, sara, _), _ = setup()
+        summary = gradebook.apply_changes('Algèbre', 'Informatique', [
+            {'student_id': amine, 'grade_date': '2024-10-01', 'grade': '14'},  # update
+            {'student_id': sara, 'grade_date': '2024-10-01', 'grade': ''},  # delete
+            {'student_id': amine, 'grade_date': '2024-10-15', 'grade': 18},  # insert
+            {'student_id': sara, 'grade_date': '2024-10-15', 'grade': '12.5'},
+        ])
+        assert (summary['inserted'], summary['updated'], summary['deleted']) == (2, 1, 1)
+        assert summary['means'] == {amine: 16.0, sara: 12.5}
+        assert summary['major_mean'] == 14.25
+
+        students, dates, cells = gradebook.sheet('Algèbre', 'Informatique')
+        assert [name for _, name in students] == ['Amine', 'Sara']
+        assert dates == [date(2024, 10, 1), date(2024, 10, 15)]
+        assert (sara, date(2024, 10, 1)) not in cells
+        assert db.session.query(Grade).count() == 4  # the Gestion grade is untouched
+
+def test_invalid_batch_writes_nothing():
+    app = make_app()
+    with app.app_context():
+        from school_project.models import Grade
+        (amine, sara, youssef), (_, _, youssef_grade) = setup()
+        changes = [
+            {'student_id': amine, 'grade_date': '2024-10-15', 'grade': 21},
+            {'student_id': sara, 'grade_date': '15/10/2024', 'grade': 12},
+            {'student_id': youssef, 'grade_date': '2024-10-15', 'grade': 12},
+            {'student_id': sara, 'grade_date': '2024-10-20', 'grade': 12},
+            {'student_id': sara, 'grade_date': '2024-10-20', 'grade': 13},
+        ]
+        try:
+            gradebook.apply_changes('Algèbre', 'Informatique', changes)
+        except gradebook.GradebookError as e:
+            assert e.errors == [
+                f'Invalid grade for student {amine} on 2024-10-15: 21',
+                f'Invalid cell: {changes[1]!r}',
+                f'Student {youssef} is not in Informatique',
+                f'Cell of student {sara} on 2024-10-20 is listed twice',
+            ]
+        else:
+            raise AssertionError('the batch was accepted')
+        assert sorted(grade.grade for grade in Grade.query) == [10, 10, 10]
+
+        # a grade id must be the one of the cell it edits
+        try:
+            gradebook.apply_changes('Algèbre', 'Informatique', [
+                {'student_id': amine, 'grade_date': '2024-10-01', 'grade': 15, 'id': youssef_grade}])
+        except gradebook.GradebookError as e:
+            assert e.errors == [f'Grade {youssef_grade} is not the cell of student {amine} on 2024-10-01']
+        else:
+            raise AssertionError('the batch was accepted')
+
+def test_unknown_subject_and_major_are_refused():
+    app = make_app()
+    with app.app_context():
+        setup()
+        try:
+            gradebook.parse_changes('Chimie', 'Droit', [])
+        except gradebook.GradebookError as e:
+            assert e.errors == ['Unknown subject: Chimie', 'Unknown major: Droit']
+        else:
+            raise AssertionError('the batch was accepted')
+
+
+if __name__ == '__main__':
+    test_batch_is_written_at_once()
+    test_invalid_batch_writes_nothing()
+    test_unknown_subject_and_major_are_refused()
+    print("SUCCESS: gradebook batches are written or refused as a whole")
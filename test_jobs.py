@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Jobs are claimed by one worker at a time, retried with backoff and scheduled once"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import jobs
+
+CALLS = []
+
+
+@jobs.task('test_record', priority=0)
+def record(value=None):
+    CALLS.append(value)
+
+@jobs.task('test_flaky', max_attempts=2)
+def flaky(failures):
+    CALLS.append('flaky')
+    if CALLS.count('flaky') <= failures:
+        raise RuntimeError('database unavailable')
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def job(job_id):
+    from school_project import db
+    from school_project.models import Job
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+def enqueue(name, payload=None, priority=None):
+    from school_project import db
+    queued = jobs.enqueue(name, payload, priority)
+    db.session.commit()
+    return queued.id
+
+def test_workers_claim_the_most_urgent_job_once():
+    app = make_app()
+    with app.app_context():
+        low = enqueue('test_record', {'value': 'low'})
+        high = enqueue('test_record', {'value': 'high'}, priority=5)
+        first, second = jobs.JobWorker(app), jobs.JobWorker(app)
+        assert first.claim().id == high
+        assert second.claim().id == low
+        assert jobs.JobWorker(app).claim() is None
+        assert (job(high).status, job(high).claimed_by, job(high).attempts) == ('running', first.worker_id, 1)
+
+def test_expired_lease_is_claimed_again():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        job_id = enqueue('test_record')
+        jobs.JobWorker(app).claim()
+        assert jobs.JobWorker(app).claim() is None  # still leased
+        job(job_id).run_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        assert jobs.JobWorker(app).claim().attempts == 2
+
+def test_failed_job_is_retried_with_backoff():
+    app = make_app(JOBS_BACKOFF='30')
+    CALLS.clear()
+    with app.app_context():
+        from school_project import db
+        job_id = enqueue('test_flaky', {'failures': 1})
+        worker = jobs.JobWorker(app)
+        assert worker.run_one() is True
+        failed = job(job_id)
+        assert (failed.status, failed.attempts, failed.last_error) == ('pending', 1, 'RuntimeError: database unavailable')
+        assert failed.run_at > datetime.now() + timedelta(seconds=25)
+        assert worker.run_one() is False  # not due yet
+
+        failed.run_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        assert worker.run_one() is True
+        done = job(job_id)
+        assert (done.status, done.attempts, done.run_at) == ('done', 2, None)
+        assert CALLS == ['flaky', 'flaky']
+
+def test_job_fails_after_its_last_attempt():
+    app = make_app(JOBS_BACKOFF='0')
+    CALLS.clear()
+    with app.app_context():
+        job_id = enqueue('test_flaky', {'failures': 5})
+        worker = jobs.JobWorker(app)
+        while worker.run_one():
+            pass
+        assert (job(job_id).status, job(job_id).attempts) == ('failed', 2)
+
+def test_next_run_of_a_cron_expression():
+    assert jobs.next_run('0 6 25 * *', datetime(2024, 9, 25, 6, 0)) == datetime(2024, 10, 25, 6, 0)
+    assert jobs.next_run('*/10 8-18 * * 1-5', datetime(2024, 9, 6, 18, 55)) == datetime(2024, 9, 9, 8, 0)  # Friday evening -> Monday
+
+def test_scheduler_enqueues_each_entry_once():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        from school_project.models import Job, JobSchedule
+        now = datetime(2024, 9, 24, 12, 0)
+        assert jobs.run_scheduler(now) == []  # first run: only records the next run times
+        assert db.session.get(JobSchedule, 'monthly_dues').next_run_at == datetime(2024, 9, 25, 6, 0)
+
+        later = datetime(2024, 9, 25, 6, 30)
+        assert 'monthly_dues' in jobs.run_scheduler(later)
+        assert 'monthly_dues' not in jobs.run_scheduler(later)  # another worker, same tick
+        assert Job.query.filter_by(name='generate_dues').count() == 1
+        assert db.session.get(JobSchedule, 'monthly_dues').next_run_at == datetime(2024, 10, 25, 6, 0)
+
+
+if __name__ == '__main__':
+    test_workers_claim_the_most_urgent_job_once()
+    test_expired_lease_is_claimed_again()
+    test_failed_job_is_retried_with_backoff()
+    test_job_fails_after_its_last_attempt()
+    test_next_run_of_a_cron_expression()
+    test_scheduler_enqueues_each_entry_once()
+    print("SUCCESS: jobs are claimed, retried and scheduled once")
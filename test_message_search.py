@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Message history search: only the caller's conversations, filtered and paged"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import search
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def setup():
+    """An admin writing to two students, returns (admin, amine, sara) ids"""
+    from school_project import db
+    from school_project.models import Message, User
+    users = [User(email=f'{name}@efet.ma', name=name, role=role, status='approved')
+             for name, role in (('Admin', 'admin'), ('Amine', 'student'), ('Sara', 'student'))]
+    db.session.add_all(users)
+    db.session.flush()
+    admin, amine, sara = (user.id for user in users)
+    db.session.add_all([
+        Message(msg_from=admin, msg_to=amine, content='Examen de mathématiques lundi', date_sent=datetime(2024, 10, 1, 9), priority='urgent'),
+        Message(msg_from=amine, msg_to=admin, content='Merci pour l\'examen', date_sent=datetime(2024, 10, 2, 9)),
+        Message(msg_from=admin, msg_to=sara, content='Examen de rattrapage', date_sent=datetime(2024, 10, 3, 9)),
+    ])
+    db.session.commit()
+    return admin, amine, sara
+
+def contents(rows):
+    return sorted(row.content for row in rows)
+
+def test_search_in_the_callers_conversations():
+    app = make_app()
+    with app.app_context():
+        admin, amine, sara = setup()
+        rows, has_more = search.search_messages(amine, 'exam')
+        assert contents(rows) == ['Examen de mathématiques lundi', 'Merci pour l\'examen']
+        assert not has_more
+        assert contents(search.search_messages(sara, 'exam')[0]) == ['Examen de rattrapage']
+        assert len(search.search_messages(admin, 'exam')[0]) == 3
+        row = search.search_messages(amine, 'lundi')[0][0]
+        assert (row.msg_from, row.msg_to, row.priority) == ('Admin', 'Amine', 'urgent')
+        assert row.date_sent == datetime(2024, 10, 1, 9)  # a datetime, not SQLite's text
+
+def test_filters_and_pages():
+    app = make_app()
+    with app.app_context():
+        admin, amine, _ = setup()
+        assert contents(search.search_messages(admin, 'exam', priority='urgent')[0]) == ['Examen de mathématiques lundi']
+        assert search.search_messages(admin, 'exam', priority='unknown') == ([], False)
+        assert contents(search.search_messages(admin, 'exam', date_from=datetime(2024, 10, 2), date_to=datetime(2024, 10, 3))[0]) \
+            == ['Merci pour l\'examen']
+        first, has_more = search.search_messages(admin, 'exam', page=1, per_page=2)
+        second, last = search.search_messages(admin, 'exam', page=2, per_page=2)
+        assert (len(first), has_more, len(second), last) == (2, True, 1, False)
+        assert {row.mid for row in first}.isdisjoint(row.mid for row in second)
+
+def test_marking_as_read_keeps_the_index_in_sync():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        from school_project.models import Message
+        _, amine, _ = setup()
+        Message.query.filter_by(msg_to=amine).update({'is_read': True})
+        db.session.commit()
+        assert contents(search.search_messages(amine, 'exam', is_read=True)[0]) == ['Examen de mathématiques lundi']
+        db.session.execute(db.text("INSERT INTO message_fts(message_fts) VALUES ('integrity-check')"))
+
+
+if __name__ == '__main__':
+    test_search_in_the_callers_conversations()
+    test_filters_and_pages()
+    test_marking_as_read_keeps_the_index_in_sync()
+    print("SUCCESS: message search stays within the caller's conversations")
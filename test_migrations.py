@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""The ordered migrations bring a database of the first release up to models.py"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from werkzeug.security import generate_password_hash
+
+# the tables of the first release that the migrations rewrite, as create_all made them
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER NOT NULL, email VARCHAR(100), password VARCHAR(100), name VARCHAR(1000),
+    role VARCHAR(1000), status VARCHAR(100), age INTEGER, address VARCHAR(1000),
+    registration VARCHAR(1000), gender VARCHAR(1000), profile_picture VARCHAR(1000),
+    about_me VARCHAR(1000), phone VARCHAR(100), major VARCHAR(100), register_date DATE,
+    year INTEGER, PRIMARY KEY (id), UNIQUE (email)
+);
+CREATE TABLE major (
+    id INTEGER NOT NULL, major_name VARCHAR(100), duration FLOAT, PRIMARY KEY (id)
+);
+CREATE TABLE payment (
+    id INTEGER NOT NULL, student_id INTEGER, month_paid DATE, payment_date DATE,
+    amount FLOAT, status VARCHAR(1000), type VARCHAR(1000), PRIMARY KEY (id)
+);
+CREATE TABLE absence (
+    id INTEGER NOT NULL, student_id INTEGER, date_absence DATETIME, justified VARCHAR(10),
+    details VARCHAR(1000), PRIMARY KEY (id)
+);
+CREATE TABLE email_log (
+    id INTEGER NOT NULL, recipient_id INTEGER NOT NULL, sender_id INTEGER NOT NULL,
+    subject VARCHAR(200), message TEXT, sent_at DATETIME, status VARCHAR(50),
+    PRIMARY KEY (id),
+    FOREIGN KEY(recipient_id) REFERENCES user (id), FOREIGN KEY(sender_id) REFERENCES user (id)
+);
+'''
+
+
+def baseline_app():
+    """App on a temporary database of the first release: a major, its student
+    (text role and status) with an unjustified absence, and an admin who emailed them"""
+    path = os.path.join(tempfile.mkdtemp(), 'db.sqlite')
+    password = generate_password_hash('pw', method='pbkdf2:sha256')
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO major (id, major_name, duration) VALUES (1, 'Informatique', 2)")
+    conn.execute("INSERT INTO user (id, email, password, name, role, status, major) "
+                 "VALUES (1, 'eleve@efet.ma', ?, 'Eleve', 'student', 'approved', 'Informatique')", (password,))
+    conn.execute("INSERT INTO user (id, email, password, name, role, status) "
+                 "VALUES (2, 'admin@efet.ma', ?, 'Admin', 'Admin', 'approved')", (password,))
+    conn.execute("INSERT INTO absence (student_id, date_absence, justified) VALUES (1, '2024-09-10 08:00:00', 'no')")
+    conn.execute("INSERT INTO payment (student_id, month_paid, amount, status, type) VALUES (1, '2024-09-01', 500, 'pending', 'fees')")
+    conn.execute("INSERT INTO email_log (recipient_id, sender_id, subject, status) VALUES (1, 2, 'Bienvenue', 'sent')")
+    conn.commit()
+    conn.close()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['JOBS_INPROCESS_THREADS'] = '0'
+    from school_project import create_app
+    return create_app(), path
+
+def test_run_applies_every_step_in_order():
+    from school_project import migrations
+    app, path = baseline_app()
+    assert migrations.run(app, log=lambda message: None) == [step for step, _ in migrations.STEPS]
+
+    conn = sqlite3.connect(path)
+    # enums
+    assert conn.execute('SELECT role, status FROM user WHERE id = 1').fetchone() == (1, 2)
+    assert conn.execute('SELECT role FROM user WHERE id = 2').fetchone() == (3,)
+    # majors, their count recomputed after the role codes
+    assert conn.execute('SELECT major_id FROM user WHERE id = 1').fetchone() == (1,)
+    assert conn.execute('SELECT student_count FROM major WHERE id = 1').fetchone() == (1,)
+    # attendance read the converted justified codes
+    assert conn.execute('SELECT COUNT(*) FROM attendance_bitmap WHERE student_id = 1').fetchone() == (1,)
+    # dues
+    indexes = [row[1] for row in conn.execute('PRAGMA index_list(payment)')]
+    assert 'ux_payment_dues' in indexes
+    # email_sender: the log of a deleted sender is kept
+    sender = [column for column in conn.execute('PRAGMA table_info(email_log)') if column[1] == 'sender_id'][0]
+    assert sender[3] == 0  # notnull
+    conn.close()
+
+def test_second_run_applies_nothing():
+    from school_project import migrations
+    app, _ = baseline_app()
+    migrations.run(app, log=lambda message: None)
+    assert migrations.run(app, log=lambda message: None) == []
+    with app.app_context():
+        assert migrations.pending() == []
+
+def test_login_works_after_migrating():
+    from school_project import migrations
+    app, _ = baseline_app()
+    migrations.run(app, log=lambda message: None)
+    with app.test_client() as client:
+        response = client.post('/login', data={'email': 'eleve@efet.ma', 'password': 'pw'})
+    assert response.status_code == 302
+    assert '/login' not in response.location and '/signup' not in response.location
+
+
+if __name__ == '__main__':
+    test_run_applies_every_step_in_order()
+    test_second_run_applies_nothing()
+    test_login_works_after_migrating()
+    print("SUCCESS: the migrations run in order, once")
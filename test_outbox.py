@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Outbox rows are leased by one dispatcher at a time and retried with backoff"""
+
+import sys
+import os
+import smtplib
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import outbox
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+class FakeSMTP:
+    """Records the messages, fails the first `failures` sends with `error`"""
+    def __init__(self, failures=0, error=smtplib.SMTPServerDisconnected('connection lost')):
+        self.failures = failures
+        self.error = error
+        self.sent = []
+
+    def send_message(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.sent.append(message['To'])
+
+    def quit(self):
+        pass
+
+def dispatcher(app, smtp):
+    worker = outbox.OutboxDispatcher(app)
+    worker.connect = lambda: smtp
+    return worker
+
+def enqueue(count):
+    """`count` emails from an admin to a student, returns their ids"""
+    from school_project import db
+    from school_project.models import User
+    admin = User(email='admin@efet.ma', name='Admin', role='admin', status='approved')
+    student = User(email='eleve@efet.ma', name='Eleve', role='student', status='approved')
+    db.session.add_all([admin, student])
+    db.session.flush()
+    emails = [outbox.enqueue_email(student.id, admin.id, f'Sujet {n}', 'Bonjour') for n in range(count)]
+    db.session.commit()
+    return [email.id for email in emails]
+
+def email(email_id):
+    from school_project import db
+    from school_project.models import EmailLog
+    db.session.expire_all()
+    return db.session.get(EmailLog, email_id)
+
+def test_two_dispatchers_never_claim_the_same_rows():
+    app = make_app(OUTBOX_BATCH_SIZE='2')
+    with app.app_context():
+        ids = enqueue(3)
+        first = [email.id for email, _ in dispatcher(app, FakeSMTP()).claim_batch()]
+        second = [email.id for email, _ in dispatcher(app, FakeSMTP()).claim_batch()]
+        assert first == ids[:2]
+        assert second == ids[2:]
+        assert dispatcher(app, FakeSMTP()).claim_batch() == []
+
+def test_expired_lease_is_claimed_again():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        [email_id] = enqueue(1)
+        crashed = dispatcher(app, FakeSMTP())
+        crashed.claim_batch()
+        assert dispatcher(app, FakeSMTP()).claim_batch() == []  # still leased
+        email(email_id).next_attempt_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        smtp = FakeSMTP()
+        assert dispatcher(app, smtp).dispatch_batch() == 1
+        assert smtp.sent == ['eleve@efet.ma']
+        assert email(email_id).status == 'sent'
+
+def test_failed_delivery_is_retried_with_backoff():
+    app = make_app(OUTBOX_BACKOFF='30')
+    with app.app_context():
+        from school_project import db
+        [email_id] = enqueue(1)
+        assert dispatcher(app, FakeSMTP(failures=1)).dispatch_batch() == 1
+        failed = email(email_id)
+        assert (failed.status, failed.attempts, failed.last_error) == ('pending', 1, 'connection lost')
+        assert failed.next_attempt_at > datetime.now() + timedelta(seconds=25)
+        assert dispatcher(app, FakeSMTP()).dispatch_batch() == 0  # not due yet
+
+        failed.next_attempt_at = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+        assert dispatcher(app, FakeSMTP()).dispatch_batch() == 1
+        sent = email(email_id)
+        assert (sent.status, sent.attempts, sent.next_attempt_at) == ('sent', 2, None)
+
+def test_delivery_fails_after_the_last_attempt():
+    app = make_app(OUTBOX_MAX_ATTEMPTS='2', OUTBOX_BACKOFF='0')
+    with app.app_context():
+        [email_id] = enqueue(1)
+        smtp = FakeSMTP(failures=2)
+        dispatcher(app, smtp).dispatch_batch()
+        dispatcher(app, smtp).dispatch_batch()
+        failed = email(email_id)
+        assert (failed.status, failed.attempts, failed.next_attempt_at) == ('failed', 2, None)
+
+def test_refused_recipient_is_not_retried():
+    app = make_app()
+    with app.app_context():
+        [email_id] = enqueue(1)
+        refused = smtplib.SMTPRecipientsRefused({'eleve@efet.ma': (550, b'unknown user')})
+        dispatcher(app, FakeSMTP(failures=1, error=refused)).dispatch_batch()
+        assert (email(email_id).status, email(email_id).attempts) == ('failed', 1)
+
+
+if __name__ == '__main__':
+    test_two_dispatchers_never_claim_the_same_rows()
+    test_expired_lease_is_claimed_again()
+    test_failed_delivery_is_retried_with_backoff()
+    test_delivery_fails_after_the_last_attempt()
+    test_refused_recipient_is_not_retried()
+    print("SUCCESS: the outbox leases and retries its emails")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Bulk approval and rejection settle pending signups once, counts and caches included"""
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import cache, registrations
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def setup():
+    """An admin, the Informatique major and three signups asking for it, returns their ids"""
+    from school_project import db
+    from school_project.models import Major, User
+    db.session.add(Major(major_name='Informatique', duration=2))
+    admin = User(email='admin@efet.ma', name='Admin', role='admin', status='approved')
+    db.session.add(admin)
+    db.session.commit()
+    signups = [registrations.register(f'eleve{n}@efet.ma', f'Eleve {n}', 'hash', major='Informatique')[0]
+               for n in range(3)]
+    return admin.id, signups
+
+def test_approve_in_bulk():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        from school_project.models import AdminNotification, Major, User
+        admin_id, (first, second, third) = setup()
+        registrations.resolve(registrations.REJECTED, admin_id, user_ids=[third])
+        cache.load_user(first)
+        db.session.remove()
+
+        results = registrations.resolve(registrations.APPROVED, admin_id, user_ids=[first, second, third, 999], role='student')
+        assert [result['result'] for result in results] == ['approved', 'approved', 'skipped', 'not_found']
+        assert results[2]['status'] == 'rejected'
+        assert registrations.counts(results) == {'approved': 2, 'skipped': 1, 'not_found': 1}
+
+        assert [(user.role, user.status) for user in User.query.filter(User.id.in_([first, second])).order_by(User.id)] \
+            == [('student', 'approved')] * 2
+        assert db.session.get(User, third).status == 'rejected'
+        assert Major.query.filter_by(major_name='Informatique').one().student_count == 2
+        assert AdminNotification.query.filter_by(is_read=False).count() == 0
+        assert {notification.resolved_by for notification in AdminNotification.query} == {admin_id}
+        # the cached user loaded before the bulk UPDATE is gone
+        assert cache.namespace('users').get(first) is None
+        assert cache.load_user(first).status == 'approved'
+
+def test_reject_a_whole_major():
+    app = make_app()
+    with app.app_context():
+        from school_project.models import Major, User
+        admin_id, signups = setup()
+        results = registrations.resolve(registrations.REJECTED, admin_id, major='Informatique')
+        assert [result['id'] for result in results] == signups
+        assert {user.status for user in User.query.filter(User.id.in_(signups))} == {'rejected'}
+        assert {user.role for user in User.query.filter(User.id.in_(signups))} == {'visiteur'}
+        assert Major.query.filter_by(major_name='Informatique').one().student_count == 0
+        # a second run finds nobody pending
+        assert registrations.resolve(registrations.REJECTED, admin_id, major='Informatique') == []
+
+def test_invalid_requests_are_refused():
+    app = make_app()
+    with app.app_context():
+        admin_id, signups = setup()
+        for kwargs in ({'decision': registrations.APPROVED, 'user_ids': signups, 'role': 'admin'},
+                       {'decision': 'maybe', 'user_ids': signups},
+                       {'decision': registrations.REJECTED},
+                       {'decision': registrations.REJECTED, 'user_ids': ['abc']}):
+            try:
+                registrations.resolve(resolved_by=admin_id, **kwargs)
+            except registrations.RegistrationError:
+                pass
+            else:
+                raise AssertionError(f'accepted {kwargs}')
+
+
+if __name__ == '__main__':
+    test_approve_in_bulk()
+    test_reject_a_whole_major()
+    test_invalid_requests_are_refused()
+    print("SUCCESS: registrations are approved and rejected in bulk")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""A roll call replaces a session's absences as a whole, or is refused as a whole"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import attendance
+
+SESSION = '2024-09-10T08:00'  # a Tuesday
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def setup():
+    """Two students of Informatique and one of Gestion, returns their ids"""
+    from school_project import db
+    from school_project.models import Major, User
+    db.session.add_all([Major(major_name='Informatique', duration=2), Major(major_name='Gestion', duration=2)])
+    students = [User(email=f'{name}@efet.ma', name=name, role='student', status='approved', major=major)
+                for name, major in (('Amine', 'Informatique'), ('Sara', 'Informatique'), ('Youssef', 'Gestion'))]
+    db.session.add_all(students)
+    db.session.commit()
+    return [student.id for student in students]
+
+def unjustified_days(student_id, day):
+    from school_project.models import AttendanceBitmap
+    term, start, _ = attendance.term_of(day)
+    bitmap = AttendanceBitmap.query.filter_by(student_id=student_id, term=term).first()
+    return attendance.to_int(bitmap.unjustified if bitmap else None) >> (day.date() - start).days & 1
+
+def test_roll_call_replaces_the_session():
+    app = make_app()
+    with app.app_context():
+        from school_project.models import Absence
+        amine, sara, _ = setup()
+        summary = attendance.roll_call('Informatique', SESSION, [
+            {'student_id': amine}, {'student_id': str(sara), 'justified': 'Yes', 'details': ' certificat '}])
+        assert summary == {'session': SESSION, 'students': 2, 'absent': 2, 'removed': 0}
+        assert Absence.query.filter_by(student_id=sara).one().details == 'certificat'
+        day = datetime.strptime(SESSION, attendance.SESSION_FORMAT)
+        assert unjustified_days(amine, day) and not unjustified_days(sara, day)
+
+        # Amine arrived late: the second roll call replaces the first one
+        summary = attendance.roll_call('Informatique', SESSION, [{'student_id': sara, 'justified': 'yes'}])
+        assert (summary['absent'], summary['removed']) == (1, 2)
+        assert [absence.student_id for absence in Absence.query] == [sara]
+        assert not unjustified_days(amine, day)
+
+def test_invalid_roll_call_writes_nothing():
+    app = make_app()
+    with app.app_context():
+        from school_project.models import Absence
+        amine, sara, youssef = setup()
+        try:
+            attendance.roll_call('Informatique', SESSION, [
+                {'student_id': amine}, {'student_id': amine}, {'student_id': youssef},
+                {'student_id': sara, 'justified': 'maybe'}, {'student_id': 'abc'}])
+        except attendance.RollCallError as e:
+            assert e.errors == [
+                f'Student {amine} is listed twice',
+                f'Student {youssef} is not in Informatique',
+                f'Invalid justified value for student {sara}: maybe',
+                "Invalid student id: {'student_id': 'abc'}",
+            ]
+        else:
+            raise AssertionError('the roll call was accepted')
+        assert Absence.query.count() == 0
+
+def test_unknown_major_and_session_are_refused():
+    app = make_app()
+    with app.app_context():
+        setup()
+        try:
+            attendance.parse_roll_call('Chimie', '10/09/2024', [])
+        except attendance.RollCallError as e:
+            assert e.errors == ['Unknown major: Chimie', 'Invalid session: 10/09/2024']
+        else:
+            raise AssertionError('the roll call was accepted')
+
+
+if __name__ == '__main__':
+    test_roll_call_replaces_the_session()
+    test_invalid_roll_call_writes_nothing()
+    test_unknown_major_and_session_are_refused()
+    print("SUCCESS: roll calls are recorded or refused as a whole")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""User search: FTS5 prefix matches kept in sync by triggers, scoped to what a picker may show"""
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import search
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_users(*users):
+    """(name, role, status) tuples, returns {name: id}"""
+    from school_project import db
+    from school_project.models import User
+    rows = [User(email=f"{name.split()[0].lower()}@efet.ma", name=name, role=role, status=status, major='Informatique')
+            for name, role, status in users]
+    db.session.add_all(rows)
+    db.session.commit()
+    return {row.name: row.id for row in rows}
+
+def names(rows):
+    return sorted(row.name for row in rows)
+
+def check_index():
+    from school_project import db
+    db.session.execute(db.text("INSERT INTO user_fts(user_fts) VALUES ('integrity-check')"))
+
+def test_prefix_search():
+    app = make_app()
+    with app.app_context():
+        assert search.ensure_search_indexes() == 'fts5'
+        add_users(('Amine Alaoui', 'student', 'approved'), ('Amina Bennani', 'teacher', 'approved'),
+                  ('Sara Idrissi', 'student', 'approved'))
+        assert names(search.search_users('ami')) == ['Amina Bennani', 'Amine Alaoui']
+        assert names(search.search_users('ami ala')) == ['Amine Alaoui']
+        assert names(search.search_users('info', role='teacher')) == ['Amina Bennani']
+        assert names(search.search_users('sara@efet')) == ['Sara Idrissi']
+        assert search.search_users('ami', role='nobody') == []
+        assert search.search_users('  ') == []
+
+def test_picker_scope_hides_pending_users_and_admins():
+    app = make_app()
+    with app.app_context():
+        add_users(('Amine Alaoui', 'student', 'approved'), ('Amina Pending', 'visiteur', 'pending'),
+                  ('Amir Owner', 'owner', 'approved'), ('Amal Admin', 'admin', 'approved'))
+        scope = ('student', 'teacher', 'admin')
+        assert names(search.search_users('am', roles=scope)) == ['Amal Admin', 'Amine Alaoui']
+        assert search.search_users('amir', role='owner', roles=scope) == []
+        assert len(search.search_users('am')) == 4
+
+def test_triggers_follow_inserts_updates_and_deletes():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        from school_project.models import User
+        search.ensure_search_indexes()
+        ids = add_users(('Amine Alaoui', 'student', 'pending'))
+        amine = db.session.get(User, ids['Amine Alaoui'])
+        amine.name = 'Karim Idrissi'
+        db.session.commit()
+        assert search.search_users('alaoui') == []
+        assert names(search.search_users('karim')) == ['Karim Idrissi']
+        amine.status = 'approved'  # not an indexed column
+        db.session.commit()
+        check_index()
+        db.session.delete(amine)
+        db.session.commit()
+        assert search.search_users('karim') == []
+        check_index()
+
+def test_update_trigger_is_limited_to_the_indexed_columns():
+    app = make_app()
+    with app.app_context():
+        from school_project import db
+        search.ensure_search_indexes()
+        trigger = "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'user_fts_au'"
+        assert 'AFTER UPDATE OF name, email, registration, phone, major ON' in db.session.execute(db.text(trigger)).scalar()
+
+        # a database indexed by the first version: the trigger fired on every UPDATE
+        with db.engine.begin() as conn:
+            conn.execute(db.text('DROP TRIGGER user_fts_au'))
+            conn.execute(db.text(
+                "CREATE TRIGGER user_fts_au AFTER UPDATE ON user BEGIN "
+                "INSERT INTO user_fts(user_fts, rowid, name, email, registration, phone, major) "
+                "VALUES ('delete', old.id, old.name, old.email, old.registration, old.phone, old.major); "
+                "INSERT INTO user_fts(rowid, name, email, registration, phone, major) "
+                "VALUES (new.id, new.name, new.email, new.registration, new.phone, new.major); END"))
+        search._index_ready.clear()
+        search.ensure_search_indexes()
+        assert ' UPDATE OF ' in db.session.execute(db.text(trigger)).scalar()
+
+
+if __name__ == '__main__':
+    test_prefix_search()
+    test_picker_scope_hides_pending_users_and_admins()
+    test_triggers_follow_inserts_updates_and_deletes()
+    test_update_trigger_is_limited_to_the_indexed_columns()
+    print("SUCCESS: user search follows the user table")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Signup bursts: one account per email and registration numbers that never repeat"""
+
+import sys
+import os
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import registrations, sequences
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app, db
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    with app.app_context():
+        db.create_all()
+    return app
+
+def in_threads(app, count, target):
+    results = [None] * count
+    def run(number):
+        with app.app_context():
+            results[number] = target(number)
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_blocks_are_reserved_once_per_process():
+    app = make_app(SEQUENCE_BLOCK_SIZE='5')
+    with app.app_context():
+        values = [sequences.next_value('test') for _ in range(7)]
+        assert values == [1, 2, 3, 4, 5, 6, 7]
+        sequences._blocks.clear()  # a restarted process: the rest of its block is never used
+        assert sequences.next_value('test') == 11
+        assert sequences.reserve('test', 5) == 16  # another process
+
+def test_concurrent_signups_get_distinct_numbers():
+    app = make_app(SEQUENCE_BLOCK_SIZE='3')
+    results = in_threads(app, 10, lambda number: registrations.register(f'eleve{number}@efet.ma', 'Eleve', 'hash'))
+    assert None not in results
+    with app.app_context():
+        from school_project.models import AdminNotification, User
+        numbers = [user.registration for user in User.query]
+        assert len(numbers) == len(set(numbers)) == 10
+        assert all(number.startswith('USER_') for number in numbers)
+        assert AdminNotification.query.count() == 10
+
+def test_same_email_signing_up_twice_at_once():
+    app = make_app()
+    results = in_threads(app, 5, lambda number: registrations.register('eleve@efet.ma', f'Eleve {number}', 'hash'))
+    assert len([result for result in results if result is not None]) == 1
+    with app.app_context():
+        from school_project.models import AdminNotification, User
+        assert User.query.count() == 1
+        assert AdminNotification.query.count() == 1  # nothing left behind by the losers
+
+
+if __name__ == '__main__':
+    test_blocks_are_reserved_once_per_process()
+    test_concurrent_signups_get_distinct_numbers()
+    test_same_email_signing_up_twice_at_once()
+    print("SUCCESS: signup bursts create one account per email with unique numbers")
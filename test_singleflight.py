@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""One computation per key across threads and workers, stale values served meanwhile"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'Efet_school_project'))
+
+from school_project import cache, singleflight
+
+
+def make_app(**environ):
+    """App on an empty temporary database, `environ` set while it is created"""
+    directory = tempfile.mkdtemp()
+    environ = {'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite')}",
+               'JOBS_INPROCESS_THREADS': '0', **environ}
+    saved = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+    try:
+        from school_project import create_app
+        app = create_app()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return app
+
+def in_threads(app, count, target):
+    results = []
+    def run():
+        with app.app_context():
+            results.append(target())
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_threads_of_a_process_compute_once():
+    app = make_app()
+    calls = []
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 42
+    singleflight.reset_stats()
+    assert in_threads(app, 5, lambda: singleflight.load('rates', 'info', compute, ttl=60)) == [42] * 5
+    assert len(calls) == 1
+    assert singleflight.stats()['rates']['computed'] == 1
+    assert singleflight.stats()['rates']['coalesced'] == 4
+
+def test_stale_value_is_served_while_recomputing():
+    app = make_app()
+    release = threading.Event()
+    def slow():
+        release.wait(5)
+        return 'new'
+    singleflight.reset_stats()
+    with app.app_context():
+        entries = cache.namespace('rates')
+        entries.set('info', singleflight.Entry('old', time.time() - 1), 60)
+    leader = threading.Thread(target=in_threads, args=(app, 1, lambda: singleflight.load('rates', 'info', slow, ttl=60)))
+    leader.start()
+    time.sleep(0.1)
+    with app.app_context():
+        started = time.monotonic()
+        assert singleflight.load('rates', 'info', slow, ttl=60) == 'old'
+        assert time.monotonic() - started < 1
+        release.set()
+        leader.join()
+        assert singleflight.load('rates', 'info', slow, ttl=60) == 'new'
+        # an invalidated entry is recomputed, never served stale
+        entries.delete('info')
+        assert singleflight.load('rates', 'info', lambda: 'recomputed', ttl=60) == 'recomputed'
+    assert singleflight.stats()['rates']['stale'] == 1
+
+def test_other_worker_holding_the_lock_is_waited_for():
+    app = make_app(CACHE_BACKEND='sqlite', CACHE_SQLITE_PATH=os.path.join(tempfile.mkdtemp(), 'cache.sqlite'))
+    singleflight.reset_stats()
+    with app.app_context():
+        entries = cache.namespace('rates')
+        assert entries.add('info:lock', 'other worker')
+    def other_worker():
+        time.sleep(0.2)
+        with app.app_context():
+            entries.set('info', singleflight.Entry('from the other worker', time.time() + 60), 60)
+            entries.delete('info:lock')
+    threading.Thread(target=other_worker).start()
+    with app.app_context():
+        value = singleflight.load('rates', 'info', lambda: 'computed here', ttl=60)
+    assert value == 'from the other worker'
+    assert singleflight.stats()['rates']['waited'] == 1
+    assert singleflight.stats()['rates']['computed'] == 0
+
+def test_waiting_gives_up_after_the_deadline():
+    app = make_app(SINGLEFLIGHT_WAIT='0.3')
+    singleflight.reset_stats()
+    with app.app_context():
+        cache.namespace('rates').add('info:lock', 'dead worker', ttl=60)
+        assert singleflight.load('rates', 'info', lambda: 'computed here', ttl=60) == 'computed here'
+    assert singleflight.stats()['rates']['timeouts'] == 1
+
+
+if __name__ == '__main__':
+    test_threads_of_a_process_compute_once()
+    test_stale_value_is_served_while_recomputing()
+    test_other_worker_holding_the_lock_is_waited_for()
+    test_waiting_gives_up_after_the_deadline()
+    print("SUCCESS: single-flight loading computes each key once")